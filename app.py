@@ -1,35 +1,66 @@
-from PIL.Image import fromqimage
 from PyQt5.Qt import *
 from PyQt5 import QtGui, QtCore
-import PIL.ImageEnhance
 import utils
 from main_ui import UiMain
 from widget.file_dialog import FileDialogPreview
 import os.path as osp
-import json
-import label_file
-from label_file import LabelFile
+from label_file import LabelFile, ImageDataCache, ImageDataEncoder
+from label_file import IMAGE_DATA_EXTERNAL, IMAGE_DATA_EMBEDDED_CACHED, IMAGE_DATA_EMBEDDED_DEDUPLICATED
+import loader
+import project
+import serializer
+from journal import EditJournal
 from canvas.items import Edge, GraphicItem, RectEdge
 from canvas import item_width, item_height
-import base64
+from canvas.tiled_item import TiledImageItem
+import logging
+import math
 import os
 
+logger = logging.getLogger("labelall")
+
+IMAGE_CACHE_BYTES = 1024 * 1024 * 1024  # 解码缓存的字节预算
+PREFETCH_RADIUS = 2  # 打开文件夹时，当前图片前后各预取的张数
+TILE_CACHE_BYTES = 256 * 1024 * 1024  # 瓦片缓存的字节预算
+JOURNAL_FLUSH_INTERVAL = 1000  # 修改日志批量写入磁盘的间隔（毫秒）
+
 
 class Window(QMainWindow, UiMain):
     """窗口类，对main_ui进行补充，也是连接不同控件的“桥梁”
 
     Attributes:
         action_label_list(list):存放四种标注图形的列表
-        file_num_old(int):记入滑动slider时的上一时刻UI上显示的图片在文件夹中的对应数字
+        file_num_old(int):上一次由滑动条或文件列表切换到的图片在文件夹中的序号
         filename(str):当前图片的绝对路径
         have_json(bool):当前图片是否有同名json的判断
         image(QImage):当前载入的图片的QImage格式
-        imageData(bytes):前载入的图片的编码格式
+        imageData(bytes):前载入的图片的编码格式（图片文件的原始字节）
         imagePath(str):当前图片的绝对路径或者同名json的绝对路径
-        item(QGraphicsPixmapItem):当前图片转化成的QGraphicsPixmapItem对象
-        labelFile(LabelFile): 储存json文件的信息的容器
+        image_width(int):当前图片的宽度（原图像素）
+        image_height(int):当前图片的高度（原图像素）
+        item(QGraphicsItem):当前图片转化成的QGraphicsPixmapItem对象，超大图片为TiledImageItem对象
+        labelFile(LabelFile): 储存json文件的信息的容器（当前图片没有json时为None），保存时从中读取内嵌的图片数据
+        loaded_image(LoadedImage): 当前图片的解码结果，image引用其中的像素内存，需与image一同保留
+        image_cache(LRUCache): 已解码图片与已解析json的缓存，键为图片路径
+        prefetcher(Prefetcher): 在后台预先解码文件列表中当前图片前后若干张图片
+        async_loader(AsyncLoader): 在工作线程中加载图片与json，只显示最新一次请求的结果
+        placeholder(QGraphicsItem): 图片加载完成之前在scene中显示的占位（缩略图或灰色的框）
+        tile_loader(TileLoader): 超大图片按需解码瓦片的加载器
+        full_loader(FullResolutionLoader): 当前显示代理图时，放大后在后台解码原始分辨率的加载器
+        thumbnails(ThumbnailService): 缩略图服务，文件对话框预览、文件列表和加载时的占位共用
         pic_type(bool):
         pix(QPixmap): 当前图片转化成的QPixmap对象
+        adjusted_array(np.ndarray): 图像调整后正在显示的像素，显示原图时为None
+        image_adjuster(ImageAdjuster): 在工作线程中执行图像调整流水线
+        image_data_policy(str): 从图片打开的文档保存json时图片数据的默认处理方式
+        image_data_cache(ImageDataCache): 各文档共用的图片base64缓存
+        image_data_encoder(ImageDataEncoder): 当前文档保存json时生成imagePath与imageData
+        saves(SaveService): 在工作线程中编码并原子地写入json，保存期间可以继续标注
+        journal(EditJournal): 当前文档的修改日志，记录尚未保存的修改
+        journal_timer(QTimer): 定时把修改日志的缓冲区写入磁盘
+        project_indexer(ProjectIndexer): 打开的文件夹的标注索引，文件列表的搜索框查询它
+        folder_scanner(FolderScanner): 在后台遍历打开的文件夹（再次打开时先显示缓存的列表），结果显示在文件列表中
+        folder_watcher(FolderWatcher): 监视打开的文件夹与当前图片的标注文件，变化后增量地更新文件列表
         view_scale(float):控制当前GraphicView的缩放比例
 
     """
@@ -44,6 +75,33 @@ class Window(QMainWindow, UiMain):
         self.imageData = None
         self.imagePath = None
         self.image = None
+        self.loaded_image = None
+        self.image_cache = loader.LRUCache(IMAGE_CACHE_BYTES)
+        self.prefetcher = loader.Prefetcher(self.image_cache, PREFETCH_RADIUS, parent=self)
+        self.async_loader = loader.AsyncLoader(self.image_cache, parent=self)
+        self.tile_loader = loader.TileLoader(loader.LRUCache(TILE_CACHE_BYTES), parent=self)
+        self.full_loader = loader.FullResolutionLoader(parent=self)
+        self.thumbnails = loader.ThumbnailService(parent=self)
+        self.image_adjuster = loader.ImageAdjuster(parent=self)
+        self.image_data_policy = IMAGE_DATA_EMBEDDED_CACHED
+        self.image_data_cache = ImageDataCache()
+        self.image_data_encoder = None
+        self.saves = loader.SaveService(parent=self)
+        self.journal = None
+        self.journal_timer = QTimer(self)
+        self.journal_timer.setSingleShot(True)
+        self.journal_timer.setInterval(JOURNAL_FLUSH_INTERVAL)
+        self.fileWidget.setThumbnailService(self.thumbnails)
+        self.horizontalSlider.setFileList(self.fileWidget.model, self.thumbnails)
+        self.project_indexer = project.ProjectIndexer(parent=self)
+        self.fileWidget.setProjectIndexer(self.project_indexer)
+        self.folder_scanner = project.FolderScanner(parent=self)
+        self.fileWidget.setFolderScanner(self.folder_scanner)
+        self.folder_watcher = project.FolderWatcher(self.saves, parent=self)
+        self.image_width = 0
+        self.image_height = 0
+        self.placeholder = None
+        self.adjusted_array = None
         self.action_label_list = [self.action_label_point,
                                   self.action_label_line,
                                   self.action_label_rect,
@@ -59,8 +117,9 @@ class Window(QMainWindow, UiMain):
         path = osp.dirname(str(self.filename)) if self.filename else "."
         formats = ["*.{}".format(fmt.data().decode()) for fmt in
                    QtGui.QImageReader.supportedImageFormats()]  # 使得所有的图片格式都支持？
-        filters = self.tr("Image & Label files (%s)") % " ".join(formats + ["*%s" % ".json"])
-        fileDialog = FileDialogPreview(self)
+        filters = self.tr("Image & Label files (%s)") % " ".join(
+            formats + ["*%s" % LabelFile.suffix, "*%s" % LabelFile.binary_suffix])
+        fileDialog = FileDialogPreview(self, thumbnails=self.thumbnails)
         fileDialog.setFileMode(FileDialogPreview.ExistingFile)
         fileDialog.setNameFilter(filters)
         fileDialog.setWindowTitle(self.tr("%s - Choose Image or Label file") % "labelall", )
@@ -73,61 +132,110 @@ class Window(QMainWindow, UiMain):
             #              E:/pythonProject3/qt5manager-master/result.json
             if fileName:
                 self.loadFile(fileName)
-        self.file_suffix()
+        fileDialog.deleteLater()
 
     def openDir(self):
-        """打开一个图片文件夹
+        """打开一个图片文件夹，在后台遍历，找到的图片分批加入文件列表
 
         """
         cur_dir = QDir.currentPath()  # 获取当前文件夹路径
         # 选择文件夹
         dir_path = QFileDialog.getExistingDirectory(self, '打开文件夹', cur_dir)
-        # 读取文件夹文件
-        file_paths = []
-        if dir_path != '':
-            self.fileWidget.deleteAllRow()
-        for root, dirs, files in os.walk(dir_path, topdown=False):
-            for file in files:
-                format = '*' + os.path.splitext(file)[-1]
-                if format in ["*.{}".format(fmt.data().decode()) for fmt in
-                              QtGui.QImageReader.supportedImageFormats()]:
-                    file_paths.append(os.path.join(root, file))
-        print('file_paths')
-        print(file_paths)
-        if len(file_paths) <= 0:
+        if dir_path == '':
+            return
+        self.prefetcher.cancel()
+        self.project_indexer.close()
+        self.folder_watcher.setDirectories([])
+        self.fileWidget.deleteAllRow()
+        self.folder_scanner.scan(dir_path)
+        self.statusbar.showMessage("正在扫描文件夹：%s" % dir_path)
+
+    def folderScanBatch(self, file_paths):
+        """
+        在状态栏显示遍历文件夹的进度（新找到的图片由文件列表自己加入）
+
+        Args:
+            file_paths(list): 新找到的图片的绝对路径
+
+        """
+        self.statusbar.showMessage("正在扫描文件夹：已找到%d张图片" % len(self.fileWidget.filepath_list))
+
+    def folderScanned(self, dir_path, count):
+        """
+        文件夹遍历完成后在后台建立标注索引
+
+        Args:
+            dir_path(str): 文件夹路径
+            count(int): 找到的图片数
+
+        """
+        self.statusbar.showMessage("扫描完成：%d张图片" % count, 3000)
+        if count > 0:
+            self.project_indexer.openFolder(dir_path, self.fileWidget.filepath_list)
+
+    def folderChanged(self, removed, inserted, updated):
+        """
+        打开的文件夹在打开期间变化后（文件列表已由FileDockWidget更新），增量地更新标注索引
+
+        Args:
+            removed(list): 已经删除的图片
+            inserted(list): 新的图片[(路径, 前面一张图片的路径)]
+            updated(list): 图片或标注文件被修改过的图片
+
+        """
+        self.project_indexer.updateImages([path for path, before in inserted] + list(updated), removed)
+        self.statusbar.showMessage("文件夹已更新：新增%d张，删除%d张，修改%d张图片" % (
+            len(inserted), len(removed), len(updated)), 3000)
+
+    def labelFileChanged(self, label_path):
+        """
+        当前图片的标注文件在磁盘上被其它程序修改后，询问是否重新加载（只重新加载这一张图片）
+
+        Args:
+            label_path(str): 标注文件的路径
+
+        """
+        if self.filename is None:
             return
-        # 获取第一个文件
-        for cur_path in file_paths:
-            self.fileWidget.addRow(cur_path)
+        text = '标注文件已在磁盘上被修改：\n%s\n是否重新加载？' % label_path
+        unsaved = self.journal is not None and (self.journal.pending() or osp.exists(self.journal.path))
+        if unsaved:
+            text += '\n当前未保存的修改将被丢弃。'
+        reply = QMessageBox.question(self, '标注文件已修改', text, QMessageBox.Yes, QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            if self.journal is not None:
+                # 日志建立在旧的json之上，不能重放到新的json上
+                self.journal.discard()
+            self.loadFile(self.filename)
 
     def changeFile(self):
         """
-        文件栏改变选择后，重新加载图片
+        文件栏改变选择后，重新加载图片，并把滑动条移到这张图片
 
         """
+        self.file_num_old = self.fileWidget.change_num
+        self.horizontalSlider.setCurrentFile(self.fileWidget.change_num)
         self.loadFile(self.fileWidget.change_file)
 
-    def sliderChangeFile(self):
+    def sliderChangeFile(self, filenum):
         """
-        通过下方滑动条移动的位置（对应的数值），进行对相应图片的加载
+        滑动条拖动停下或松开后，加载对应的图片（拖动过程中只显示预览）
+
+        Args:
+            filenum(int): 图片在文件列表中的序号
 
         """
-        try:
-            filenum = int(self.fileWidget.table.rowCount() * self.horizontalSlider.nowratio / 1000)
-            if filenum == self.file_num_old:
-                return
-            self.fileWidget.sliderchange(filenum)
-            self.file_num_old = filenum
-        except:
-            pass
+        if filenum == self.file_num_old or filenum >= len(self.fileWidget.filepath_list):
+            return
+        self.fileWidget.sliderchange(filenum)
+        self.file_num_old = filenum
 
     def file_suffix(self):
         """
 
 
         """
-        portion = os.path.splitext(str(self.filename))
-        if portion[1] == '.json':
+        if LabelFile.is_label_file(str(self.filename)):
             self.pic_type = False
         else:
             self.pic_type = True
@@ -140,50 +248,255 @@ class Window(QMainWindow, UiMain):
             filename(str):图片的绝对路径
 
         """
+        # 预取命中时直接显示缓存中的解码结果，否则先显示占位框，在工作线程中解码和解析
+        result = self.prefetcher.take(filename)
+        if result is not None:
+            self.async_loader.cancel()
+            self.showDocument(result)
+        else:
+            size = self.showPlaceholder(filename)
+            tiled = size is not None and size[0] * size[1] >= loader.TILED_IMAGE_PIXELS
+            self.async_loader.request(filename, tiled, self.fitSize())
+
+    def showPlaceholder(self, filename):
+        """
+        在图片加载完成之前，按文件头中的尺寸显示占位（缩略图或灰色的框），并暂时禁用标注与保存相关的按钮
+
+        Args:
+            filename(str): 正在加载的图片的绝对路径
+
+        Returns:
+            tuple: 从文件头读到的图片尺寸(宽, 高)，不是图片文件时为None
+
+        """
+        # 之前的文档不再显示，不能再往它的修改日志中记录，也不能把空的场景保存到它的json上
+        self.flushJournal()
         self.clearAll()
+        self.full_loader.reset()
+        self.setInitEnable()
+        self.filename = None
+        self.labelFile = None
+        self.image_data_encoder = None
+        self.loaded_image = None
+        self.journal = None
+        self.folder_watcher.watchLabel(None)
+        size = utils.read_image_size(filename)
+        width, height = size if size is not None else (self.scene.width(), self.scene.height())
+        if width > 0 and height > 0:
+            # 磁盘上已有缩略图时用它拉伸到原图大小作为占位，否则画一个灰色的框
+            thumbnail = self.thumbnails.cached(filename) if size is not None else None
+            if thumbnail is not None:
+                self.placeholder = QGraphicsPixmapItem(thumbnail)
+                self.placeholder.setTransformationMode(Qt.SmoothTransformation)
+                self.placeholder.setTransform(QTransform.fromScale(width / thumbnail.width(),
+                                                                   height / thumbnail.height()))
+            else:
+                self.placeholder = QGraphicsRectItem(0, 0, width, height)
+                self.placeholder.setBrush(QColor(220, 220, 220))
+                self.placeholder.setPen(QPen(Qt.NoPen))
+            self.scene.addItem(self.placeholder)
+            self.scene.setSceneRect(0, 0, width, height)
+            self.fitView(width, height)
+        self.statusbar.showMessage("正在加载：%s" % osp.basename(filename))
+        return size
+
+    def documentLoaded(self, result):
+        """
+        工作线程加载完成（且仍是最新一次请求）后，在GUI线程中显示结果
+
+        Args:
+            result(LoadResult): 加载结果
 
+        """
+        self.statusbar.clearMessage()
+        self.showDocument(result)
+
+    def documentFailed(self, filename, message):
+        """
+        最新一次请求加载失败时提示用户
+
+        Args:
+            filename(str): 加载失败的文件
+            message(str): 错误信息
+
+        """
+        self.statusbar.clearMessage()
+        # 占位时已经禁用，没有文档可以保存
+        self.actionSave.setEnabled(False)
+        self.actionSaveAs.setEnabled(False)
+        QMessageBox.warning(self, '加载失败', '%s\n%s' % (filename, message))
+
+    def prefetchAround(self, filename):
+        """
+        如果该图片来自文件列表，则在后台预取它前后的图片
+
+        Args:
+            filename(str): 刚显示的图片的绝对路径
+
+        """
+        if self.fileWidget.change_file == filename and self.fileWidget.change_num is not None:
+            self.prefetcher.prefetch(self.fileWidget.filepath_list, self.fileWidget.change_num,
+                                     self.fitSize())
+
+    def fitSize(self):
+        """
+        自适应窗口时的目标大小，JPEG图片先按这个大小解码代理图
+
+        Returns:
+            tuple: GraphicView的(宽, 高)
+
+        """
+        return self.graphicsView.size().width(), self.graphicsView.size().height()
+
+    def setItemPixmap(self, pix):
+        """
+        设置图片图元显示的pixmap；代理图比原图小，用图元的变换把它拉伸到原图大小，
+        再按exif方向摆正（像素本身不转置），因此scene坐标（即标注坐标）始终是摆正后原图的像素坐标
+
+        Args:
+            pix(QPixmap): 需要显示的图片（原图或代理图）
+
+        """
+        self.pix = pix
+        self.item.setPixmap(pix)
+        if pix.width() > 0 and pix.height() > 0:
+            orientation = self.loaded_image.orientation if self.loaded_image else 1
+            raw_width, raw_height = self.image_width, self.image_height
+            if loader.is_transposed(orientation):
+                raw_width, raw_height = raw_height, raw_width
+            # Qt中a * b表示先做a再做b：先拉伸到原图大小，再摆正
+            self.item.setTransform(QTransform.fromScale(raw_width / pix.width(), raw_height / pix.height()) *
+                                   loader.orientation_transform(orientation, raw_width, raw_height))
+
+    def zoomChanged(self):
+        """
+        放大到超过代理图1:1（代理图的一个像素大于屏幕上的一个像素）时，在后台解码原始分辨率
+
+        """
+        if self.loaded_image is None or not self.loaded_image.isProxy():
+            return
+        transform = self.graphicsView.transform()
+        view_scale = math.hypot(transform.m11(), transform.m12())
+        if view_scale * self.loaded_image.rawSize()[0] / self.pix.width() > 1:
+            self.full_loader.request(self.filename, self.imageData)
+
+    def fullResolutionLoaded(self, filename, loaded_image):
+        """
+        原始分辨率解码完成后替换代理图，标注不受影响
+
+        Args:
+            filename(str): 解码的图片
+            loaded_image(LoadedImage): 原始分辨率的解码结果
+
+        """
+        if filename != self.filename or self.loaded_image is None or not self.loaded_image.isProxy():
+            return
+        self.loaded_image = loaded_image
+        self.image = loaded_image.qimage
+        self.adjusted_array = None
+        self.setItemPixmap(QPixmap.fromImage(self.image))
+        cached = self.image_cache.get(filename)
+        if cached is not None:
+            cached.loaded_image = loaded_image
+            self.image_cache.put(filename, cached, cached.nbytes)
+        if self.sliderwinow.adjustments() != utils.DEFAULT_ADJUSTMENTS:
+            self.changeBrightnessAndContrast()
+
+    def fitView(self, width, height):
+        """
+        按照之前的缩放倍数先进行还原，再按宽高自适应窗口
+
+        Args:
+            width(float): 需要适应窗口的宽度
+            height(float): 需要适应窗口的高度
+
+        """
+        if width <= 0 or height <= 0:
+            return
         if self.view_scale is not None:
-            # 按照之前的缩放倍数先进行还原，然后才能进行自适应窗口
             self.graphicsView.scale(1 / self.view_scale, 1 / self.view_scale)
+        self.view_scale = self.viewScale(width, height)
+        self.graphicsView.scale(self.view_scale, self.view_scale)
 
-        json_file = osp.splitext(filename)[0] + ".json"
-        if QtCore.QFile.exists(json_file):  # 即存在这个json文件
-            self.have_json = True
-            self.labelFile = LabelFile(json_file)  # self.labelFile.shapes即为存信息的list
-            self.imageData = self.labelFile.imageData
-            self.imagePath = osp.join(osp.dirname(json_file),
-                                      self.labelFile.imagePath, )
-        else:
-            self.have_json = False
-            self.imageData = LabelFile.load_image_file(filename)
-            if self.imageData:
-                self.imagePath = filename
+    def showDocument(self, result):
+        """
+        把加载结果显示到scene中，同时自适应大小，并初始化相关按钮与参数
+
+        Args:
+            result(LoadResult): loader.load_document得到的加载结果
 
-        image = QtGui.QImage.fromData(self.imageData)
+        """
+        self.flushJournal()
+        self.clearAll()
+        self.full_loader.reset()
+
+        self.labelFile = result.label_file  # self.labelFile.shapes即为存信息的list
+        self.have_json = self.labelFile is not None
+        self.loaded_image = result.loaded_image
+        self.adjusted_array = None
+        self.image_adjuster.clear()
+        self.imageData = self.loaded_image.data if self.loaded_image else None
+        if self.imageData or result.pyramid is not None:
+            self.imagePath = result.image_path
+
+        # 每个文档各自决定保存时图片数据的处理方式：从图片打开时用默认方式，
+        # 从json打开时保持json原来的方式（内嵌或不内嵌）
+        policy = self.image_data_policy
+        if self.labelFile is not None:
+            if not self.labelFile.has_embedded_image():
+                policy = IMAGE_DATA_EXTERNAL
+            elif policy == IMAGE_DATA_EXTERNAL:
+                policy = IMAGE_DATA_EMBEDDED_CACHED
+        self.image_data_encoder = ImageDataEncoder(result.image_path, self.imageData, self.labelFile,
+                                                   policy, self.image_data_cache)
+        self.imageDataActions()[policy].setChecked(True)
+
+        image = self.loaded_image.qimage if self.loaded_image else QtGui.QImage()
         self.image = image
-        self.filename = filename
+        self.filename = result.filename
+        self.file_suffix()
 
-        self.pix = QPixmap.fromImage(image)
-        self.item = QGraphicsPixmapItem(self.pix)
+        if result.pyramid is not None:
+            # 超大图片：不生成整张QPixmap，只解码视图中可见的瓦片
+            self.pix = QPixmap()
+            self.item = TiledImageItem(result.pyramid, self.tile_loader)
+            # 与setItemPixmap相同，瓦片按文件中的方向保存，用图元的变换摆正
+            self.item.setTransform(loader.orientation_transform(result.pyramid.orientation,
+                                                                result.pyramid.raw_width, result.pyramid.raw_height))
+            self.image_width, self.image_height = result.pyramid.width, result.pyramid.height
+        else:
+            # 代理图时image比原图小，图元按原图大小拉伸
+            self.item = QGraphicsPixmapItem()
+            self.item.setTransformationMode(Qt.SmoothTransformation)
+            if self.loaded_image:
+                self.image_width, self.image_height = self.loaded_image.full_width, self.loaded_image.full_height
+            else:
+                self.image_width, self.image_height = image.width(), image.height()
+            self.setItemPixmap(QPixmap.fromImage(image))
         # self.item.setPos(0, 0)
         self.scene.addItem(self.item)
-        self.scene.setSceneRect(0, 0, self.pix.width(), self.pix.height())
+        self.scene.setSceneRect(0, 0, self.image_width, self.image_height)
 
-        if self.labelFile:
-            self.addLabelInfo(self.labelFile)
+        # 把上次没有保存的修改重放到json之上
+        self.journal = EditJournal(result.jsonFile())
+        self.folder_watcher.watchLabel(result.jsonFile())
+        shapes, replayed = self.journal.replay(self.labelFile.shapes if self.labelFile else [])
+        self.addLabelInfo(shapes)
+        if replayed:
+            self.statusbar.showMessage("已从修改日志恢复%d处未保存的修改" % replayed, 5000)
 
         # 自适应大小
-        self.view_scale = self.viewScale()
-        self.graphicsView.scale(self.view_scale, self.view_scale)
+        self.fitView(self.image_width, self.image_height)
 
-        # 打开图片后将放缩功能设置为可用
+        # 打开图片后将放缩功能设置为可用（瓦片显示的超大图片不支持调节亮度）
         self.actionZoom_In.setEnabled(True)
         self.actionZoom_Out.setEnabled(True)
-        self.action_Brightness.setEnabled(True)
+        self.action_Brightness.setEnabled(result.pyramid is None)
+        self.actionSave.setEnabled(True)
+        self.actionSaveAs.setEnabled(True)
 
-        # 初始化亮度和对比度滑动条
-        self.sliderwinow.slider_brightness.setValue(10)
-        self.sliderwinow.slider_contrast.setValue(10)
+        # 初始化图像调整的参数
+        self.sliderwinow.reset()
 
         for action_label in self.action_label_list:
             action_label.setEnabled(True)
@@ -191,7 +504,33 @@ class Window(QMainWindow, UiMain):
         self.action_edit_label.setEnabled(True)
         self.action_edit_label.setCheckable(True)
 
-        self.labelFile = None
+        self.prefetchAround(self.filename)
+
+    def imageDataActions(self):
+        """
+        保存图片数据的各策略对应的菜单动作
+
+        Returns:
+            dict: 策略 -> QAction
+
+        """
+        return {
+            IMAGE_DATA_EXTERNAL: self.action_image_external,
+            IMAGE_DATA_EMBEDDED_CACHED: self.action_image_embedded,
+            IMAGE_DATA_EMBEDDED_DEDUPLICATED: self.action_image_deduplicated,
+        }
+
+    def setImageDataPolicy(self, policy):
+        """
+        修改当前文档（以及之后从图片打开的文档）保存json时图片数据的处理方式
+
+        Args:
+            policy(str): label_file.IMAGE_DATA_POLICIES之一
+
+        """
+        self.image_data_policy = policy
+        if self.image_data_encoder is not None:
+            self.image_data_encoder.policy = policy
 
     def slot(self):
         """
@@ -203,6 +542,8 @@ class Window(QMainWindow, UiMain):
         self.actionZoom_Out.triggered.connect(self.graphicsView.zoomOut)
         self.actionZoom_In.triggered.connect(self.graphicsView.zoomIn)
         self.action_Brightness.triggered.connect(lambda: self.sliderwinow.show())
+        for policy, action in self.imageDataActions().items():
+            action.triggered.connect(lambda checked, policy=policy: self.setImageDataPolicy(policy))
         self.action_label_poly.triggered.connect(self.actionPolyTriggered)
         self.action_label_point.triggered.connect(self.actionPointTriggered)
         self.action_label_line.triggered.connect(self.actionLineTriggered)
@@ -236,9 +577,25 @@ class Window(QMainWindow, UiMain):
         self.graphicsView.label_dialog.my_Signal.connect(self.graphicsView.activeExit)
 
         self.sliderwinow.bright_contrast_signal.connect(self.changeBrightnessAndContrast)  # 改变亮度和对比度的信号
+        self.image_adjuster.adjusted.connect(self.imageAdjusted)
 
         self.fileWidget.signal_file.connect(self.changeFile)
-        self.horizontalSlider.signal_filechange.connect(self.sliderChangeFile)  # 打开文件有关的三个信号
+        self.graphicsView.zoom_changed_signal.connect(self.zoomChanged)
+        self.full_loader.loaded.connect(self.fullResolutionLoaded)
+        self.async_loader.loaded.connect(self.documentLoaded)
+        self.async_loader.failed.connect(self.documentFailed)
+        self.saves.saved.connect(self.documentSaved)
+        self.saves.failed.connect(self.documentSaveFailed)
+        self.scene.shape_edited_signal.connect(self.journalShapeEdited)
+        self.journal_timer.timeout.connect(self.flushJournal)
+        self.project_indexer.progress.connect(self.indexProgress)
+        self.folder_scanner.batchReady.connect(self.folderScanBatch)
+        self.folder_scanner.finished.connect(self.folderScanned)
+        self.folder_scanner.filesChanged.connect(self.folderChanged)
+        self.folder_scanner.directoriesListed.connect(self.folder_watcher.setDirectories)
+        self.folder_watcher.changed.connect(self.folder_scanner.refresh)
+        self.folder_watcher.labelChanged.connect(self.labelFileChanged)
+        self.horizontalSlider.fileSelected.connect(self.sliderChangeFile)  # 打开文件有关的三个信号
 
     def setInitEnable(self):
         """
@@ -248,39 +605,53 @@ class Window(QMainWindow, UiMain):
         self.actionZoom_In.setEnabled(False)
         self.actionZoom_Out.setEnabled(False)
         self.action_Brightness.setEnabled(False)
-        # self.actionSave.setEnabled(False)
-        # self.actionSaveAs.setEnabled(False)
+        self.actionSave.setEnabled(False)
+        self.actionSaveAs.setEnabled(False)
         for action_label in self.action_label_list:
             action_label.setEnabled(False)
         self.action_edit_label.setEnabled(False)
 
     def changeBrightnessAndContrast(self):
         """
-        完成对图片亮度与对比度的调节
+        完成对图片亮度、对比度等的调节：把SliderWindow中的参数交给工作线程中的调整流水线
+        （代理图时只处理代理图），结果由imageAdjusted显示
 
         """
-        img = self.image
-        img = fromqimage(img)
-        value = self.sliderwinow.slider_brightness.value() / 10
-        img = PIL.ImageEnhance.Brightness(img).enhance(value)
-        value2 = self.sliderwinow.slider_contrast.value() / 10
-        img = PIL.ImageEnhance.Contrast(img).enhance(value2)
-        img_data = utils.img_pil_to_data(img)
-        image = QtGui.QImage.fromData(img_data)
-        self.scene.removeItem(self.item)
-        self.pix = QPixmap.fromImage(image)
-        self.item = QGraphicsPixmapItem(self.pix)
-        self.scene.addItem(self.item)
-        self.scene.setSceneRect(0, 0, self.pix.width(), self.pix.height())
+        if self.loaded_image is None:
+            return
+        adjustments = self.sliderwinow.adjustments()
+        if adjustments == utils.DEFAULT_ADJUSTMENTS and self.adjusted_array is None:
+            return
+        self.image_adjuster.request(self.loaded_image, adjustments)
+
+    def imageAdjusted(self, loaded_image, array):
+        """
+        调整流水线计算完成后显示结果
+
+        Args:
+            loaded_image(LoadedImage): 被调整的图片，已经不是当前图片时忽略
+            array(np.ndarray): 调整后的像素，与原图相同时为原图的像素数组
+
+        """
+        if loaded_image is not self.loaded_image:
+            return
+        if array is loaded_image.array:
+            self.adjusted_array = None
+            self.setItemPixmap(QPixmap.fromImage(self.image))
+            return
+        self.adjusted_array = array  # QImage引用这块内存
+        image = QtGui.QImage(array.data, self.image.width(), self.image.height(),
+                             array.strides[0], self.image.format())
+        self.setItemPixmap(QPixmap.fromImage(image))
 
-    def addLabelInfo(self, label_info):
-        """获取label_info里的信息，并把这些信息写入到scene中的nodes_info
+    def addLabelInfo(self, shapes):
+        """获取shapes里的信息，并把这些信息写入到scene中的nodes_info
 
         Args:
-            label_info(): 现在打开的json文件中的label信息
+            shapes(list): 现在打开的json文件中的label信息（LabelFile.shapes，可能已重放了修改日志）
 
         """
-        for shape in label_info.shapes:
+        for shape in shapes:
             shape_type = shape['shape_type']
             if shape_type == 'polygon':
                 nodes_list = self.addPolyInfo(shape)
@@ -314,19 +685,25 @@ class Window(QMainWindow, UiMain):
         """
         self.action_edit_label.setEnabled(False)
 
-    def viewScale(self):
+    def viewScale(self, width=None, height=None):
         """
         实现图片自适应窗口功能
 
+        Args:
+            width(float): 需要适应窗口的宽度，默认为当前图片的宽度
+            height(float): 需要适应窗口的高度，默认为当前图片的高度
+
         Returns:
             float: 缩放的一个比值
 
         """
-        if (self.pix.width() / self.pix.height()) < (
+        width = self.image_width if width is None else width
+        height = self.image_height if height is None else height
+        if (width / height) < (
                 self.graphicsView.size().width() / self.graphicsView.size().height()):
-            return self.graphicsView.size().height() / self.pix.height()
+            return self.graphicsView.size().height() / height
         else:
-            return self.graphicsView.size().width() / self.pix.width()
+            return self.graphicsView.size().width() / width
 
     def clearAll(self):
         """
@@ -335,6 +712,7 @@ class Window(QMainWindow, UiMain):
         """
         for item in self.scene.items().copy():
             self.scene.removeItem(item)
+        self.placeholder = None
         self.scene.nodes_info = {'shapes': []}
         self.labelWidget.deleteAllRow()
 
@@ -393,213 +771,201 @@ class Window(QMainWindow, UiMain):
         """
         reply = QMessageBox.question(self, '确认', '确认退出吗', QMessageBox.Yes, QMessageBox.No)
         if reply == QMessageBox.Yes:
+            self.flushJournal()
+            self.saves.waitForDone()
+            self.thumbnails.shutdown()
+            self.folder_scanner.cancel()
+            self.folder_watcher.clear()
+            self.project_indexer.close()
             event.accept()
         else:
             event.ignore()
 
+    def documentSnapshot(self):
+        """
+        把当前的标注复制为labelme格式的字典，只读取顶点坐标，不做编码
+
+        imagePath与imageData留空，由保存任务在工作线程中用image_data_encoder填写
+
+        Returns:
+            dict: 见serializer.to_dict
+
+        """
+        flags = self.labelFile.flags if self.labelFile else {}
+        other_data = self.labelFile.otherData if self.labelFile else {}
+        return serializer.to_dict(self.scene.nodes_info['shapes'], None, None,
+                                  self.image_height, self.image_width, flags, other_data,
+                                  node_offset=(item_width / 2, item_height / 2))
+
+    def documentJsonFile(self):
+        """
+        当前文档的标注文件：读入了标注文件时为它的路径，否则为图片同名的json（与LoadResult.jsonFile相同）
+
+        Returns:
+            str: 标注文件的路径，没有打开的文档时为None
+
+        """
+        if self.filename is None:
+            return None
+        if self.labelFile is not None and self.labelFile.filename:
+            return self.labelFile.filename
+        return osp.splitext(self.filename)[0] + LabelFile.suffix
+
+    def saveDocument(self, json_path):
+        """
+        在后台把当前的标注保存到json_path
+
+        Args:
+            json_path(str): json文件的路径
+
+        """
+        context = None
+        json_file = self.documentJsonFile()
+        # 日志属于当前文档，并且写入的正是这个文档的json时，保存成功后才能压缩日志
+        if self.journal is not None and json_file is not None and \
+                osp.abspath(json_path) == osp.abspath(json_file) == osp.abspath(self.journal.json_path):
+            context = (self.journal, self.journal.seq)  # 快照包含到这条记录为止的修改
+        self.saves.save(json_path, self.documentSnapshot(), self.image_data_encoder, context)
+        self.statusbar.showMessage("正在保存：%s" % osp.basename(json_path))
+
+    def documentSaved(self, filename, context):
+        """
+        保存完成后压缩修改日志，并在状态栏提示
+
+        Args:
+            filename(str): 写入的json
+            context(tuple): (修改日志, 快照包含的最后一条记录的序号)，保存到其它路径时为None
+
+        """
+        self.project_indexer.updateFile(filename)
+        if self.folder_watcher.label_path is not None and osp.abspath(filename) == osp.abspath(
+                self.folder_watcher.label_path):
+            # 自己写入的修改不需要提示重新加载
+            self.folder_watcher.watchLabel(self.folder_watcher.label_path)
+        if context is not None:
+            journal, saved_seq = context
+            try:
+                journal.compact(saved_seq)
+            except OSError:
+                logger.exception("Failed compacting journal: {}".format(journal.path))
+        if not self.saves.isSaving():
+            self.statusbar.showMessage("已保存：%s" % osp.basename(filename), 3000)
+
+    def documentSaveFailed(self, filename, message):
+        """
+        保存失败时提示用户，磁盘上原有的json保持不变
+
+        Args:
+            filename(str): 要写入的json
+            message(str): 错误信息
+
+        """
+        self.statusbar.clearMessage()
+        QMessageBox.warning(self, '保存失败', '%s\n%s' % (filename, message))
+
+    def indexProgress(self, done, total):
+        """
+        在状态栏显示文件夹索引的更新进度
+
+        Args:
+            done(int): 已经写入索引的json数
+            total(int): 需要写入的json数
+
+        """
+        if done < total:
+            self.statusbar.showMessage("正在更新标注索引：%d/%d" % (done, total))
+        else:
+            self.statusbar.showMessage("标注索引已更新：%d个文件" % total, 3000)
+
+    def journalShapeEdited(self, op, shape):
+        """
+        把对图形的修改追加到当前文档的修改日志中，日志在JOURNAL_FLUSH_INTERVAL之后批量写入磁盘
+
+        Args:
+            op(str): 'add', 'move', 'rename'或'delete'
+            shape(dict): nodes_info['shapes']中的图形
+
+        """
+        if self.journal is None:
+            return
+        shapes = self.scene.nodes_info['shapes']
+        index = next((i for i, item in enumerate(shapes) if item is shape), None)
+        if index is None:
+            return
+        offset_x, offset_y = item_width / 2, item_height / 2
+        if op == 'add':
+            self.journal.record(op, None, shape=serializer.serialize_shape(shape, offset_x, offset_y))
+        elif op == 'move':
+            self.journal.record(op, index, points=serializer.shape_points(shape['points'], offset_x, offset_y))
+        elif op == 'rename':
+            self.journal.record(op, index, label=shape['label'], group_id=shape['group_id'])
+        else:
+            self.journal.record(op, index)
+        if not self.journal_timer.isActive():
+            self.journal_timer.start()
+
+    def flushJournal(self):
+        """
+        把修改日志缓冲区中的记录写入磁盘
+
+        """
+        self.journal_timer.stop()
+        if self.journal is None or not self.journal.pending():
+            return
+        try:
+            self.journal.flush()
+        except OSError:
+            logger.exception("Failed writing journal: {}".format(self.journal.path))
+
     def saveJsonAs(self):
         """
         json的另存为
 
         """
-        empty = {
-            "version": "5.0.1",
-            "flags": {},
-            "shapes": [],
-            "imagePath": "",
-            "imageData": "",
-            "imageHeight": 0,
-            "imageWidth": 0
-        }
-        shapelist = self.scene.nodes_info['shapes']
-        pointlist = []
-        coordinate = []
-        empty["imageWidth"] = self.pix.width()
-        empty["imageHeight"] = self.pix.height()
-        i = 0
-        while i < len(shapelist):
-            pointlist.append([])
-            pointlist[i] = shapelist[i]['points']
-            i += 1
-        e = 0
-        while e < len(pointlist):
-            coordinate.append([])
-            e += 1
-        h = 0
-        while h < len(pointlist):
-            for ite in pointlist[h]:
-                if isinstance(ite, list):
-                    coordinate[h].append(ite)
-                else:
-                    # print(pointlist)
-                    cor = []
-                    view_pos = ite.pos()
-                    x = view_pos.x() + item_width / 2
-                    y = view_pos.y() + item_height / 2
-                    cor = [x, y]
-                    coordinate[h].append(cor)
-            h += 1
-        transition = self.scene.nodes_info['shapes']
-        one_list = {
-            "label": "",
-            "points": [],
-            "group_id": "",
-            "shape_type": "",
-            "flags": {}
-        }
-        p = 0
-        while p < len(transition):
-            xxxxxx = one_list.copy()
-            empty["shapes"].append(xxxxxx)
-            p += 1
-        p = 0
-        while p < len(transition):
-            empty["shapes"][p]['label'] = transition[p]['label']
-            p += 1
-        j = 0
-        while j < len(empty["shapes"]):
-            empty["shapes"][j]["points"] = coordinate.copy()[j]
-            j += 1
-        p = 0
-        while p < len(transition):
-            empty["shapes"][p]['group_id'] = transition[p]['group_id']
-            p += 1
-        p = 0
-        while p < len(transition):
-            empty["shapes"][p]['shape_type'] = transition[p]['shape_type']
-            p += 1
-        while p < len(transition):
-            empty["shapes"][p]['flags'] = transition[p]['flags']
-            p += 1
-        pic_str = self.encode_base64(self.filename)
+        if self.filename is None or self.async_loader.isLoading():
+            return
         if self.pic_type:
-            empty["imagePath"] = self.filename
-            empty["imageData"] = str(pic_str)
             base_name = os.path.splitext(self.filename)[0]
             new_name = base_name + ".json"
         else:
             new_name = self.filename
-            empty["imagePath"] = self.imagePath
-            empty["imageData"] = label_file.imageData_again
-        jso = empty
-        filepath, type = QFileDialog.getSaveFileName(self, '文件保存', new_name, 'json(*.json)')
+        filters = 'json(*%s);;binary(*%s)' % (LabelFile.suffix, LabelFile.binary_suffix)
+        filepath, type = QFileDialog.getSaveFileName(self, '文件保存', new_name, filters)
         if filepath == '':
-            pass
-        else:
-            # print(filepath)
-            with open(filepath, 'w') as file_obj:
-                json.dump(jso, file_obj, indent=2, sort_keys=False)
+            return
+        self.saveDocument(filepath)
 
     def saveJson(self):
         """
         保存json文件
 
         """
+        if self.filename is None or self.async_loader.isLoading():
+            # 没有打开的文档，或者新的图片还在加载（场景中只有占位）
+            return
         if self.pic_type and (not self.have_json):
             self.saveJsonAs()
             self.have_json = True
         else:
-            empty = {
-                "version": "5.0.1",
-                "flags": {},
-                "shapes": [],
-                "imagePath": "",
-                "imageData": "",
-                "imageHeight": 0,
-                "imageWidth": 0
-            }
-            shapelist = self.scene.nodes_info['shapes']
-            pointlist = []
-            coordinate = []
-            empty["imageWidth"] = self.pix.width()
-            empty["imageHeight"] = self.pix.height()
-            i = 0
-            while i < len(shapelist):
-                pointlist.append([])
-                pointlist[i] = shapelist[i]['points']
-                i += 1
-            e = 0
-            while e < len(pointlist):
-                coordinate.append([])
-                e += 1
-            h = 0
-            while h < len(pointlist):
-                for ite in pointlist[h]:
-                    if isinstance(ite, list):
-                        coordinate[h].append(ite)
-                    else:
-                        view_pos = ite.pos()
-                        x = view_pos.x() + item_width / 2
-                        y = view_pos.y() + item_height / 2
-                        cor = [x, y]
-                        coordinate[h].append(cor)
-                h += 1
-            transition = self.scene.nodes_info['shapes']
-            one_list = {
-                "label": "",
-                "points": [],
-                "group_id": "",
-                "shape_type": "",
-                "flags": {}
-            }
-            p = 0
-            while p < len(transition):
-                xxxxxx = one_list.copy()
-                empty["shapes"].append(xxxxxx)
-                p += 1
-            p = 0
-            while p < len(transition):
-                empty["shapes"][p]['label'] = transition[p]['label']
-                p += 1
-            j = 0
-            while j < len(transition):
-                empty["shapes"][j]["points"] = coordinate.copy()[j]
-                j += 1
-            p = 0
-            while p < len(transition):
-                empty["shapes"][p]['group_id'] = transition[p]['group_id']
-                p += 1
-            p = 0
-            while p < len(transition):
-                empty["shapes"][p]['shape_type'] = transition[p]['shape_type']
-                p += 1
-            while p < len(transition):
-                empty["shapes"][p]['flags'] = transition[p]['flags']
-                p += 1
-            pic_str = self.encode_base64(self.filename)
-            if self.pic_type:
-                empty["imagePath"] = self.filename
-                empty["imageData"] = str(pic_str)
+            if self.pic_type and self.labelFile is not None:
+                # 图片旁边已有的标注文件（可能是二进制格式）
+                new_name = self.labelFile.filename
+            elif self.pic_type:
                 base_name = os.path.splitext(self.filename)[0]
                 new_name = base_name + ".json"
             else:
                 new_name = self.filename
-                empty["imagePath"] = self.imagePath
-                empty["imageData"] = label_file.imageData_again
-            jso = empty
-            with open(new_name, 'w') as file_obj:
-                json.dump(jso, file_obj, indent=2, sort_keys=False)
-
-    def encode_base64(self, file):
-        """把图片信息进行编码
-
-        Args:
-            file(str): 图片的绝对路径
-
-        """
-        with open(file, 'rb') as f:
-            img_data = f.read()
-            base64_data = base64.b64encode(img_data)
-            base64_str = str(base64_data, 'utf-8')
-            return base64_str
+            self.saveDocument(new_name)
 
     def renameLabelInDict(self):
         """
         重命名后对相应字典中的信息进行修改
 
         """
-        self.scene.nodes_info['shapes'][self.labelWidget.Rename_num]['label'] = self.labelWidget.name
-        self.scene.nodes_info['shapes'][self.labelWidget.Rename_num]['group_id'] = self.labelWidget.group
+        shape = self.scene.nodes_info['shapes'][self.labelWidget.Rename_num]
+        shape['label'] = self.labelWidget.name
+        shape['group_id'] = self.labelWidget.group
+        self.scene.shapeEdited('rename', shape)
 
     def deleteLabelInTableWidget(self):
         """
@@ -613,6 +979,7 @@ class Window(QMainWindow, UiMain):
                     self.scene.removeItem(edge)
                 else:
                     continue
+        self.scene.shapeEdited('delete', self.scene.nodes_info['shapes'][self.labelWidget.Rename_num])
         del self.scene.nodes_info['shapes'][self.labelWidget.Rename_num]
 
     def setHandCursor(self):
@@ -847,6 +1214,7 @@ class Window(QMainWindow, UiMain):
         node.shape_type = shape_type
         node.setZValue(2)
         node.setPos(node_pos[0] - node.width / 2, node_pos[1] - node.height / 2)
+        node.origin = (node.x(), node.y(), node_pos)  # 没有移动过的顶点保存时原样写回读入的坐标
         self.scene.addItem(node)
         node.scene = self.scene
         return node
@@ -0,0 +1,77 @@
+"""标注保存的吞吐量测试：serializer在10k、100k、1M个顶点上的to_dict与dumps耗时，
+以及json与二进制格式（formats.binary）在顶点很多的多边形上的读写速度与大小
+
+    python benchmarks/bench_labels.py
+
+"""
+import json
+import os.path as osp
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+
+import serializer  # noqa: E402
+from formats import binary  # noqa: E402
+
+
+class _BenchmarkNode(object):
+    """代替顶点图元的对象，只有x()、y()两个方法"""
+    __slots__ = ("_x", "_y")
+
+    def __init__(self, x, y):
+        self._x, self._y = x, y
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+
+def bench_serializer(total_points, points_per_shape=20):
+    shapes = []
+    for i in range(total_points // points_per_shape):
+        points = [_BenchmarkNode(i * 0.37 + j, j * 1.13) for j in range(points_per_shape)]
+        shapes.append({"label": "label%d" % (i % 10), "points": points, "group_id": None,
+                       "shape_type": "polygon", "flags": {}})
+    start = time.perf_counter()
+    data = serializer.to_dict(shapes, "image.jpg", None, 1000, 1000, node_offset=(12.5, 12.5))
+    middle = time.perf_counter()
+    text = serializer.dumps(data)
+    end = time.perf_counter()
+    print("{:>9} points: to_dict {:7.3f}s ({:6.2f} M points/s), dumps {:7.3f}s, {:6.1f} MB".format(
+        total_points, middle - start, total_points / (middle - start) / 1e6, end - middle, len(text) / 1e6))
+
+
+def bench_binary(vertices, shape_count):
+    shapes = []
+    for i in range(shape_count):
+        angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+        points = np.stack([500 + 400 * np.cos(angles) + i, 500 + 400 * np.sin(angles)], axis=1)
+        shapes.append({"label": "label%d" % (i % 10), "points": np.round(points, 3).tolist(),
+                       "group_id": None, "shape_type": "polygon", "flags": {}})
+    data = serializer.to_dict(shapes, "image.jpg", None, 1000, 1000)
+    timings = []
+    for encode, decode in ((lambda d: serializer.dumps(d).encode("utf-8"), json.loads),
+                           (binary.dumps, binary.loads)):
+        start = time.perf_counter()
+        raw = encode(data)
+        middle = time.perf_counter()
+        decode(raw)
+        end = time.perf_counter()
+        timings.append((middle - start, end - middle, len(raw)))
+    (json_save, json_load, json_size), (binary_save, binary_load, binary_size) = timings
+    print("{:>3} x {:>7} vertices: json save {:7.3f}s load {:7.3f}s {:7.2f} MB | "
+          "binary save {:7.3f}s load {:7.3f}s {:7.2f} MB".format(
+              shape_count, vertices, json_save, json_load, json_size / 1e6,
+              binary_save, binary_load, binary_size / 1e6))
+
+
+if __name__ == "__main__":
+    for count in (10 * 1000, 100 * 1000, 1000 * 1000):
+        bench_serializer(count)
+    for vertices, shape_count in ((10 * 1000, 1), (10 * 1000, 20), (100 * 1000, 5), (1000 * 1000, 1)):
+        bench_binary(vertices, shape_count)
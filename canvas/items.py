@@ -14,6 +14,8 @@ class GraphicItem(QGraphicsPixmapItem):
         scene = None
         shape_type(str): 表示该顶点所在图形形状
         node_s_edges(list): 储存该顶点所连的线
+        origin(tuple): 从json读入时的(图元x, 图元y, 读入的坐标)，新画的顶点为None
+        press_pos(QPointF): 鼠标按下时图元的位置，用于在释放时判断是否被拖动过
 
     """
     def __init__(self, parent=None):
@@ -28,6 +30,32 @@ class GraphicItem(QGraphicsPixmapItem):
 
         self.shape_type = None
         self.node_s_edges = []
+        self.origin = None
+        self.press_pos = None
+
+    def mousePressEvent(self, event):
+        """
+        记录拖动开始时的位置
+
+        Args:
+            event(QEvent): 鼠标按下事件
+
+        """
+        super().mousePressEvent(event)
+        self.press_pos = self.pos()
+
+    def mouseReleaseEvent(self, event):
+        """
+        拖动结束后若位置改变，通知scene该顶点所在的图形被移动了
+
+        Args:
+            event(QEvent): 鼠标释放事件
+
+        """
+        super().mouseReleaseEvent(event)
+        if self.press_pos is not None and self.pos() != self.press_pos and self.scene is not None:
+            self.scene.nodeMoved(self)
+        self.press_pos = None
 
     def mouseMoveEvent(self, event):
         """
@@ -1,4 +1,5 @@
 from PyQt5.QtWidgets import QGraphicsScene
+from PyQt5.QtCore import pyqtSignal
 
 
 class GraphicScene(QGraphicsScene):
@@ -13,6 +14,8 @@ class GraphicScene(QGraphicsScene):
         store_info():
 
     """
+    shape_edited_signal = pyqtSignal(str, object)  # 操作（add/move/rename/delete）, nodes_info中的图形字典
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
@@ -88,6 +91,31 @@ class GraphicScene(QGraphicsScene):
         all_info_temp = {'label': label, 'points': self.nodes.copy(), 'group_id': group_id,
                          'shape_type': self.nodes[0].shape_type, 'flags': {}}
         self.nodes_info['shapes'].append(all_info_temp)
+        self.shapeEdited('add', all_info_temp)
         self.edges = []
         self.nodes = []
         return all_info_temp['points']
+
+    def shapeEdited(self, op, shape):
+        """
+        通知某个已完成的图形被修改了（用于记录修改日志），删除时需要在从nodes_info中移除之前调用
+
+        Args:
+            op(str): 'add', 'move', 'rename'或'delete'
+            shape(dict): nodes_info['shapes']中的图形
+
+        """
+        self.shape_edited_signal.emit(op, shape)
+
+    def nodeMoved(self, node):
+        """
+        单独拖动某个顶点后，通知该顶点所在的图形被移动了（正在绘制、尚未完成的图形不通知）
+
+        Args:
+            node(GraphicItem): 被拖动的顶点图元
+
+        """
+        for shape in self.nodes_info['shapes']:
+            if any(point is node for point in shape['points']):
+                self.shapeEdited('move', shape)
+                return
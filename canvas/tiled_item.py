@@ -0,0 +1,119 @@
+import math
+
+from PyQt5.QtWidgets import QGraphicsItem
+from PyQt5.QtCore import QRectF
+
+
+class TiledImageItem(QGraphicsItem):
+    """
+    用瓦片金字塔显示超大图片的图元，只解码当前视图中可见、且与当前缩放比例匹配的瓦片
+
+    图元的坐标是文件中（未摆正）原图的像素坐标（第0层），由图元的变换按exif方向摆正，
+    所以scene坐标（即标注的坐标）与普通图片完全一致
+
+    Attributes:
+        pyramid(Pyramid): 磁盘上的瓦片金字塔
+        tile_loader(TileLoader): 在工作线程中解码瓦片并缓存的对象
+
+    """
+    def __init__(self, pyramid, tile_loader, parent=None):
+        super().__init__(parent)
+        self.pyramid = pyramid
+        self.tile_loader = tile_loader
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)  # 使option.exposedRect可用
+        self.tile_loader.tileReady.connect(self.tileReady)
+        # 最顶层只有一个很小的瓦片，立即解码，保证任何时候都有内容可画
+        self.tile_loader.loadNow(pyramid, pyramid.levels - 1, 0, 0)
+
+    def boundingRect(self):
+        """
+        图元的范围即原图（未摆正）的大小
+
+        """
+        return QRectF(0, 0, self.pyramid.raw_width, self.pyramid.raw_height)
+
+    def levelForScale(self, scale):
+        """
+        根据当前的缩放比例选出合适的金字塔层（该层一个像素不小于屏幕上的一个像素）
+
+        Args:
+            scale(float): 原图一个像素在屏幕上的大小
+
+        Returns:
+            int: 层号
+
+        """
+        if scale <= 0:
+            return self.pyramid.levels - 1
+        level = int(math.floor(math.log2(1 / scale))) if scale < 1 else 0
+        return max(0, min(level, self.pyramid.levels - 1))
+
+    def tileRect(self, level, col, row):
+        """
+        某个瓦片在原图坐标中的范围
+
+        """
+        size = self.pyramid.tile_size * 2 ** level
+        return QRectF(col * size, row * size, size, size).intersected(self.boundingRect())
+
+    def paint(self, painter, option, widget=None):
+        """
+        绘制可见区域内的瓦片，尚未解码的瓦片先用更粗糙一层的瓦片代替
+
+        """
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.levelForScale(scale)
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        if exposed.isEmpty():
+            return
+        size = self.pyramid.tile_size * 2 ** level
+        cols, rows = self.pyramid.tile_count(level)
+        col_start, col_end = int(exposed.left() // size), min(cols - 1, int(exposed.right() // size))
+        row_start, row_end = int(exposed.top() // size), min(rows - 1, int(exposed.bottom() // size))
+        for row in range(row_start, row_end + 1):
+            for col in range(col_start, col_end + 1):
+                target = self.tileRect(level, col, row)
+                pixmap = self.tile_loader.pixmap(self.pyramid, level, col, row)
+                if pixmap is not None:
+                    self.drawTile(painter, target, pixmap, level, col, row)
+                    continue
+                # 用已缓存的更粗糙层的瓦片临时填充
+                for coarse in range(level + 1, self.pyramid.levels):
+                    shift = coarse - level
+                    coarse_col, coarse_row = col >> shift, row >> shift
+                    pixmap = self.tile_loader.pixmap(self.pyramid, coarse, coarse_col, coarse_row, request=False)
+                    if pixmap is not None:
+                        self.drawTile(painter, target, pixmap, coarse, coarse_col, coarse_row)
+                        break
+
+    def drawTile(self, painter, target, pixmap, level, col, row):
+        """
+        把第level层(col, row)瓦片中与target对应的部分画到target上
+
+        Args:
+            painter(QPainter): 画笔
+            target(QRectF): 原图坐标中需要绘制的范围
+            pixmap(QPixmap): 瓦片
+            level(int): 瓦片所在层
+            col(int): 瓦片列号
+            row(int): 瓦片行号
+
+        """
+        scale = 2 ** level
+        origin_x = col * self.pyramid.tile_size * scale
+        origin_y = row * self.pyramid.tile_size * scale
+        source = QRectF((target.x() - origin_x) / scale, (target.y() - origin_y) / scale,
+                        target.width() / scale, target.height() / scale)
+        painter.drawPixmap(target, pixmap, source)
+
+    def tileReady(self, key):
+        """
+        某个瓦片解码完成后只重绘它所在的区域
+
+        Args:
+            key(tuple): (金字塔目录, 层, 列, 行)
+
+        """
+        directory, level, col, row = key
+        if directory == self.pyramid.directory and self.scene() is not None:
+            self.update(self.tileRect(level, col, row))
@@ -29,6 +29,7 @@ class GraphicView(QGraphicsView):
         shapeTouched_delete(dict): 用于记录被鼠标触发的图形对象
         graphicsTouched_move(bool): 用于记录图形是否可以被拖动
         shapeTouched_move(dict): 用于记录被拖动的图形对象
+        shape_dragged(bool): 用于记录本次按下鼠标后图形是否真的被拖动过
         edit_enable(bool): 用于记录编辑模式是否开启
         position_orig(QPoint): 鼠标在多边形内部时，用于记录鼠标左击的位置
         position_press_move(QPoint): 鼠标在多边形内部时，用于跟踪鼠标左击并移动时的位置
@@ -47,6 +48,7 @@ class GraphicView(QGraphicsView):
     set_cross_cursor_signal = pyqtSignal()
     set_hand_cursor_signal = pyqtSignal()
     set_arrow_cursor_signal = pyqtSignal()
+    zoom_changed_signal = pyqtSignal()
 
     def __init__(self, scene, parent=None):
         super().__init__(parent)
@@ -70,6 +72,7 @@ class GraphicView(QGraphicsView):
         self.shapeTouched_delete = None
         self.graphicsTouched_move = False
         self.shapeTouched_move = None
+        self.shape_dragged = False
         self.edit_enable = False
         self.position_orig = None
         self.position_press_move = None
@@ -337,6 +340,7 @@ class GraphicView(QGraphicsView):
                             drag_edge.updatePositions()
                         self.scene.update()
                     self.position_orig = self.mapToScene(event.pos())
+                    self.shape_dragged = True
 
                     # 填充的多边形的更新
                     if self.shapeTouched_move['shape_type'] == 'polygon':
@@ -416,6 +420,7 @@ class GraphicView(QGraphicsView):
         if zoom_scale >= 10:
             zoom_scale = 10
         self.scale(zoom_scale, zoom_scale)
+        self.zoom_changed_signal.emit()
 
     def zoomOut(self):
         """
@@ -427,6 +432,21 @@ class GraphicView(QGraphicsView):
         if zoom_scale <= 0:
             zoom_scale = 0.2
         self.scale(zoom_scale, zoom_scale)
+        self.zoom_changed_signal.emit()
+
+    def mouseReleaseEvent(self, event):
+        """鼠标按钮释放事件响应
+
+        编辑模式下整体拖动图形结束后，通知scene该图形被移动了
+
+        Args:
+            event(QEvent): 鼠标释放事件
+
+        """
+        if self.shape_dragged and self.shapeTouched_move is not None:
+            self.scene.shapeEdited('move', self.shapeTouched_move)
+        self.shape_dragged = False
+        super().mouseReleaseEvent(event)
 
     def getItemAtClick(self, event):
         """获取点击位置的图元，无则返回None.
@@ -556,11 +576,13 @@ class GraphicView(QGraphicsView):
                         self.scene.removeItem(edge)
                     else:
                         continue
+            self.scene.shapeEdited('delete', self.shapeTouched_delete)
             self.scene.nodes_info['shapes'].remove(self.shapeTouched_delete)
             self.scene.removeItem(self.poly_now)
         else:
             for shape in self.scene.nodes_info['shapes']:
                 if shape['shape_type'] == 'point' and shape['points'][0] == self.point_now:
+                    self.scene.shapeEdited('delete', shape)
                     self.scene.nodes_info['shapes'].remove(shape)
                     self.scene.removeItem(self.point_now)
                     break
@@ -568,6 +590,7 @@ class GraphicView(QGraphicsView):
                     self.scene.removeItem(shape['points'][0].node_s_edges[0])
                     self.scene.removeItem(shape['points'][0])
                     self.scene.removeItem(shape['points'][1])
+                    self.scene.shapeEdited('delete', shape)
                     self.scene.nodes_info["shapes"].remove(shape)
                     break
                 else:
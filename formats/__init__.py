@@ -0,0 +1,11 @@
+from .binary import SUFFIX as BINARY_SUFFIX
+from .binary import is_binary
+from .binary import binary_to_json
+from .binary import json_to_binary
+from .dataset import Annotation
+from .dataset import SHAPE_TYPES
+from .dataset import header_size
+from .dataset import iter_label_files
+from .dataset import parallel_map
+from .dataset import read_annotation
+from .dataset import shape_geometry
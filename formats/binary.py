@@ -0,0 +1,317 @@
+"""紧凑的二进制标注格式（.lmb），与labelme json之间可以无损地互相转换
+
+顶点很多的多边形在json中每个坐标要占十几个字节，解析和编码都要逐个数字进行；二进制格式把每个形状的顶点
+存为一段连续的数组（能无损表示时用float32或int32），读写只需要一次拷贝。文件的布局为::
+
+    头部        struct "<4sHHIIIQQ"：MAGIC、版本、标志位、字符串数、形状数、meta长度、顶点段长度、图片段长度
+    字符串表    字符串数个uint32长度，之后是所有字符串的UTF-8字节（label与shape_type）
+    形状表      每个形状24字节，见SHAPE_DTYPE：label与shape_type在字符串表中的序号、顶点的类型、个数与偏移
+    meta        紧凑的json：除shapes外的顶层键（顺序与原文件相同），以及每个形状的其它键
+    顶点段      按8字节对齐，每个形状的顶点依次存放
+    图片段      imageData：能按标准base64原样还原时存解码后的字节，否则存base64文本本身
+
+与json之间的无损转换由tests/test_binary.py检查，读写速度见benchmarks/bench_labels.py。
+直接运行本模块可以在两种格式之间转换给出的文件::
+
+    python -m formats.binary a.json b.lmb ...
+
+"""
+import base64
+import binascii
+import io
+import itertools
+import json
+import os.path as osp
+import struct
+import sys
+
+import numpy as np
+
+import serializer
+
+MAGIC = b"LMBF"
+VERSION = 1
+SUFFIX = ".lmb"
+
+HEADER = struct.Struct("<4sHHIIIQQ")
+SHAPE_DTYPE = np.dtype({
+    "names": ["label", "shape_type", "kind", "count", "offset"],
+    "formats": ["<u4", "<u4", "u1", "<u4", "<u8"],
+    "offsets": [0, 4, 8, 12, 16],
+    "itemsize": 24,
+})
+NO_STRING = 0xFFFFFFFF  # label或shape_type不是字符串（或不存在），原样保存在meta中
+
+# 顶点的存储类型，KIND_JSON表示顶点不是规整的[x, y]数组（或混有整数与小数），原样保存在meta中
+KIND_FLOAT64 = 0
+KIND_FLOAT32 = 1
+KIND_INT32 = 2
+KIND_INT64 = 3
+KIND_JSON = 255
+_KIND_DTYPES = {
+    KIND_FLOAT64: np.dtype("<f8"),
+    KIND_FLOAT32: np.dtype("<f4"),
+    KIND_INT32: np.dtype("<i4"),
+    KIND_INT64: np.dtype("<i8"),
+}
+
+FLAG_IMAGE = 0x1  # 图片段保存了imageData
+FLAG_IMAGE_RAW = 0x2  # 图片段是解码后的字节，否则是base64文本
+
+_ORDER_KEY = "@order"  # 形状的键顺序与默认顺序不同时，meta中记录原来的顺序
+
+
+def is_binary(raw):
+    """判断文件内容是否为二进制标注格式
+
+    Args:
+        raw(bytes): 文件开头的至少4个字节
+
+    """
+    return raw[:len(MAGIC)] == MAGIC
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+def _encode_points(points):
+    """选择能无损保存一个形状顶点的最紧凑的数组
+
+    Returns:
+        tuple: (顶点类型, numpy数组)，无法用数组保存时为(KIND_JSON, None)
+
+    """
+    if type(points) is not list or not all(type(point) is list and len(point) == 2 for point in points):
+        return KIND_JSON, None
+    types = set(map(type, itertools.chain.from_iterable(points)))
+    if not types or types == {float}:
+        array = np.array(points, dtype="<f8").reshape(-1)
+        with np.errstate(over="ignore"):  # 超出float32范围的值变为inf，下面的比较会选择float64
+            single = array.astype("<f4")
+        # nan与自身不相等，含nan时保持float64
+        if np.array_equal(single.astype("<f8"), array):
+            return KIND_FLOAT32, single
+        return KIND_FLOAT64, array
+    if types == {int}:
+        try:
+            array = np.array(points, dtype="<i8").reshape(-1)
+        except OverflowError:
+            return KIND_JSON, None
+        if array.size and array.min() >= -2 ** 31 and array.max() < 2 ** 31:
+            return KIND_INT32, array.astype("<i4")
+        return KIND_INT64, array
+    return KIND_JSON, None
+
+
+def _split_image_data(image_data):
+    """imageData在图片段中的保存方式
+
+    Returns:
+        tuple: (标志位, 图片段的字节)
+
+    """
+    if not isinstance(image_data, str):
+        return 0, b""
+    try:
+        decoded = base64.b64decode(image_data, validate=True)
+    except (binascii.Error, ValueError):
+        decoded = None
+    if decoded is not None and base64.b64encode(decoded).decode("ascii") == image_data:
+        return FLAG_IMAGE | FLAG_IMAGE_RAW, decoded
+    return FLAG_IMAGE, image_data.encode("utf-8")
+
+
+def dumps(data):
+    """把labelme格式的字典编码为二进制格式
+
+    Args:
+        data(dict): json.load或serializer.to_dict的结果，shapes必须是形状字典的列表
+
+    Returns:
+        bytes: 文件内容
+
+    """
+    shapes = data.get("shapes")
+    if not isinstance(shapes, list) or not all(isinstance(shape, dict) for shape in shapes):
+        raise ValueError("shapes must be a list of objects")
+    strings = {}
+    table = np.zeros(len(shapes), dtype=SHAPE_DTYPE)
+    entries = []
+    chunks = []
+    points_size = 0
+
+    def intern(value):
+        if type(value) is not str:
+            return NO_STRING
+        return strings.setdefault(value, len(strings))
+
+    for row, shape in zip(table, shapes):
+        entry = {}
+        row["label"] = intern(shape.get("label"))
+        row["shape_type"] = intern(shape.get("shape_type"))
+        kind, array = _encode_points(shape["points"]) if "points" in shape else (KIND_JSON, None)
+        row["kind"] = kind
+        if array is not None:
+            row["count"] = array.size
+            row["offset"] = points_size
+            chunk = array.tobytes()
+            chunks.append(chunk + b"\0" * (_align(len(chunk)) - len(chunk)))
+            points_size += len(chunks[-1])
+        stored = {"label": row["label"] != NO_STRING, "points": array is not None,
+                  "shape_type": row["shape_type"] != NO_STRING}
+        for key, value in shape.items():
+            if not stored.get(key):
+                entry[key] = value
+        # 解码时先放存在的标准键，再放其它键；原来的顺序不同时才记录
+        present = [key for key in serializer.SHAPE_KEYS if key in shape]
+        if list(shape) != present + [key for key in entry if key not in serializer.SHAPE_KEYS]:
+            entry[_ORDER_KEY] = list(shape)
+        entries.append(entry)
+
+    image_flags, image_bytes = _split_image_data(data.get("imageData"))
+    meta = {}
+    for key, value in data.items():
+        if key == "shapes":
+            meta[key] = entries
+        elif key == "imageData" and image_flags:
+            meta[key] = None
+        else:
+            meta[key] = value
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    encoded = [text.encode("utf-8") for text in strings]
+    head = [
+        HEADER.pack(MAGIC, VERSION, image_flags, len(encoded), len(shapes), len(meta_bytes),
+                    points_size, len(image_bytes)),
+        np.array([len(text) for text in encoded], dtype="<u4").tobytes(),
+        b"".join(encoded),
+        table.tobytes(),
+        meta_bytes,
+    ]
+    head_size = sum(len(part) for part in head)
+    head.append(b"\0" * (_align(head_size) - head_size))
+    return b"".join(head + chunks + [image_bytes])
+
+
+def parse(raw):
+    """解码二进制格式，但不取出图片段（与LabelFile读取json时跳过imageData相同）
+
+    Args:
+        raw(bytes): 文件内容
+
+    Returns:
+        tuple: (字典，imageData为None或原文件中的非字符串值, 图片段在raw中的(起, 止)位置或None,
+        图片段是否为解码后的字节)
+
+    """
+    if not is_binary(raw):
+        raise ValueError("not a labelall binary annotation file")
+    (_, version, flags, string_count, shape_count, meta_size,
+     points_size, image_size) = HEADER.unpack_from(raw, 0)
+    if version > VERSION:
+        raise ValueError("unsupported binary annotation version: {}".format(version))
+    position = HEADER.size
+    lengths = np.frombuffer(raw, dtype="<u4", count=string_count, offset=position)
+    position += lengths.nbytes
+    strings = []
+    for length in lengths.tolist():
+        strings.append(raw[position:position + length].decode("utf-8"))
+        position += length
+    table = np.frombuffer(raw, dtype=SHAPE_DTYPE, count=shape_count, offset=position)
+    position += table.nbytes
+    meta = json.loads(raw[position:position + meta_size].decode("utf-8"))
+    points_start = _align(position + meta_size)
+    image_start = points_start + points_size
+
+    shapes = []
+    for row, entry in zip(table.tolist(), meta["shapes"]):
+        label, shape_type, kind, count, offset = row
+        values = {}
+        if label != NO_STRING:
+            values["label"] = strings[label]
+        if shape_type != NO_STRING:
+            values["shape_type"] = strings[shape_type]
+        if kind != KIND_JSON:
+            dtype = _KIND_DTYPES[kind]
+            array = np.frombuffer(raw, dtype=dtype, count=count, offset=points_start + offset)
+            if kind == KIND_FLOAT32:
+                array = array.astype("<f8")
+            values["points"] = array.reshape(-1, 2).tolist()
+        order = entry.pop(_ORDER_KEY, None)
+        if order is None:
+            order = [key for key in serializer.SHAPE_KEYS if key in values or key in entry]
+            order += [key for key in entry if key not in serializer.SHAPE_KEYS]
+        values.update(entry)
+        shapes.append({key: values[key] for key in order})
+    meta["shapes"] = shapes
+    span = (image_start, image_start + image_size) if flags & FLAG_IMAGE else None
+    return meta, span, bool(flags & FLAG_IMAGE_RAW)
+
+
+def loads(raw):
+    """解码二进制格式的全部内容
+
+    Args:
+        raw(bytes): 文件内容
+
+    Returns:
+        dict: 与原json的json.load结果相同的字典
+
+    """
+    data, span, image_raw = parse(raw)
+    if span is not None:
+        image = raw[span[0]:span[1]]
+        data["imageData"] = base64.b64encode(image).decode("ascii") if image_raw else image.decode("utf-8")
+    return data
+
+
+def save(filename, data, fsync=True):
+    """把labelme格式的字典原子地写入二进制文件（见serializer.write_atomic）"""
+    serializer.write_atomic(filename, dumps(data), fsync)
+
+
+def load(filename):
+    """读取二进制文件的全部内容，见loads"""
+    with io.open(filename, "rb") as f:
+        return loads(f.read())
+
+
+def json_to_binary(json_path, binary_path=None):
+    """把labelme json转换为二进制格式
+
+    Args:
+        json_path(str): json文件的路径
+        binary_path(str): 输出的路径，默认为同名的.lmb
+
+    Returns:
+        str: 输出的路径
+
+    """
+    binary_path = binary_path or osp.splitext(json_path)[0] + SUFFIX
+    with io.open(json_path, "r", encoding="utf-8") as f:
+        save(binary_path, json.load(f))
+    return binary_path
+
+
+def binary_to_json(binary_path, json_path=None):
+    """把二进制格式转换为labelme json（缩进格式与serializer.dumps相同）
+
+    Args:
+        binary_path(str): 二进制文件的路径
+        json_path(str): 输出的路径，默认为同名的.json
+
+    Returns:
+        str: 输出的路径
+
+    """
+    json_path = json_path or osp.splitext(binary_path)[0] + ".json"
+    serializer.save(json_path, load(binary_path))
+    return json_path
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        with io.open(path, "rb") as f:
+            binary = is_binary(f.read(len(MAGIC)))
+        print("{} -> {}".format(path, binary_to_json(path) if binary else json_to_binary(path)))
@@ -0,0 +1,219 @@
+"""导出、导入、校验等命令行工具共用的部分：遍历标注文件、读取标注与图片尺寸、进程池与吞吐量统计
+
+不依赖Qt，可以在没有图形界面的机器上运行，进程池中的函数都在模块顶层，spawn的子进程可以直接导入
+
+"""
+import base64
+import collections
+import concurrent.futures
+import io
+import itertools
+import math
+import multiprocessing
+import os
+import os.path as osp
+import sys
+import time
+
+from utils import read_image_size
+
+SHAPE_TYPES = ("polygon", "rectangle", "line", "point")  # app.addLabelInfo能显示的形状类型
+CHUNK_SIZE = 16  # 每次交给子进程的文件数
+
+Annotation = collections.namedtuple("Annotation", ["json_path", "image_path", "width", "height", "shapes"])
+Annotation.__doc__ = """一个标注文件中导出所需的内容（可以在进程间传递）
+
+Attributes:
+    json_path(str): 标注文件的路径
+    image_path(str): 图片文件的路径（找不到图片文件时为按imagePath推出的路径）
+    width(int): 图片宽度，json中没有且无法从文件头读到时为None
+    height(int): 图片高度
+    shapes(list): [(label, shape_type, group_id, points)]
+
+"""
+
+
+def iter_label_files(folder):
+    """按路径顺序遍历文件夹（包括子文件夹）中的标注文件
+
+    同一个名字的json与二进制格式都存在时只取json（与LabelFile.find相同）；以"."开头的文件夹被跳过
+
+    Args:
+        folder(str): 文件夹路径
+
+    Yields:
+        str: 标注文件的绝对路径
+
+    """
+    # label_file导入了formats.binary，在模块级导入会循环（先导入label_file时formats还没有初始化完）
+    from label_file import LabelFile
+    for root, dirs, files in os.walk(osp.abspath(folder)):
+        dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+        stems = set()
+        for name in sorted(files):
+            stem, ext = osp.splitext(name)
+            if ext.lower() == LabelFile.suffix:
+                stems.add(stem)
+                yield osp.join(root, name)
+        for name in sorted(files):
+            stem, ext = osp.splitext(name)
+            if ext.lower() == LabelFile.binary_suffix and stem not in stems:
+                yield osp.join(root, name)
+
+
+def header_size(label_file):
+    """只读取文件头得到标注对应图片的(宽, 高)：先找图片文件，没有图片文件时读内嵌图片的文件头
+
+    Args:
+        label_file(LabelFile): 读入的标注文件
+
+    Returns:
+        tuple: (宽, 高)，都读不到时返回None
+
+    """
+    image_file = label_file.resolve_image_path()
+    if image_file is not None:
+        return read_image_size(image_file)
+    embedded = label_file.read_embedded_base64()
+    if not embedded:
+        return None
+    # 文件头在最前面，只解码前64KB的base64
+    return read_image_size(io.BytesIO(base64.b64decode(embedded[:64 * 1024 // 3 * 4])))
+
+
+def shape_geometry(shape_type, points):
+    """计算一个形状的外接框与面积
+
+    Args:
+        shape_type(str): 形状类型
+        points(list): [[x, y], ...]
+
+    Returns:
+        tuple: (xmin, ymin, xmax, ymax, area)，没有顶点时全为None
+
+    """
+    if not points:
+        return None, None, None, None, None
+    if shape_type == "circle" and len(points) >= 2:
+        (cx, cy), (px, py) = points[0], points[1]
+        radius = math.hypot(px - cx, py - cy)
+        return cx - radius, cy - radius, cx + radius, cy + radius, math.pi * radius * radius
+    xs = [point[0] for point in points]
+    ys = [point[1] for point in points]
+    xmin, ymin, xmax, ymax = min(xs), min(ys), max(xs), max(ys)
+    if shape_type == "rectangle":
+        area = (xmax - xmin) * (ymax - ymin)
+    elif shape_type == "polygon" and len(points) >= 3:
+        # 鞋带公式
+        area = abs(sum(x0 * y1 - x1 * y0 for x0, y0, x1, y1 in
+                       zip(xs, ys, xs[1:] + xs[:1], ys[1:] + ys[:1]))) / 2
+    else:
+        area = 0.0
+    return xmin, ymin, xmax, ymax, area
+
+
+def read_annotation(json_path):
+    """读取一个标注文件，图片尺寸优先用json中的imageWidth、imageHeight，没有时只读文件头
+
+    Args:
+        json_path(str): 标注文件的路径
+
+    Returns:
+        Annotation: 读取结果
+
+    """
+    from label_file import LabelFile
+    label_file = LabelFile(json_path)
+    width, height = label_file.imageWidth, label_file.imageHeight
+    if not width or not height:
+        width, height = header_size(label_file) or (None, None)
+    image_path = label_file.resolve_image_path()
+    if image_path is None and label_file.imagePath:
+        image_path = osp.join(osp.dirname(json_path), label_file.imagePath.replace("\\", "/"))
+    shapes = [(shape["label"], shape["shape_type"], shape["group_id"], shape["points"])
+              for shape in label_file.shapes]
+    return Annotation(json_path, image_path, width, height, shapes)
+
+
+def _map_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
+
+def parallel_map(func, items, workers=None, chunksize=CHUNK_SIZE):
+    """在进程池中按顺序对每一项执行func
+
+    同时提交的块数有上限，主进程处理得慢时子进程会等待，结果不会在内存中越积越多
+
+    Args:
+        func(callable): 模块顶层的函数
+        items(iterable): 参数
+        workers(int): 进程数，默认为CPU核数减一，为1时在当前进程中执行
+        chunksize(int): 每次交给子进程的项数
+
+    Yields:
+        func的结果，顺序与items相同
+
+    """
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+    iterator = iter(items)
+    chunks = iter(lambda: list(itertools.islice(iterator, chunksize)), [])
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        pending = collections.deque(executor.submit(_map_chunk, func, chunk)
+                                    for chunk in itertools.islice(chunks, workers * 2))
+        while pending:
+            results = pending.popleft().result()
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(executor.submit(_map_chunk, func, chunk))
+            for result in results:
+                yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class Throughput(object):
+    """统计并在标准错误上定期显示处理速度
+
+    Attributes:
+        total(int): 需要处理的文件数，未知时为None
+        files(int): 已处理的文件数
+        items(int): 已处理的形状（或其它单位）数
+        unit(str): items的单位
+
+    """
+    def __init__(self, total=None, unit="shapes", interval=1.0, stream=None):
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.files = 0
+        self.items = 0
+        self.start = time.perf_counter()
+        self._last = self.start
+
+    def update(self, files=1, items=0):
+        self.files += files
+        self.items += items
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.stream.write("\r" + self.status())
+            self.stream.flush()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def status(self):
+        elapsed = max(self.elapsed(), 1e-9)
+        done = "{}/{}".format(self.files, self.total) if self.total is not None else str(self.files)
+        return "{} files, {} {} in {:.1f}s ({:.0f} files/s, {:.0f} {}/s)".format(
+            done, self.items, self.unit, elapsed, self.files / elapsed, self.items / elapsed, self.unit)
+
+    def finish(self):
+        self.stream.write("\r" + self.status() + "\n")
+        self.stream.flush()
@@ -0,0 +1,431 @@
+"""把文件夹（包括子文件夹）中的标注批量导出为COCO、Pascal VOC或YOLO格式（不依赖Qt）
+
+标注文件在进程池中解析，图片尺寸取json中的imageWidth、imageHeight，没有时只读图片的文件头；
+转换为目标格式的文本片段也在子进程中完成，主进程只按文件顺序编号、写入，类别编号与进程数无关。
+COCO的images边解析边写入输出文件，annotations先写入同一目录下的临时文件，最后再拼接，
+内存占用与形状总数无关::
+
+    python -m formats.export 文件夹 输出 --format coco|voc|yolo [--labels labels.txt] [--workers N]
+
+输出：coco为一个json文件；voc为输出文件夹下的Annotations/*.xml与labels.txt；
+yolo为输出文件夹下的labels/*.txt与classes.txt（--yolo-task segment时写多边形）
+
+"""
+import argparse
+import collections
+import functools
+import io
+import json
+import os
+import os.path as osp
+import shutil
+import sys
+import tempfile
+from xml.sax.saxutils import escape
+
+import serializer
+from .dataset import Throughput, iter_label_files, parallel_map, read_annotation, shape_geometry
+
+FORMATS = ("coco", "voc", "yolo")
+YOLO_TASKS = ("detect", "segment")
+IGNORED_LABELS = ("__ignore__", "_background_")  # labelme的labels.txt中不作为类别的行
+
+
+def read_labels(filename):
+    """读取类别文件：每行一个标签，空行与IGNORED_LABELS被跳过
+
+    Args:
+        filename(str): 类别文件的路径
+
+    Returns:
+        list: 标签，顺序即类别编号的顺序
+
+    """
+    with io.open(filename, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and line not in IGNORED_LABELS]
+
+
+class Categories(object):
+    """标签到类别编号的映射
+
+    给出类别文件时编号固定，文件中没有的标签被跳过；否则按标签第一次出现的顺序编号
+
+    Attributes:
+        labels(list): 已编号的标签
+        fixed(bool): 是否只使用给出的标签
+
+    """
+    def __init__(self, labels=None):
+        self.fixed = labels is not None
+        self.labels = list(labels or [])
+        self._ids = {label: i for i, label in enumerate(self.labels)}
+
+    def index(self, label):
+        """
+        Returns:
+            int: 从0开始的类别编号，跳过的标签为None
+
+        """
+        index = self._ids.get(label)
+        if index is None and not self.fixed:
+            index = self._ids[label] = len(self.labels)
+            self.labels.append(label)
+        return index
+
+
+def _flatten(points):
+    return [coordinate for point in points for coordinate in point]
+
+
+def _rectangle_polygon(xmin, ymin, xmax, ymax):
+    return [[xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax]]
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def coco_items(shapes, skipped):
+    """把一张图片的形状转换为COCO的annotation（不含id、image_id与category_id）
+
+    polygon与rectangle写为segmentation，label与group_id都相同的多个形状合并为一个实例；
+    point与line没有面积，写为keypoints（每个顶点的可见性为2）
+
+    Args:
+        shapes(list): Annotation.shapes
+        skipped(Counter): 按原因统计跳过的形状
+
+    Returns:
+        list: [(label, annotation的json文本去掉开头的"{")]
+
+    """
+    # 实例按第一个形状出现的顺序排列，keypoints的实例只有一个形状
+    instances = collections.OrderedDict()
+    for index, (label, shape_type, group_id, points) in enumerate(shapes):
+        if shape_type in ("polygon", "rectangle"):
+            key = (label, group_id) if group_id is not None else index
+            instances.setdefault(key, (label, []))[1].append((shape_type, points))
+        elif shape_type in ("point", "line"):
+            instances[index] = (label, [(shape_type, points)])
+        else:
+            skipped["type " + str(shape_type)] += 1
+    items = []
+    for label, parts in instances.values():
+        shape_type, points = parts[0]
+        if shape_type in ("point", "line"):
+            xmin, ymin, xmax, ymax, _ = shape_geometry(shape_type, points)
+            if xmin is None:
+                continue
+            keypoints = []
+            for x, y in points:
+                keypoints.extend((x, y, 2))
+            items.append((label, {"segmentation": [], "area": 0.0, "bbox": [xmin, ymin, xmax - xmin, ymax - ymin],
+                                  "iscrowd": 0, "keypoints": keypoints, "num_keypoints": len(points)}))
+            continue
+        segmentation = []
+        boxes = []
+        area = 0.0
+        for shape_type, points in parts:
+            xmin, ymin, xmax, ymax, part_area = shape_geometry(shape_type, points)
+            if xmin is None:
+                continue
+            if shape_type == "rectangle":
+                points = _rectangle_polygon(xmin, ymin, xmax, ymax)
+            segmentation.append(_flatten(points))
+            boxes.append((xmin, ymin, xmax, ymax))
+            area += part_area
+        if boxes:
+            xmin, ymin = min(box[0] for box in boxes), min(box[1] for box in boxes)
+            xmax, ymax = max(box[2] for box in boxes), max(box[3] for box in boxes)
+            items.append((label, {"segmentation": segmentation, "area": area,
+                                  "bbox": [xmin, ymin, xmax - xmin, ymax - ymin], "iscrowd": 0}))
+    return [(label, _dumps(annotation)[1:]) for label, annotation in items]
+
+
+def voc_items(shapes, skipped):
+    """把一张图片的形状转换为Pascal VOC的object，polygon、rectangle与line写为外接框，point没有框而被跳过
+
+    Returns:
+        list: [(label, object元素的xml文本)]
+
+    """
+    items = []
+    for label, shape_type, group_id, points in shapes:
+        if shape_type not in ("polygon", "rectangle", "line"):
+            skipped["type " + str(shape_type)] += 1
+            continue
+        xmin, ymin, xmax, ymax, _ = shape_geometry(shape_type, points)
+        if xmin is None:
+            continue
+        items.append((label, (
+            "  <object>\n    <name>{}</name>\n    <pose>Unspecified</pose>\n"
+            "    <truncated>0</truncated>\n    <difficult>0</difficult>\n"
+            "    <bndbox>\n      <xmin>{}</xmin>\n      <ymin>{}</ymin>\n"
+            "      <xmax>{}</xmax>\n      <ymax>{}</ymax>\n    </bndbox>\n  </object>\n").format(
+                escape(str(label)), int(round(xmin)), int(round(ymin)), int(round(xmax)), int(round(ymax)))))
+    return items
+
+
+def yolo_items(shapes, width, height, task, skipped):
+    """把一张图片的形状转换为YOLO的行（不含类别），坐标按图片宽高归一化到[0, 1]
+
+    detect: polygon、rectangle与line写为外接框（中心x 中心y 宽 高）
+    segment: polygon与rectangle写为多边形（x1 y1 x2 y2 ...）
+
+    Returns:
+        list: [(label, 行中类别之后的文本)]
+
+    """
+    types = ("polygon", "rectangle", "line") if task == "detect" else ("polygon", "rectangle")
+    scale_x, scale_y = 1.0 / width, 1.0 / height
+    items = []
+    for label, shape_type, group_id, points in shapes:
+        if shape_type not in types:
+            skipped["type " + str(shape_type)] += 1
+            continue
+        xmin, ymin, xmax, ymax, _ = shape_geometry(shape_type, points)
+        if xmin is None:
+            continue
+        if task == "detect":
+            values = ((xmin + xmax) / 2 * scale_x, (ymin + ymax) / 2 * scale_y,
+                      (xmax - xmin) * scale_x, (ymax - ymin) * scale_y)
+        else:
+            if shape_type == "rectangle":
+                points = _rectangle_polygon(xmin, ymin, xmax, ymax)
+            values = [coordinate for x, y in points for coordinate in (x * scale_x, y * scale_y)]
+        items.append((label, "".join(" {:.6f}".format(min(max(value, 0.0), 1.0)) for value in values)))
+    return items
+
+
+def convert_file(target, yolo_task, json_path):
+    """在子进程中读取一个标注文件并转换为目标格式的片段，主进程只需编号和写入
+
+    Args:
+        target(str): FORMATS之一
+        yolo_task(str): YOLO_TASKS之一
+        json_path(str): 标注文件的路径
+
+    Returns:
+        tuple: (json_path, 去掉shapes的Annotation, [(label, 片段)], 跳过的形状的Counter, 错误信息)，
+        出错时只有json_path与错误信息
+
+    """
+    try:
+        annotation = read_annotation(json_path)
+    except Exception as e:
+        return json_path, None, None, None, "{}: {}".format(type(e).__name__, e)
+    if not (annotation.width and annotation.height):
+        return json_path, None, None, None, "unknown image size"
+    skipped = collections.Counter()
+    if target == "coco":
+        items = coco_items(annotation.shapes, skipped)
+    elif target == "voc":
+        items = voc_items(annotation.shapes, skipped)
+    else:
+        items = yolo_items(annotation.shapes, annotation.width, annotation.height, yolo_task, skipped)
+    return json_path, annotation._replace(shapes=None), items, skipped, None
+
+
+class CocoWriter(object):
+    """流式写入一个COCO json：images直接写入，annotations先写入同一目录下的临时文件，关闭时再拼接"""
+    def __init__(self, filename, categories):
+        self.filename = filename
+        self.categories = categories
+        self.skipped = collections.Counter()
+        self.image_id = 0
+        self.annotation_id = 0
+        directory = osp.dirname(osp.abspath(filename))
+        if not osp.isdir(directory):
+            os.makedirs(directory)
+        self._temp_path = "{}.{}.tmp".format(filename, os.getpid())
+        self._file = io.open(self._temp_path, "w", encoding="utf-8")
+        self._annotations = tempfile.TemporaryFile("w+", encoding="utf-8", dir=directory)
+        self._file.write('{\n"info": {"description": "labelall export", "version": "%s"},\n'
+                         '"licenses": [],\n"images": [' % serializer.VERSION)
+
+    def write(self, annotation, name, items):
+        """
+        写入一张图片及其形状
+
+        Args:
+            annotation(Annotation): 读取结果
+            name(str): 图片相对于导出文件夹的路径
+            items(list): coco_items的结果
+
+        Returns:
+            int: 写入的实例数
+
+        """
+        self.image_id += 1
+        image = {"id": self.image_id, "file_name": name, "width": annotation.width, "height": annotation.height}
+        self._file.write((",\n" if self.image_id > 1 else "\n") + _dumps(image))
+        lines = []
+        for label, body in items:
+            category = self.categories.index(label)
+            if category is None:
+                self.skipped["label " + str(label)] += 1
+                continue
+            self.annotation_id += 1
+            lines.append('{"id":%d,"image_id":%d,"category_id":%d,%s' % (
+                self.annotation_id, self.image_id, category + 1, body))
+        if lines:
+            self._annotations.write(("\n" if self.annotation_id == len(lines) else ",\n") + ",\n".join(lines))
+        return len(lines)
+
+    def close(self):
+        """拼接annotations并写入categories，完成后才替换目标文件"""
+        self._file.write('\n],\n"annotations": [')
+        self._annotations.seek(0)
+        shutil.copyfileobj(self._annotations, self._file, 1024 * 1024)
+        self._annotations.close()
+        categories = [{"id": i + 1, "name": label, "supercategory": "none"}
+                      for i, label in enumerate(self.categories.labels)]
+        self._file.write('\n],\n"categories": [\n%s\n]\n}\n' % ",\n".join(map(_dumps, categories)))
+        self._file.close()
+        os.replace(self._temp_path, self.filename)
+
+    def abort(self):
+        self._annotations.close()
+        self._file.close()
+        if osp.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+class VocWriter(object):
+    """每张图片写一个Pascal VOC的xml（Annotations/图片的相对路径.xml），关闭时写入labels.txt"""
+    def __init__(self, directory, categories):
+        self.directory = directory
+        self.categories = categories
+        self.skipped = collections.Counter()
+
+    def write(self, annotation, name, items):
+        objects = []
+        for label, text in items:
+            if self.categories.index(label) is None:
+                self.skipped["label " + str(label)] += 1
+            else:
+                objects.append(text)
+        folder, filename = osp.split(name)
+        text = ("<annotation>\n  <folder>{}</folder>\n  <filename>{}</filename>\n"
+                "  <size>\n    <width>{}</width>\n    <height>{}</height>\n    <depth>3</depth>\n  </size>\n"
+                "  <segmented>0</segmented>\n{}</annotation>\n").format(
+            escape(folder), escape(filename), annotation.width, annotation.height, "".join(objects))
+        _write_text(osp.join(self.directory, "Annotations", osp.splitext(name)[0] + ".xml"), text)
+        return len(objects)
+
+    def close(self):
+        _write_text(osp.join(self.directory, "labels.txt"), "".join(label + "\n" for label in self.categories.labels))
+
+    def abort(self):
+        pass
+
+
+class YoloWriter(object):
+    """每张图片写一个YOLO的txt（labels/图片的相对路径.txt），关闭时写入classes.txt"""
+    def __init__(self, directory, categories):
+        self.directory = directory
+        self.categories = categories
+        self.skipped = collections.Counter()
+
+    def write(self, annotation, name, items):
+        lines = []
+        for label, text in items:
+            category = self.categories.index(label)
+            if category is None:
+                self.skipped["label " + str(label)] += 1
+            else:
+                lines.append("{}{}\n".format(category, text))
+        _write_text(osp.join(self.directory, "labels", osp.splitext(name)[0] + ".txt"), "".join(lines))
+        return len(lines)
+
+    def close(self):
+        _write_text(osp.join(self.directory, "classes.txt"), "".join(label + "\n" for label in self.categories.labels))
+
+    def abort(self):
+        pass
+
+
+def _write_text(path, text):
+    directory = osp.dirname(path)
+    if not osp.isdir(directory):
+        os.makedirs(directory)
+    with io.open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def export(folder, output, format="coco", labels=None, workers=None, yolo_task="detect", progress=True):
+    """导出文件夹中的所有标注
+
+    Args:
+        folder(str): 标注所在的文件夹
+        output(str): coco时为输出的json文件，否则为输出文件夹
+        format(str): FORMATS之一
+        labels(list): 类别，为None时按标签第一次出现的顺序编号
+        workers(int): 解析标注的进程数，默认为CPU核数减一
+        yolo_task(str): YOLO_TASKS之一
+        progress(bool): 是否在标准错误上显示进度
+
+    Returns:
+        dict: 统计信息：files、images、annotations、skipped（按原因计数）、errors（[(文件, 原因)]）、seconds
+
+    """
+    assert format in FORMATS and yolo_task in YOLO_TASKS
+    categories = Categories(labels)
+    writer = {"coco": CocoWriter, "voc": VocWriter, "yolo": YoloWriter}[format](output, categories)
+    paths = list(iter_label_files(folder))
+    throughput = Throughput(len(paths), unit="annotations", stream=None if progress else io.StringIO())
+    skipped = collections.Counter()
+    errors = []
+    images = 0
+    try:
+        for json_path, annotation, items, file_skipped, error in parallel_map(
+                functools.partial(convert_file, format, yolo_task), paths, workers):
+            count = 0
+            if error is not None:
+                errors.append((json_path, error))
+            else:
+                image_path = annotation.image_path or json_path
+                name = osp.relpath(image_path, folder).replace(os.sep, "/")
+                if name.startswith("../"):
+                    # 图片在导出的文件夹之外，按标注文件的位置命名
+                    name = osp.splitext(osp.relpath(json_path, folder))[0].replace(os.sep, "/") + \
+                        osp.splitext(image_path)[1]
+                count = writer.write(annotation, name, items)
+                skipped.update(file_skipped)
+                images += 1
+            throughput.update(items=count)
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    throughput.finish()
+    skipped.update(writer.skipped)
+    return {"files": len(paths), "images": images, "annotations": throughput.items,
+            "skipped": dict(skipped), "errors": errors, "seconds": throughput.elapsed()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m formats.export", description=__doc__.split("\n")[0])
+    parser.add_argument("folder", help="folder containing labelme json or binary annotation files")
+    parser.add_argument("output", help="output json file for coco, output folder for voc and yolo")
+    parser.add_argument("--format", choices=FORMATS, default="coco")
+    parser.add_argument("--labels", help="text file with one label per line, fixes the category order")
+    parser.add_argument("--workers", type=int, default=None, help="number of parsing processes")
+    parser.add_argument("--yolo-task", choices=YOLO_TASKS, default="detect")
+    args = parser.parse_args(argv)
+    labels = read_labels(args.labels) if args.labels else None
+    summary = export(args.folder, args.output, args.format, labels, args.workers, args.yolo_task)
+    seconds = max(summary["seconds"], 1e-9)
+    print("exported {images}/{files} images, {annotations} annotations in {seconds:.2f}s".format(**summary))
+    print("throughput: {:.0f} files/s, {:.0f} annotations/s".format(
+        summary["files"] / seconds, summary["annotations"] / seconds))
+    for reason, count in sorted(summary["skipped"].items()):
+        print("skipped {} shapes with {}".format(count, reason))
+    for json_path, error in summary["errors"]:
+        print("error: {}: {}".format(json_path, error), file=sys.stderr)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
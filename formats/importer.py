@@ -0,0 +1,553 @@
+"""把COCO、Pascal VOC或YOLO数据集导入为每张图片一个labelme json（不依赖Qt）
+
+COCO的json可能有几个GB，不会整个读入：JsonStream按块读取文件，只逐个解析images、annotations、categories
+数组中的元素。annotations按image_id分组时先放在内存中，超过内存预算后转存到磁盘上的临时SQLite数据库；
+annotation保存的是原始的json文本，在进程池中写每张图片的json时才解析::
+
+    python -m formats.importer 数据集 输出文件夹 --format coco|voc|yolo [--images 图片文件夹]
+        [--workers N] [--suffix .json|.lmb] [--classes classes.txt]
+
+数据集：coco为annotations的json文件；voc为xml所在的文件夹；yolo为txt所在的文件夹，可以是formats.export
+的输出文件夹或其中的labels文件夹（txt的相对路径去掉开头的labels/之后与图片对应；类别默认从该文件夹或
+上一级文件夹的classes.txt读取，图片尺寸从--images中同名图片的文件头读取）。json写在输出文件夹中与图片
+相同的相对位置，imagePath为图片相对于json的路径（--images默认为输出文件夹）
+
+"""
+import argparse
+import collections
+import functools
+import io
+import json
+import os
+import os.path as osp
+import re
+import sqlite3
+import sys
+import tempfile
+import xml.etree.ElementTree as ElementTree
+
+import serializer
+from label_file import LabelFile
+from utils import read_image_size
+from .dataset import Throughput, parallel_map
+
+FORMATS = ("coco", "voc", "yolo")
+CHUNK_CHARS = 16 * 1024 * 1024  # JsonStream每次读取的字符数
+MAX_VALUE_CHARS = 256 * 1024 * 1024  # 单个值的长度上限，超过时按格式错误处理，避免把错误的文件整个读入
+MEMORY_BUDGET = 256 * 1024 * 1024  # 内存中分组的annotation文本总长度上限，超过后转存到磁盘
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+COCO_SECTIONS = ("images", "annotations", "categories")
+YOLO_CLASSES = "classes.txt"
+YOLO_LABELS = "labels"  # formats.export写YOLO txt的子文件夹
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JsonStream(object):
+    """按块读取一个json文件，逐个解析顶层对象中数组的元素，内存中只保留一个块
+
+    Attributes:
+        file(file): 以文本方式打开的文件
+        buffer(str): 当前的块
+        pos(int): buffer中下一个未读的字符
+
+    """
+    def __init__(self, file, chunk_chars=CHUNK_CHARS):
+        self.file = file
+        self.chunk_chars = chunk_chars
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _more(self):
+        chunk = self.file.read(self.chunk_chars)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """跳过空白，返回下一个字符，文件结束时返回空字符串"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._more():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError("Expected {!r} but found {!r}".format(char, found))
+        self.pos += 1
+
+    def value(self):
+        """
+        解析下一个完整的json值
+
+        Returns:
+            tuple: (值, 值的原始文本)
+
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                # 值被块的边界截断了，读入下一块后重新解析
+                if len(self.buffer) - self.pos < MAX_VALUE_CHARS and self._more():
+                    continue
+                raise
+            # 块末尾的数字可能不完整
+            if end == len(self.buffer) and self._more():
+                continue
+            text = self.buffer[self.pos:end]
+            self.pos = end
+            return value, text
+
+    def items(self, arrays):
+        """
+        遍历顶层对象：arrays中的键逐个给出数组的元素，其它键给出整个值
+
+        Args:
+            arrays(tuple): 需要逐个元素解析的数组的键
+
+        Yields:
+            tuple: (键, 值, 原始文本)
+
+        """
+        self.expect("{")
+        while self.peek() != "}":
+            key, _ = self.value()
+            self.expect(":")
+            if key in arrays and self.peek() == "[":
+                self.pos += 1
+                while self.peek() != "]":
+                    value, text = self.value()
+                    yield key, value, text
+                    if self.peek() == ",":
+                        self.pos += 1
+                self.pos += 1
+            else:
+                value, text = self.value()
+                yield key, value, text
+            if self.peek() == ",":
+                self.pos += 1
+        self.pos += 1
+
+
+class AnnotationGroups(object):
+    """按image_id分组保存annotation的原始文本，总长度超过内存预算后全部转存到磁盘上的临时SQLite数据库
+
+    Attributes:
+        count(int): 加入的annotation数
+        popped(int): 已经取出的annotation数
+        spilled(bool): 是否已经转存到磁盘
+
+    """
+    def __init__(self, memory_budget=MEMORY_BUDGET, directory=None):
+        self.memory_budget = memory_budget
+        self.directory = directory
+        self.count = 0
+        self.popped = 0
+        self.spilled = False
+        self._groups = collections.defaultdict(list)
+        self._size = 0
+        self._connection = None
+        self._path = None
+        self._batch = []
+
+    def add(self, image_id, text):
+        self.count += 1
+        if self.spilled:
+            self._batch.append((image_id, text))
+            if len(self._batch) >= 10000:
+                self._flush()
+            return
+        self._groups[image_id].append(text)
+        self._size += len(text)
+        if self._size > self.memory_budget:
+            self._spill()
+
+    def _spill(self):
+        handle, path = tempfile.mkstemp(suffix=".sqlite", dir=self.directory)
+        os.close(handle)
+        self._connection = sqlite3.connect(path)
+        self._path = path
+        self._connection.execute("PRAGMA journal_mode=OFF")
+        self._connection.execute("PRAGMA synchronous=OFF")
+        self._connection.execute("CREATE TABLE annotations(image_id, data TEXT)")
+        self.spilled = True
+        for image_id, texts in self._groups.items():
+            self._batch.extend((image_id, text) for text in texts)
+        self._groups.clear()
+        self._flush()
+
+    def _flush(self):
+        self._connection.executemany("INSERT INTO annotations VALUES (?, ?)", self._batch)
+        self._batch = []
+
+    def finish(self):
+        """全部加入后调用，磁盘上的数据建立按image_id的索引"""
+        if self.spilled:
+            self._flush()
+            self._connection.execute("CREATE INDEX annotations_image ON annotations(image_id)")
+            self._connection.commit()
+
+    def pop(self, image_id):
+        """
+        取出一张图片的所有annotation
+
+        Returns:
+            list: 原始json文本，按加入的顺序
+
+        """
+        if self.spilled:
+            rows = self._connection.execute(
+                "SELECT data FROM annotations WHERE image_id = ? ORDER BY rowid", (image_id,))
+            texts = [data for data, in rows]
+        else:
+            texts = self._groups.pop(image_id, [])
+        self.popped += len(texts)
+        return texts
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            os.remove(self._path)
+
+
+def _label_path(output, name, suffix):
+    return osp.join(output, osp.splitext(name.replace("/", os.sep))[0] + suffix)
+
+
+def _image_path(json_path, images, name):
+    """json中记录的imagePath：图片相对于json的路径"""
+    image_file = osp.join(images, name.replace("/", os.sep))
+    return osp.relpath(image_file, osp.dirname(json_path)).replace(os.sep, "/")
+
+
+def _write(json_path, images, name, width, height, shapes):
+    directory = osp.dirname(json_path)
+    if not osp.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    data = serializer.to_dict(shapes, _image_path(json_path, images, name), None, height, width)
+    # 导入生成的是新文件，逐个fsync只会让导入变慢
+    LabelFile.write(json_path, data, fsync=False)
+
+
+def _shape(label, shape_type, points, group_id=None):
+    return {"label": label, "points": points, "group_id": group_id, "shape_type": shape_type, "flags": {}}
+
+
+def _pairs(values):
+    return [[values[i], values[i + 1]] for i in range(0, len(values) - 1, 2)]
+
+
+def coco_shapes(annotation, label, group_id, skipped):
+    """把一个COCO annotation转换为labelme的形状
+
+    多边形的segmentation为多边形（有多个多边形时用group_id把它们连在一起，与导出时的合并对应），
+    与bbox四个角相同的多边形还原为rectangle；RLE无法还原为多边形，用bbox代替；
+    没有segmentation时keypoints中可见的点为point（两个点时为line），否则用bbox
+
+    Args:
+        annotation(dict): COCO annotation
+        label(str): 类别名
+        group_id(int): 多个多边形时使用的组号
+        skipped(Counter): 按原因统计
+
+    Returns:
+        list: 形状
+
+    """
+    segmentation = annotation.get("segmentation")
+    bbox = annotation.get("bbox")
+    if isinstance(segmentation, list) and segmentation:
+        polygons = [polygon for polygon in segmentation if isinstance(polygon, list) and len(polygon) >= 6]
+        shapes = []
+        for polygon in polygons:
+            xs, ys = polygon[0::2], polygon[1::2]
+            xmin, ymin, xmax, ymax = min(xs), min(ys), max(xs), max(ys)
+            if len(polygon) == 8 and polygon == [xmin, ymin, xmax, ymin, xmax, ymax, xmin, ymax]:
+                shapes.append(_shape(label, "rectangle", [[xmin, ymin], [xmax, ymax]]))
+            else:
+                shapes.append(_shape(label, "polygon", _pairs(polygon)))
+        if len(shapes) > 1:
+            for shape in shapes:
+                shape["group_id"] = group_id
+        if shapes:
+            return shapes
+    elif isinstance(segmentation, dict):
+        skipped["rle as rectangle"] += 1
+    keypoints = annotation.get("keypoints")
+    if not segmentation and keypoints:
+        points = [[x, y] for x, y, visibility in zip(keypoints[0::3], keypoints[1::3], keypoints[2::3])
+                  if visibility > 0]
+        if len(points) == 2:
+            return [_shape(label, "line", points)]
+        if points:
+            return [_shape(label, "point", [point]) for point in points]
+    if bbox and len(bbox) == 4:
+        x, y, w, h = bbox
+        return [_shape(label, "rectangle", [[x, y], [x + w, y + h]])]
+    skipped["annotation without geometry"] += 1
+    return []
+
+
+def _write_coco_image(output, images, suffix, categories, item):
+    image, texts = item
+    name = image["file_name"]
+    json_path = _label_path(output, name, suffix)
+    skipped = collections.Counter()
+    try:
+        shapes = []
+        for index, text in enumerate(texts):
+            annotation = json.loads(text)
+            label = categories.get(annotation.get("category_id"))
+            if label is None:
+                skipped["unknown category"] += 1
+                continue
+            shapes.extend(coco_shapes(annotation, label, index, skipped))
+        _write(json_path, images, name, image.get("width"), image.get("height"), shapes)
+    except Exception as e:
+        return json_path, 0, skipped, "{}: {}".format(type(e).__name__, e)
+    return json_path, len(shapes), skipped, None
+
+
+def read_coco(filename, memory_budget=MEMORY_BUDGET, spill_directory=None):
+    """流式读取COCO的json
+
+    Args:
+        filename(str): annotations的json文件
+        memory_budget(int): 见AnnotationGroups
+        spill_directory(str): 转存的临时数据库所在的文件夹，默认为系统的临时文件夹
+
+    Returns:
+        tuple: (images列表[{id, file_name, width, height}], {category_id: name}, AnnotationGroups)
+
+    """
+    images = []
+    categories = {}
+    groups = AnnotationGroups(memory_budget, spill_directory)
+    try:
+        with io.open(filename, "r", encoding="utf-8") as f:
+            for key, value, text in JsonStream(f).items(COCO_SECTIONS):
+                if key == "annotations":
+                    groups.add(value.get("image_id"), text)
+                elif key == "images":
+                    images.append({"id": value.get("id"), "file_name": value.get("file_name"),
+                                   "width": value.get("width"), "height": value.get("height")})
+                elif key == "categories":
+                    categories[value.get("id")] = value.get("name")
+        groups.finish()
+    except BaseException:
+        groups.close()
+        raise
+    return images, categories, groups
+
+
+def _voc_items(source):
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(".xml"):
+                yield osp.join(root, name)
+
+
+def _write_voc_image(output, images, suffix, xml_path):
+    skipped = collections.Counter()
+    json_path = xml_path
+    try:
+        root = ElementTree.parse(xml_path).getroot()
+        filename = root.findtext("filename") or osp.splitext(osp.basename(xml_path))[0] + ".jpg"
+        folder = root.findtext("folder") or ""
+        # VOC的folder通常是数据集名（如VOC2007），只有图片确实在该子文件夹中时才保留
+        name = filename
+        if folder and osp.isfile(osp.join(images, folder, filename)):
+            name = folder + "/" + filename
+        json_path = _label_path(output, name, suffix)
+        width = int(float(root.findtext("size/width") or 0)) or None
+        height = int(float(root.findtext("size/height") or 0)) or None
+        if not (width and height):
+            width, height = read_image_size(osp.join(images, name)) or (None, None)
+        shapes = []
+        for element in root.iter("object"):
+            box = element.find("bndbox")
+            if box is None:
+                skipped["object without bndbox"] += 1
+                continue
+            xmin, ymin, xmax, ymax = (float(box.findtext(key)) for key in ("xmin", "ymin", "xmax", "ymax"))
+            shapes.append(_shape(element.findtext("name"), "rectangle", [[xmin, ymin], [xmax, ymax]]))
+        _write(json_path, images, name, width, height, shapes)
+    except Exception as e:
+        return json_path, 0, skipped, "{}: {}".format(type(e).__name__, e)
+    return json_path, len(shapes), skipped, None
+
+
+def _find_image(images, stem):
+    for suffix in IMAGE_SUFFIXES:
+        for candidate in (stem + suffix, stem + suffix.upper()):
+            if osp.isfile(osp.join(images, candidate)):
+                return candidate.replace(os.sep, "/")
+    return None
+
+
+def _yolo_items(source):
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(".txt") and name != YOLO_CLASSES:
+                yield osp.join(root, name)
+
+
+def _yolo_stem(source, txt_path):
+    """txt对应的图片（去掉扩展名）的相对路径：formats.export把txt写在labels/之下，与图片的位置相差这一层"""
+    stem = osp.splitext(osp.relpath(txt_path, source))[0].replace(os.sep, "/")
+    if stem.startswith(YOLO_LABELS + "/"):
+        stem = stem[len(YOLO_LABELS) + 1:]
+    return stem
+
+
+def read_yolo_classes(source, classes_path=None):
+    """读取YOLO的类别名，第几行即是第几类
+
+    Args:
+        source(str): txt所在的文件夹
+        classes_path(str): 类别文件，为None时依次查找source和它上一级文件夹（formats.export的输出文件夹，
+            source为其中的labels时）中的classes.txt
+
+    Returns:
+        list: 类别名，找不到类别文件时为空（按类别编号命名）
+
+    """
+    if classes_path is None:
+        source = osp.abspath(source)
+        candidates = [osp.join(source, YOLO_CLASSES), osp.join(osp.dirname(source), YOLO_CLASSES)]
+        classes_path = next((path for path in candidates if osp.isfile(path)), None)
+        if classes_path is None:
+            return []
+    with io.open(classes_path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _write_yolo_image(output, images, suffix, source, classes, txt_path):
+    skipped = collections.Counter()
+    stem = _yolo_stem(source, txt_path)
+    name = _find_image(images, stem)
+    json_path = _label_path(output, (name or stem).replace(os.sep, "/"), suffix)
+    if name is None:
+        return json_path, 0, skipped, "image not found for {}".format(stem)
+    try:
+        size = read_image_size(osp.join(images, name))
+        if size is None:
+            return json_path, 0, skipped, "unknown image size"
+        width, height = size
+        shapes = []
+        with io.open(txt_path, "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if not fields:
+                    continue
+                index = int(fields[0])
+                label = classes[index] if 0 <= index < len(classes) else str(index)
+                values = [float(value) for value in fields[1:]]
+                if len(values) == 4:
+                    cx, cy, w, h = values
+                    shapes.append(_shape(label, "rectangle", [[(cx - w / 2) * width, (cy - h / 2) * height],
+                                                             [(cx + w / 2) * width, (cy + h / 2) * height]]))
+                elif len(values) >= 6 and len(values) % 2 == 0:
+                    shapes.append(_shape(label, "polygon", [[x * width, y * height] for x, y in _pairs(values)]))
+                else:
+                    skipped["malformed line"] += 1
+        _write(json_path, images, name, width, height, shapes)
+    except Exception as e:
+        return json_path, 0, skipped, "{}: {}".format(type(e).__name__, e)
+    return json_path, len(shapes), skipped, None
+
+
+def import_dataset(source, output, format="coco", images=None, workers=None, suffix=LabelFile.suffix,
+                   memory_budget=MEMORY_BUDGET, progress=True, classes=None):
+    """导入数据集，每张图片写一个标注文件
+
+    Args:
+        source(str): 数据集（见模块说明）
+        output(str): 输出文件夹
+        format(str): FORMATS之一
+        images(str): 图片所在的文件夹，默认为输出文件夹
+        workers(int): 写入的进程数，默认为CPU核数减一
+        suffix(str): 输出的格式，LabelFile.suffix或LabelFile.binary_suffix
+        memory_budget(int): COCO分组时内存中保存的annotation文本总长度上限
+        progress(bool): 是否在标准错误上显示进度
+        classes(str): YOLO的类别文件，默认见read_yolo_classes
+
+    Returns:
+        dict: 统计信息：files、shapes、skipped（按原因计数）、errors（[(文件, 原因)]）、seconds
+
+    """
+    assert format in FORMATS
+    images = osp.abspath(images or output)
+    output = osp.abspath(output)
+    throughput = Throughput(unit="shapes", stream=None if progress else io.StringIO())
+    skipped = collections.Counter()
+    errors = []
+    groups = None
+    try:
+        if format == "coco":
+            image_list, categories, groups = read_coco(source, memory_budget, output if osp.isdir(output) else None)
+            throughput.total = len(image_list)
+            func = functools.partial(_write_coco_image, output, images, suffix, categories)
+            items = ((image, groups.pop(image["id"])) for image in image_list)
+        elif format == "voc":
+            func = functools.partial(_write_voc_image, output, images, suffix)
+            items = list(_voc_items(source))
+            throughput.total = len(items)
+        else:
+            func = functools.partial(_write_yolo_image, output, images, suffix, source,
+                                     read_yolo_classes(source, classes))
+            items = list(_yolo_items(source))
+            throughput.total = len(items)
+        for json_path, count, file_skipped, error in parallel_map(func, items, workers):
+            if error is not None:
+                errors.append((json_path, error))
+            skipped.update(file_skipped)
+            throughput.update(items=count)
+        if groups is not None and groups.count > groups.popped:
+            # 所有图片的annotation都已取出，剩下的image_id不在images中
+            skipped["annotation without image"] += groups.count - groups.popped
+    finally:
+        if groups is not None:
+            groups.close()
+    throughput.finish()
+    return {"files": throughput.files, "shapes": throughput.items, "skipped": dict(skipped),
+            "errors": errors, "seconds": throughput.elapsed()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m formats.importer", description=__doc__.split("\n")[0])
+    parser.add_argument("source", help="coco json file, or folder of voc xml / yolo txt files")
+    parser.add_argument("output", help="output folder for the labelme json files")
+    parser.add_argument("--format", choices=FORMATS, default="coco")
+    parser.add_argument("--images", help="folder containing the images, defaults to the output folder")
+    parser.add_argument("--workers", type=int, default=None, help="number of writing processes")
+    parser.add_argument("--suffix", choices=(LabelFile.suffix, LabelFile.binary_suffix), default=LabelFile.suffix)
+    parser.add_argument("--memory-budget", type=int, default=MEMORY_BUDGET // (1024 * 1024),
+                        help="MB of coco annotations grouped in memory before spilling to disk")
+    parser.add_argument("--classes", help="yolo class names, defaults to classes.txt in or next to the source")
+    args = parser.parse_args(argv)
+    summary = import_dataset(args.source, args.output, args.format, args.images, args.workers, args.suffix,
+                             args.memory_budget * 1024 * 1024, classes=args.classes)
+    seconds = max(summary["seconds"], 1e-9)
+    print("imported {files} files, {shapes} shapes in {seconds:.2f}s ({rate:.0f} files/s)".format(
+        rate=summary["files"] / seconds, **summary))
+    for reason, count in sorted(summary["skipped"].items()):
+        print("skipped {}: {}".format(reason, count))
+    for json_path, error in summary["errors"]:
+        print("error: {}: {}".format(json_path, error), file=sys.stderr)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
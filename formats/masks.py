@@ -0,0 +1,260 @@
+"""把polygon与rectangle栅格化为语义分割（类别）与实例分割（实例）的PNG掩码（不依赖Qt）
+
+多边形用扫描线填充：每条边与各行中心线的交点一次性用numpy算出，按(行, x)排序后两两配对成区间
+（奇偶规则），区间在差分数组中记为+1/-1，沿行累加后即为填充结果。逐行带（BAND_ROWS行）处理，
+差分数组只覆盖多边形的外接框，超过100MP的图片与上万个顶点的多边形都不需要逐像素的Python循环::
+
+    python -m formats.masks 文件夹 输出 --labels labels.txt [--workers N]
+
+类别文件每行一个标签，可以在标签后写类别编号（"car 3"）；没有编号的标签按顺序编号，
+"_background_"为0，"__ignore__"被跳过。输出：输出/class/与输出/instance/下与图片相对路径相同的PNG，
+类别或实例超过255个时为16位PNG。后面的形状覆盖前面的形状；label与group_id都相同的形状属于同一个实例
+
+"""
+import argparse
+import collections
+import functools
+import io
+import os
+import os.path as osp
+import re
+import sys
+
+import numpy as np
+import PIL.Image
+
+from .dataset import Throughput, iter_label_files, parallel_map, read_annotation
+
+BAND_ROWS = 1024  # 每次填充的行数，限制差分数组的大小
+BACKGROUND_LABEL = "_background_"
+IGNORE_LABEL = "__ignore__"
+
+_INDEXED_LINE = re.compile(r"^(.*?)\s+(\d+)$")
+
+
+def read_label_map(filename):
+    """读取类别文件
+
+    Args:
+        filename(str): 类别文件的路径
+
+    Returns:
+        dict: {标签: 类别编号}
+
+    """
+    label_map = {}
+    next_index = None
+    with io.open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line == IGNORE_LABEL:
+                continue
+            match = _INDEXED_LINE.match(line)
+            if match:
+                label_map[match.group(1)] = int(match.group(2))
+                continue
+            if next_index is None:
+                # 第一行是背景时从0开始编号，否则0留给背景
+                next_index = 0 if line == BACKGROUND_LABEL else 1
+            label_map[line] = next_index
+            next_index += 1
+    return label_map
+
+
+def polygon_spans(points, height, width):
+    """扫描线求多边形覆盖的每一行的区间（奇偶规则），像素中心在多边形内的像素被填充
+
+    Args:
+        points(array): (N, 2)的顶点坐标
+        height(int): 图片高度
+        width(int): 图片宽度
+
+    Returns:
+        tuple: (行, 起始列, 结束列)三个数组，区间为[起始列, 结束列)，已裁剪到图片内
+
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    x0, y0 = points[:, 0], points[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    # 每条边覆盖的行：像素中心y + 0.5落在[min(y0, y1), max(y0, y1))内，水平边不覆盖任何行
+    low = np.maximum(np.ceil(np.minimum(y0, y1) - 0.5), 0).astype(np.int64)
+    high = np.minimum(np.ceil(np.maximum(y0, y1) - 0.5), height).astype(np.int64)
+    counts = np.maximum(high - low, 0)
+    total = int(counts.sum())
+    if total == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    edges = np.repeat(np.arange(len(points)), counts)
+    # 每个交点在所在边的行中的序号
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    rows = low[edges] + offsets
+    center = rows + 0.5
+    slope = (x1 - x0)[edges] / (y1 - y0)[edges]
+    xs = x0[edges] + (center - y0[edges]) * slope
+    order = np.lexsort((xs, rows))
+    rows, xs = rows[order], xs[order]
+    # 同一行的交点个数总是偶数，依次两两配对
+    starts = np.clip(np.ceil(xs[0::2] - 0.5), 0, width).astype(np.int64)
+    ends = np.clip(np.ceil(xs[1::2] - 0.5), 0, width).astype(np.int64)
+    rows = rows[0::2]
+    keep = ends > starts
+    return rows[keep], starts[keep], ends[keep]
+
+
+def fill_polygon(mask, points, value):
+    """在mask上填充一个多边形
+
+    Args:
+        mask(array): (高, 宽)的掩码，原地修改
+        points(list): 顶点坐标
+        value(int): 填充的值
+
+    """
+    height, width = mask.shape
+    rows, starts, ends = polygon_spans(points, height, width)
+    if not len(rows):
+        return
+    left, right = int(starts.min()), int(ends.max())
+    for band in range(int(rows[0]), int(rows[-1]) + 1, BAND_ROWS):
+        # rows已排序，二分查找这一带的区间
+        first, last = np.searchsorted(rows, [band, band + BAND_ROWS])
+        if first == last:
+            continue
+        band_rows = min(BAND_ROWS, height - band)
+        diff = np.zeros((band_rows, right - left + 1), dtype=np.int8)
+        # 同一行的区间互不重叠，起点之间、终点之间都不会重复，可以直接用花式索引
+        diff[rows[first:last] - band, starts[first:last] - left] += 1
+        diff[rows[first:last] - band, ends[first:last] - left] -= 1
+        inside = np.cumsum(diff, axis=1, dtype=np.int8)[:, :-1].astype(bool)
+        mask[band:band + band_rows, left:right][inside] = value
+
+
+def fill_rectangle(mask, points, value):
+    """在mask上填充一个矩形（两个对角点），像素中心在矩形内的像素被填充"""
+    height, width = mask.shape
+    (x0, y0), (x1, y1) = points[0], points[1]
+    left = min(max(int(np.ceil(min(x0, x1) - 0.5)), 0), width)
+    right = min(max(int(np.ceil(max(x0, x1) - 0.5)), 0), width)
+    top = min(max(int(np.ceil(min(y0, y1) - 0.5)), 0), height)
+    bottom = min(max(int(np.ceil(max(y0, y1) - 0.5)), 0), height)
+    mask[top:bottom, left:right] = value
+
+
+def rasterize(shapes, height, width, label_map, skipped=None):
+    """把一张图片的形状栅格化为类别掩码与实例掩码
+
+    Args:
+        shapes(list): Annotation.shapes
+        height(int): 图片高度
+        width(int): 图片宽度
+        label_map(dict): {标签: 类别编号}
+        skipped(Counter): 按原因统计跳过的形状
+
+    Returns:
+        tuple: (类别掩码, 实例掩码, 实例数)，背景为0
+
+    """
+    skipped = skipped if skipped is not None else collections.Counter()
+    dtype = np.uint8 if max(label_map.values(), default=0) < 256 else np.uint16
+    classes = np.zeros((height, width), dtype=dtype)
+    instances = np.zeros((height, width), dtype=np.uint16)
+    instance_ids = {}
+    for index, (label, shape_type, group_id, points) in enumerate(shapes):
+        if shape_type not in ("polygon", "rectangle"):
+            skipped["type " + str(shape_type)] += 1
+            continue
+        value = label_map.get(label)
+        if value is None:
+            skipped["label " + str(label)] += 1
+            continue
+        fill = fill_rectangle if shape_type == "rectangle" else fill_polygon
+        if not points or (shape_type == "rectangle" and len(points) < 2):
+            continue
+        key = (label, group_id) if group_id is not None else index
+        instance = instance_ids.setdefault(key, len(instance_ids) + 1)
+        fill(classes, points, value)
+        fill(instances, points, instance)
+    if len(instance_ids) < 256:
+        instances = instances.astype(np.uint8)
+    return classes, instances, len(instance_ids)
+
+
+def save_mask(filename, mask):
+    """保存为PNG，uint8为8位灰度，uint16为16位灰度"""
+    directory = osp.dirname(filename)
+    if not osp.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    if mask.dtype == np.uint16:
+        image = PIL.Image.fromarray(mask.astype("<u2"), mode="I;16")
+    else:
+        image = PIL.Image.fromarray(mask, mode="L")
+    image.save(filename, optimize=False)
+
+
+def _export_file(folder, output, label_map, json_path):
+    skipped = collections.Counter()
+    try:
+        annotation = read_annotation(json_path)
+        if not (annotation.width and annotation.height):
+            return json_path, 0, skipped, "unknown image size"
+        classes, instances, count = rasterize(annotation.shapes, annotation.height, annotation.width,
+                                              label_map, skipped)
+        name = osp.splitext(osp.relpath(json_path, folder))[0] + ".png"
+        save_mask(osp.join(output, "class", name), classes)
+        save_mask(osp.join(output, "instance", name), instances)
+    except Exception as e:
+        return json_path, 0, skipped, "{}: {}".format(type(e).__name__, e)
+    return json_path, count, skipped, None
+
+
+def export_masks(folder, output, label_map, workers=None, progress=True):
+    """把文件夹中每个标注文件栅格化为掩码
+
+    Args:
+        folder(str): 标注所在的文件夹
+        output(str): 输出文件夹
+        label_map(dict): {标签: 类别编号}
+        workers(int): 进程数，默认为CPU核数减一
+        progress(bool): 是否在标准错误上显示进度
+
+    Returns:
+        dict: 统计信息：files、instances、skipped（按原因计数）、errors（[(文件, 原因)]）、seconds
+
+    """
+    folder, output = osp.abspath(folder), osp.abspath(output)
+    paths = list(iter_label_files(folder))
+    throughput = Throughput(len(paths), unit="instances", stream=None if progress else io.StringIO())
+    skipped = collections.Counter()
+    errors = []
+    # 每个文件的掩码都很大，每块只交给子进程一个文件
+    func = functools.partial(_export_file, folder, output, label_map)
+    for json_path, count, file_skipped, error in parallel_map(func, paths, workers, chunksize=1):
+        if error is not None:
+            errors.append((json_path, error))
+        skipped.update(file_skipped)
+        throughput.update(items=count)
+    throughput.finish()
+    return {"files": len(paths), "instances": throughput.items, "skipped": dict(skipped),
+            "errors": errors, "seconds": throughput.elapsed()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m formats.masks", description=__doc__.split("\n")[0])
+    parser.add_argument("folder", help="folder containing labelme json or binary annotation files")
+    parser.add_argument("output", help="output folder for the class/ and instance/ masks")
+    parser.add_argument("--labels", required=True, help="label map: one label per line, optionally followed by its index")
+    parser.add_argument("--workers", type=int, default=None, help="number of rasterising processes")
+    args = parser.parse_args(argv)
+    summary = export_masks(args.folder, args.output, read_label_map(args.labels), args.workers)
+    seconds = max(summary["seconds"], 1e-9)
+    print("rasterised {files} files, {instances} instances in {seconds:.2f}s ({rate:.1f} files/s)".format(
+        rate=summary["files"] / seconds, **summary))
+    for reason, count in sorted(summary["skipped"].items()):
+        print("skipped {} shapes with {}".format(count, reason))
+    for json_path, error in summary["errors"]:
+        print("error: {}: {}".format(json_path, error), file=sys.stderr)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
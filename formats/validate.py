@@ -0,0 +1,183 @@
+"""并行校验文件夹中的所有标注文件，结果写成JSON报告（不依赖Qt）
+
+在打开文件之前找出LabelFile.load会抛出异常、或app.addLabelInfo填充场景到一半才报错的文件::
+
+    python -m formats.validate 文件夹 [--report report.json] [--workers N]
+
+检查项（报告中的code）：
+
+- load：文件不能读取或解析
+- schema：缺少字段或字段类型不对
+- shape_type：不是SHAPE_TYPES中的形状类型
+- point_count：顶点数不符合形状类型（见POINT_COUNTS）
+- out_of_bounds：顶点不在图片范围内
+- image_missing：找不到图片文件，也没有内嵌的图片
+- image_size：imageHeight、imageWidth与图片文件头中的尺寸不同（只读文件头，不解码像素）
+
+"""
+import argparse
+import collections
+import io
+import json
+import math
+import numbers
+import os.path as osp
+import sys
+
+import serializer
+from label_file import LabelFile
+
+from .dataset import SHAPE_TYPES, Throughput, header_size, iter_label_files, parallel_map
+
+# 每种形状的(最少, 最多)顶点数，与app.addLabelInfo中各形状用到的顶点一致
+POINT_COUNTS = {
+    "polygon": (3, None),
+    "rectangle": (2, 2),
+    "line": (2, 2),
+    "point": (1, 1),
+}
+CHECKS = ("load", "schema", "shape_type", "point_count", "out_of_bounds", "image_missing", "image_size")
+
+
+def _issue(code, message, shape=None):
+    issue = {"code": code, "message": message}
+    if shape is not None:
+        issue["shape"] = shape
+    return issue
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _is_size(value):
+    return value is None or (isinstance(value, int) and not isinstance(value, bool) and value > 0)
+
+
+def _check_shape(index, shape, width, height):
+    """检查一个形状，返回问题列表"""
+    issues = []
+    if not isinstance(shape["label"], str):
+        issues.append(_issue("schema", "label is not a string", index))
+    if shape["group_id"] is not None and (not isinstance(shape["group_id"], int) or isinstance(shape["group_id"], bool)):
+        issues.append(_issue("schema", "group_id is not an integer", index))
+    points = shape["points"]
+    if not isinstance(points, list) or not all(
+            isinstance(point, list) and len(point) == 2 and all(map(_is_number, point)) for point in points):
+        issues.append(_issue("schema", "points is not a list of [x, y] numbers", index))
+        return issues
+    shape_type = shape["shape_type"]
+    if shape_type not in SHAPE_TYPES:
+        issues.append(_issue("shape_type", "unknown shape type {!r}".format(shape_type), index))
+        return issues
+    least, most = POINT_COUNTS[shape_type]
+    if len(points) < least or (most is not None and len(points) > most):
+        expected = str(least) if least == most else "at least {}".format(least)
+        issues.append(_issue("point_count", "{} has {} points, expected {}".format(
+            shape_type, len(points), expected), index))
+    if width and height:
+        outside = sum(1 for x, y in points if not (0 <= x <= width and 0 <= y <= height))
+        if outside:
+            issues.append(_issue("out_of_bounds", "{} of {} points outside {}x{}".format(
+                outside, len(points), width, height), index))
+    return issues
+
+
+def validate_file(json_path):
+    """校验一个标注文件（在进程池中执行）
+
+    Args:
+        json_path(str): 标注文件的路径
+
+    Returns:
+        tuple: (json_path, 问题列表)，每个问题为{"code", "message"[, "shape"]}，shape为形状的序号
+
+    """
+    try:
+        label_file = LabelFile(json_path)
+    except (KeyError, TypeError, AttributeError) as e:
+        # 缺少必需的字段，或字段类型不对
+        return json_path, [_issue("schema", "{}: {}".format(type(e).__name__, e))]
+    except Exception as e:
+        return json_path, [_issue("load", "{}: {}".format(type(e).__name__, e))]
+    issues = []
+    if not isinstance(label_file.imagePath, str):
+        issues.append(_issue("schema", "imagePath is not a string"))
+    if not isinstance(label_file.flags, dict):
+        issues.append(_issue("schema", "flags is not an object"))
+    width, height = label_file.imageWidth, label_file.imageHeight
+    if not (_is_size(width) and _is_size(height)):
+        issues.append(_issue("schema", "imageWidth/imageHeight are not positive integers"))
+        width = height = None
+
+    size = None
+    try:
+        if isinstance(label_file.imagePath, str):
+            size = header_size(label_file)
+    except Exception as e:
+        issues.append(_issue("image_size", "cannot read image header: {}: {}".format(type(e).__name__, e)))
+    else:
+        if size is None:
+            issues.append(_issue("image_missing", "no image file or embedded image for {!r}".format(
+                label_file.imagePath)))
+        elif width and height and (width, height) != tuple(size):
+            issues.append(_issue("image_size", "imageWidth x imageHeight is {}x{}, image is {}x{}".format(
+                width, height, size[0], size[1])))
+    # 越界按图片的真实尺寸检查，读不到时用json中的尺寸
+    if size is not None:
+        width, height = size
+
+    for index, shape in enumerate(label_file.shapes):
+        issues.extend(_check_shape(index, shape, width, height))
+    return json_path, issues
+
+
+def validate(folder, workers=None, progress=True):
+    """并行校验文件夹（包括子文件夹）中的所有标注文件
+
+    Args:
+        folder(str): 文件夹路径
+        workers(int): 进程数，默认为CPU核数减一
+        progress(bool): 是否在标准错误上显示进度
+
+    Returns:
+        dict: 报告：folder、files、invalid（有问题的文件数）、counts（按code计数的问题数）、seconds、
+            results（[{"file": 相对路径, "issues": 问题列表}]，只含有问题的文件）
+
+    """
+    folder = osp.abspath(folder)
+    paths = list(iter_label_files(folder))
+    throughput = Throughput(len(paths), unit="issues", stream=None if progress else io.StringIO())
+    counts = collections.Counter()
+    results = []
+    for json_path, issues in parallel_map(validate_file, paths, workers):
+        if issues:
+            results.append({"file": osp.relpath(json_path, folder), "issues": issues})
+            counts.update(issue["code"] for issue in issues)
+        throughput.update(items=len(issues))
+    throughput.finish()
+    return {"folder": folder, "files": len(paths), "invalid": len(results),
+            "counts": {code: counts[code] for code in CHECKS if counts[code]},
+            "seconds": round(throughput.elapsed(), 3), "results": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m formats.validate", description=__doc__.split("\n")[0])
+    parser.add_argument("folder", help="folder containing labelme json or binary annotation files")
+    parser.add_argument("--report", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--workers", type=int, default=None, help="number of validating processes")
+    args = parser.parse_args(argv)
+    report = validate(args.folder, args.workers)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.report:
+        serializer.write_atomic(args.report, text)
+        print("validated {files} files in {seconds:.2f}s: {invalid} with issues".format(**report))
+        for code, count in report["counts"].items():
+            print("{}: {}".format(code, count))
+    else:
+        print(text)
+    return 1 if report["invalid"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""每个文档的修改日志：标注的每次增加、移动、重命名、删除都以一行紧凑的json追加到日志中
+
+日志在保存json之前记录尚未保存的修改，程序崩溃或者切换图片没有保存时，下次打开同一文档会把日志重放到json之上。
+日志不依赖Qt，文件放在用户缓存目录下，按json的绝对路径命名。文件的格式为::
+
+    {"journal":1,"base":[json的修改时间, json的大小]}      第一行，json不存在时base为null
+    {"s":1,"op":"add","shape":{...}}                      增加一个图形（追加在末尾）
+    {"s":2,"op":"move","i":0,"points":[[x, y], ...]}      第i个图形移动后的全部顶点
+    {"s":3,"op":"rename","i":0,"label":"a","group_id":1}  重命名第i个图形
+    {"s":4,"op":"delete","i":0}                           删除第i个图形
+
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import os.path as osp
+
+from utils.paths import cache_dir
+
+logger = logging.getLogger("labelall")
+
+JOURNAL_VERSION = 1
+JOURNAL_OPERATIONS = ("add", "move", "rename", "delete")
+
+
+def journal_path(json_path):
+    """某个json对应的日志文件的路径
+
+    Args:
+        json_path(str): json文件的路径（不要求存在）
+
+    Returns:
+        str: 日志文件的绝对路径
+
+    """
+    key = hashlib.sha1(osp.abspath(json_path).encode("utf-8")).hexdigest()
+    return osp.join(cache_dir("journal"), key + ".jsonl")
+
+
+def file_stamp(path):
+    """文件的(修改时间, 大小)，用于判断日志是否建立在磁盘上当前的json之上
+
+    Returns:
+        list: 文件不存在时为None
+
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _dumps(record):
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+
+
+def apply_records(shapes, records):
+    """把日志中的记录按顺序作用到形状列表上（原地修改）
+
+    Args:
+        shapes(list): LabelFile.shapes格式的形状列表
+        records(list): 日志中的记录
+
+    Returns:
+        int: 成功重放的记录数，遇到与形状列表对不上的记录时停止
+
+    """
+    applied = 0
+    for record in records:
+        op = record.get("op")
+        index = record.get("i")
+        if op == "add":
+            shape = dict(record["shape"])
+            shape.setdefault("flags", {})
+            shape.setdefault("other_data", {})
+            shapes.append(shape)
+        elif op in ("move", "rename", "delete") and isinstance(index, int) and 0 <= index < len(shapes):
+            if op == "move":
+                shapes[index] = dict(shapes[index], points=record["points"])
+            elif op == "rename":
+                shapes[index] = dict(shapes[index], label=record["label"], group_id=record["group_id"])
+            else:
+                del shapes[index]
+        else:
+            logger.warning("Journal record does not match the document, stop replaying: {}".format(record))
+            break
+        applied += 1
+    return applied
+
+
+class EditJournal(object):
+    """一个文档的修改日志
+
+    record只把记录编码后放入内存中的缓冲区，flush时一次写入并fsync，调用方按固定的间隔批量flush；
+    每次写入都重新以追加方式打开文件，日志被压缩（重写）后其它EditJournal对象仍可以安全地写入
+
+    Attributes:
+        json_path(str): 文档的json路径
+        path(str): 日志文件的路径
+        seq(int): 最后一条记录的序号，序号在同一个日志文件中单调递增
+
+    """
+    def __init__(self, json_path):
+        self.json_path = json_path
+        self.path = journal_path(json_path)
+        self.seq = 0
+        self._buffer = []
+
+    def read(self):
+        """读取日志文件
+
+        Returns:
+            tuple: (base, records)，没有日志文件时为(None, [])
+
+        """
+        if not osp.exists(self.path):
+            return None, []
+        records = []
+        base = None
+        with io.open(self.path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 崩溃时最后一行可能没有写完整，之前的记录仍然有效
+                    logger.warning("Truncated journal line {} in {}".format(number + 1, self.path))
+                    break
+                if number == 0:
+                    base = record.get("base")
+                else:
+                    records.append(record)
+        return base, records
+
+    def replay(self, shapes):
+        """把尚未保存的修改重放到从json读入的形状上
+
+        日志不是建立在磁盘上当前的json之上时（json在别处被改过），日志作废并删除
+
+        Args:
+            shapes(list): LabelFile.shapes格式的形状列表，不会被修改
+
+        Returns:
+            tuple: (重放后的形状列表, 重放的记录数)
+
+        """
+        base, records = self.read()
+        if records:
+            self.seq = max(record.get("s", 0) for record in records)
+        if not records:
+            return shapes, 0
+        if base != file_stamp(self.json_path):
+            logger.warning("Discarding stale journal of {}".format(self.json_path))
+            self.discard()
+            return shapes, 0
+        shapes = [dict(shape) for shape in shapes]
+        return shapes, apply_records(shapes, records)
+
+    def record(self, op, index, **fields):
+        """追加一条记录（只放入缓冲区）
+
+        Args:
+            op(str): JOURNAL_OPERATIONS之一
+            index(int): 图形在nodes_info['shapes']中的序号，add时为None
+            **fields: 记录的其它字段（add的shape，move的points，rename的label与group_id）
+
+        """
+        assert op in JOURNAL_OPERATIONS
+        self.seq += 1
+        record = {"s": self.seq, "op": op}
+        if index is not None:
+            record["i"] = index
+        record.update(fields)
+        self._buffer.append(_dumps(record) + "\n")
+
+    def pending(self):
+        return bool(self._buffer)
+
+    def flush(self):
+        """把缓冲区中的记录一次写入日志文件并fsync，日志文件不存在时先写入记录基准的第一行"""
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        if not osp.exists(self.path):
+            header = {"journal": JOURNAL_VERSION, "base": file_stamp(self.json_path)}
+            lines.insert(0, _dumps(header) + "\n")
+        with io.open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact(self, saved_seq):
+        """json保存成功后压缩日志：去掉已经写入json的记录，基准改为刚保存的json
+
+        Args:
+            saved_seq(int): 保存时的快照包含的最后一条记录的序号
+
+        """
+        self.flush()
+        base, records = self.read()
+        remaining = [record for record in records if record.get("s", 0) > saved_seq]
+        if not remaining:
+            self.discard()
+            return
+        lines = [_dumps({"journal": JOURNAL_VERSION, "base": file_stamp(self.json_path)})]
+        lines.extend(_dumps(record) for record in remaining)
+        temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with io.open(temp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def discard(self):
+        """删除日志文件和缓冲区中的记录"""
+        self._buffer = []
+        if osp.exists(self.path):
+            os.remove(self.path)
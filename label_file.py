@@ -1,10 +1,15 @@
 import base64
+import collections
 import contextlib
+import hashlib
 import io
 import json
 import os.path as osp
+import re
 import PIL.Image
+import serializer
 import utils
+from formats import binary
 import logging
 
 logger = logging.getLogger("labelall")
@@ -12,6 +17,17 @@ PY2 = "2"
 QT4 = "4"
 PIL.Image.MAX_IMAGE_PIXELS = None
 
+# imageData的值：base64字符串中没有引号，所以到下一个引号为止即是整个值
+_IMAGE_DATA_PATTERN = re.compile(rb'"imageData"\s*:\s*"')
+# 跳过解析时代替imageData的值（含有base64中不会出现的字符），解析后据此确认替换的是最外层的imageData
+_IMAGE_DATA_PLACEHOLDER = b"labelall:imageData"
+
+# 保存json时图片数据的处理方式，见ImageDataEncoder
+IMAGE_DATA_EXTERNAL = "external"
+IMAGE_DATA_EMBEDDED_CACHED = "embedded-cached"
+IMAGE_DATA_EMBEDDED_DEDUPLICATED = "embedded-deduplicated"
+IMAGE_DATA_POLICIES = (IMAGE_DATA_EXTERNAL, IMAGE_DATA_EMBEDDED_CACHED, IMAGE_DATA_EMBEDDED_DEDUPLICATED)
+
 
 @contextlib.contextmanager
 def open(name, mode):
@@ -35,8 +51,14 @@ def open(name, mode):
 class LabelFile(object):
     """得到图片或json文件的label信息和图片的编码信息
 
+    json中内嵌的imageData（base64）通常占文件的绝大部分，读取时不解析它，只记下它在文件中的位置；
+    imageData在第一次使用时才读取：json旁边的图片文件存在时读图片文件，否则才解码内嵌的数据
+
+    也可以读写二进制格式的标注文件（见formats.binary），读取时按文件开头的MAGIC识别，保存时按后缀选择格式
+
     """
     suffix = ".json"
+    binary_suffix = binary.SUFFIX
 
     def __init__(self, filename=None):
         """
@@ -47,11 +69,113 @@ class LabelFile(object):
         """
         self.shapes = []
         self.imagePath = None
-        self.imageData = None
+        self.imageHeight = None
+        self.imageWidth = None
+        self.flags = {}
+        self.otherData = {}
+        self._imageData = None
+        self._embedded_text = None  # 完整解析时得到的内嵌base64字符串
+        self._embedded_span = None  # 跳过解析时内嵌base64在文件中的(起, 止)字节位置
+        self._embedded_format = None  # 按位置读取的内容："json"（json字符串）、"text"（base64文本）、"raw"（图片字节）
         if filename is not None:
             self.load(filename)
         self.filename = filename
 
+    @property
+    def imageData(self):
+        """
+        图片文件的原始字节，第一次使用时才读取
+
+        """
+        if self._imageData is None and self.imagePath is not None:
+            image_file = self.resolve_image_path()
+            if image_file is not None:
+                self._imageData = self.read_image_file(image_file)
+            elif self._embedded_format == "raw":
+                self._imageData = self._read_embedded_span()
+            else:
+                embedded = self.read_embedded_base64()
+                if embedded:
+                    self._imageData = base64.b64decode(embedded)
+        return self._imageData
+
+    @imageData.setter
+    def imageData(self, value):
+        self._imageData = value
+
+    def resolve_image_path(self):
+        """找到json对应的图片文件：先按imagePath（相对于json），再找json旁边同名的图片
+
+        Returns:
+            str: 存在的图片文件的路径，都不存在时返回None
+
+        """
+        if not self.imagePath or not self.filename:
+            return None
+        directory = osp.dirname(self.filename)
+        # imagePath可能是在别的电脑上保存的绝对路径，因此再试一次json旁边的同名文件
+        for path in (osp.join(directory, self.imagePath),
+                     osp.join(directory, osp.basename(self.imagePath.replace("\\", "/")))):
+            if osp.isfile(path):
+                return path
+        return None
+
+    def has_embedded_image(self):
+        """json中是否内嵌了图片数据"""
+        return bool(self._embedded_text) or self._embedded_span is not None
+
+    def read_embedded_base64(self):
+        """读取json中内嵌的base64字符串（跳过解析时从文件中按位置读取）
+
+        Returns:
+            str: base64字符串，没有内嵌图片时返回None
+
+        """
+        if self._embedded_text is not None:
+            return self._embedded_text
+        if self._embedded_span is None:
+            return None
+        content = self._read_embedded_span()
+        if self._embedded_format == "raw":
+            return base64.b64encode(content).decode("ascii")
+        if self._embedded_format == "text":
+            return content.decode("utf-8")
+        return content.decode("ascii").replace("\\/", "/")  # json中"/"可能被转义为"\/"
+
+    def _read_embedded_span(self):
+        start, end = self._embedded_span
+        with io.open(self.filename, "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    @staticmethod
+    def _loads_without_image_data(raw):
+        """把imageData的值替换为null后再解析，避免构造巨大的base64字符串
+
+        Args:
+            raw(bytes): json文件的全部内容
+
+        Returns:
+            tuple: (解析结果, imageData的值在raw中的(起, 止)位置)，无法这样解析时返回None
+
+        """
+        match = _IMAGE_DATA_PATTERN.search(raw)
+        if match is None:
+            return None
+        start = match.end()
+        end = raw.find(b'"', start)
+        if end < 0:
+            return None
+        try:
+            data = json.loads(raw[:match.start()] + b'"imageData": "' + _IMAGE_DATA_PLACEHOLDER + raw[end:])
+        except ValueError:
+            return None
+        # 替换的是嵌套对象中的imageData时，最外层的值不是占位字符串；此时放弃，按完整解析处理
+        if not isinstance(data, dict) or data.get("imageData") != _IMAGE_DATA_PLACEHOLDER.decode("ascii"):
+            return None
+        data["imageData"] = None
+        return data, (start, end)
+
     @staticmethod
     def load_image_file(filename):
         """通过图片路径，返回其编码的信息
@@ -84,8 +208,26 @@ class LabelFile(object):
             f.seek(0)
             return f.read()
 
+    @staticmethod
+    def read_image_file(filename):
+        """读取图片文件的原始字节，不解码也不重新编码（解码交给loader.decode_image_data）
+
+        Args:
+            filename(str): 图片的绝对路径
+
+        Returns:
+            bytes: 图片文件的原始字节，读取失败时返回None
+
+        """
+        try:
+            with io.open(filename, "rb") as f:
+                return f.read()
+        except IOError:
+            logger.error("Failed opening image file: {}".format(filename))
+            return
+
     def load(self, filename):
-        """ 读取json文件，并获得相关信息
+        """ 读取json文件，并获得形状等信息（不解析内嵌的图片数据，见imageData）
 
         Args:
             filename(str): json文件的绝对路径
@@ -108,8 +250,21 @@ class LabelFile(object):
             "flags",
         ]
 
-        with open(filename, "r") as f:
-            data = json.load(f)
+        with io.open(filename, "rb") as f:
+            raw = f.read()
+        embedded_text = None
+        if binary.is_binary(raw):
+            data, embedded_span, image_raw = binary.parse(raw)
+            embedded_format = "raw" if image_raw else "text"
+        else:
+            parsed = self._loads_without_image_data(raw)
+            embedded_format = "json"
+            if parsed is not None:
+                data, embedded_span = parsed
+            else:
+                data = json.loads(raw)
+                embedded_span = None
+                embedded_text = data.get("imageData")
         version = data.get("version")
         if version is None:
             logger.warn(
@@ -126,16 +281,6 @@ class LabelFile(object):
                 )
             )
 
-        if data["imageData"] is not None:
-            global imageData_again
-            imageData_again = data["imageData"]
-            imageData = base64.b64decode(data["imageData"])
-            if PY2 and QT4:
-                imageData = utils.img_data_to_png_data(imageData)
-        else:
-            # relative path from label file to relative path from cwd
-            imagePath = osp.join(osp.dirname(filename), data["imagePath"])
-            imageData = self.load_image_file(imagePath)
         flags = data.get("flags") or {}
         imagePath = data["imagePath"]
         shapes = [
@@ -161,7 +306,189 @@ class LabelFile(object):
         self.flags = flags
         self.shapes = shapes
         self.imagePath = imagePath
-        self.imageData = imageData
+        self.imageHeight = data.get("imageHeight")
+        self.imageWidth = data.get("imageWidth")
+        self._imageData = None
+        self._embedded_text = embedded_text
+        self._embedded_span = embedded_span
+        self._embedded_format = embedded_format
         self.filename = filename
         self.otherData = otherData
 
+    @classmethod
+    def is_label_file(cls, filename):
+        """按后缀判断是否为标注文件（json或二进制格式）"""
+        return osp.splitext(filename)[1].lower() in (cls.suffix, cls.binary_suffix)
+
+    @classmethod
+    def find(cls, filename):
+        """找到图片对应的标注文件：filename本身是标注文件时为它本身，否则先找同名的json，再找同名的二进制格式
+
+        Args:
+            filename(str): 图片或标注文件的路径
+
+        Returns:
+            str: 存在的标注文件的路径，都不存在时返回None
+
+        """
+        if cls.is_label_file(filename):
+            return filename if osp.exists(filename) else None
+        base = osp.splitext(filename)[0]
+        for suffix in (cls.suffix, cls.binary_suffix):
+            if osp.exists(base + suffix):
+                return base + suffix
+        return None
+
+    @classmethod
+    def write(cls, filename, data, fsync=True):
+        """把serializer.to_dict的结果原子地写入标注文件，后缀为binary_suffix时写二进制格式，否则写json
+
+        Args:
+            filename(str): 标注文件的路径
+            data(dict): serializer.to_dict的结果
+            fsync(bool): 见serializer.write_atomic
+
+        """
+        if osp.splitext(filename)[1].lower() == cls.binary_suffix:
+            binary.save(filename, data, fsync)
+        else:
+            serializer.save(filename, data, fsync)
+
+    def save(self, filename=None):
+        """把读入的内容保存为json或二进制格式（见write），内嵌的图片数据原样保留
+
+        Args:
+            filename(str): 标注文件的路径，默认为读入时的路径
+
+        """
+        filename = filename or self.filename
+        embedded = self.read_embedded_base64()
+        data = serializer.to_dict(self.shapes, self.imagePath, embedded,
+                                  self.imageHeight, self.imageWidth, self.flags, self.otherData)
+        self.write(filename, data)
+        # 原来记下的位置对新文件不再有效
+        self._embedded_text = embedded
+        self._embedded_span = None
+        self.filename = filename
+
+
+class ImageDataCache(object):
+    """按图片内容的sha1缓存base64字符串，供embedded-deduplicated策略的多个文档共用
+
+    Attributes:
+        max_bytes(int): 缓存的base64字符串总长度上限
+        total_bytes(int): 当前缓存的总长度
+
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, digest):
+        text = self._entries.get(digest)
+        if text is not None:
+            self._entries.move_to_end(digest)
+        return text
+
+    def put(self, digest, text):
+        if digest in self._entries or len(text) > self.max_bytes:
+            return
+        self._entries[digest] = text
+        self.total_bytes += len(text)
+        while self.total_bytes > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self.total_bytes -= len(old)
+
+
+class ImageDataEncoder(object):
+    """一个文档保存json时imagePath与imageData的生成方式，每个打开的文档各有一个
+
+    external: imageData为null，imagePath为图片相对于json的路径，不编码图片
+    embedded-cached: 内嵌base64，每个文档只编码一次，之后的保存直接复用
+    embedded-deduplicated: 同embedded-cached，另外按图片内容的sha1在所有文档之间共享编码结果
+
+    从内嵌了图片的json打开的文档，内嵌的base64原样写回，不重新编码
+
+    Attributes:
+        policy(str): IMAGE_DATA_POLICIES之一
+        image_path(str): 图片文件的路径
+        label_file(LabelFile): 打开的json，从图片打开时为None
+
+    """
+    def __init__(self, image_path, image_data=None, label_file=None,
+                 policy=IMAGE_DATA_EMBEDDED_CACHED, shared_cache=None):
+        """
+
+        Args:
+            image_path(str): 图片文件的路径
+            image_data(bytes): 已经读入内存的图片文件的原始字节，为None时需要时再读文件
+            label_file(LabelFile): 打开的json
+            policy(str): IMAGE_DATA_POLICIES之一
+            shared_cache(ImageDataCache): embedded-deduplicated策略共用的缓存
+
+        """
+        assert policy in IMAGE_DATA_POLICIES
+        self.policy = policy
+        self.image_path = image_path
+        self.label_file = label_file
+        self._image_data = image_data
+        self._shared_cache = shared_cache
+        self._base64 = None
+
+    def image_path_for(self, json_path):
+        """json中记录的imagePath
+
+        Args:
+            json_path(str): 要保存的json的路径
+
+        Returns:
+            str: external时为图片相对于json的路径；内嵌时与原来一致，从json打开时沿用其中的imagePath
+
+        """
+        if self.policy == IMAGE_DATA_EXTERNAL and self.image_path and osp.isfile(self.image_path):
+            return osp.relpath(self.image_path, osp.dirname(osp.abspath(json_path))).replace("\\", "/")
+        if self.label_file is not None:
+            return self.label_file.imagePath
+        return self.image_path
+
+    def image_data_base64(self):
+        """json中记录的imageData
+
+        Returns:
+            str: 内嵌的base64字符串，external时为None
+
+        """
+        if self.policy == IMAGE_DATA_EXTERNAL:
+            return None
+        if self._base64 is not None:
+            return self._base64
+        if self.label_file is not None and self.label_file.has_embedded_image():
+            self._base64 = self.label_file.read_embedded_base64()
+            return self._base64
+        data = self._image_data
+        if data is None:
+            data = LabelFile.read_image_file(self.image_path)
+            if data is None:
+                return None
+        if self.policy == IMAGE_DATA_EMBEDDED_DEDUPLICATED and self._shared_cache is not None:
+            digest = hashlib.sha1(data).hexdigest()
+            self._base64 = self._shared_cache.get(digest)
+            if self._base64 is None:
+                self._base64 = base64.b64encode(data).decode("ascii")
+                self._shared_cache.put(digest, self._base64)
+        else:
+            self._base64 = base64.b64encode(data).decode("ascii")
+        return self._base64
+
+    def fields(self, json_path):
+        """保存json时imagePath与imageData两项
+
+        Args:
+            json_path(str): 要保存的json的路径
+
+        Returns:
+            dict: {"imagePath": ..., "imageData": ...}
+
+        """
+        return {"imagePath": self.image_path_for(json_path), "imageData": self.image_data_base64()}
@@ -0,0 +1,20 @@
+from .engine import LoadedImage
+from .engine import decode_image_data
+from .engine import fit_scale
+from .engine import load_image
+from .engine import pil_to_qimage
+from .cache import LRUCache
+from .orientation import is_transposed
+from .orientation import orientation_transform
+from .document import LoadResult
+from .document import load_document
+from .prefetch import Prefetcher
+from .async_loader import AsyncLoader
+from .pyramid import TILED_IMAGE_PIXELS
+from .pyramid import Pyramid
+from .pyramid import TileLoader
+from .pyramid import open_pyramid
+from .proxy import FullResolutionLoader
+from .thumbnail import ThumbnailService
+from .adjust import ImageAdjuster
+from .save import SaveService
@@ -0,0 +1,98 @@
+import logging
+
+from PyQt5 import QtCore
+
+import utils
+
+logger = logging.getLogger("labelall")
+
+
+class _AdjustSignals(QtCore.QObject):
+    finished = QtCore.pyqtSignal(object, object, object)  # LoadedImage, 参数, 像素
+
+
+class _AdjustTask(QtCore.QRunnable):
+    """
+    在工作线程中执行图像调整流水线的任务
+
+    """
+    def __init__(self, adjuster, loaded_image, pipeline, adjustments):
+        super(_AdjustTask, self).__init__()
+        self.adjuster = adjuster
+        self.loaded_image = loaded_image
+        self.pipeline = pipeline
+        self.adjustments = adjustments
+
+    def run(self):
+        try:
+            array = self.pipeline.run(self.adjustments)
+        except Exception:
+            logger.exception("Failed adjusting image")
+            array = None
+        self.adjuster.signals.finished.emit(self.loaded_image, self.adjustments, array)
+
+
+class ImageAdjuster(QtCore.QObject):
+    """
+    在工作线程中对当前图片执行调整流水线（见utils.AdjustmentPipeline），画布不会因计算而卡顿
+
+    同一时间只有一个计算在进行，期间的新请求只保留最新的一个，计算结束后立即执行
+
+    Attributes:
+        pool(QThreadPool): 执行计算的线程池（单线程，流水线的缓存不需要加锁）
+        loaded_image(LoadedImage): 当前流水线对应的图片
+
+    """
+    adjusted = QtCore.pyqtSignal(object, object)  # LoadedImage, 调整后的像素
+
+    def __init__(self, parent=None):
+        super(ImageAdjuster, self).__init__(parent)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.loaded_image = None
+        self._pipeline = None
+        self._running = False
+        self._pending = None
+        self.signals = _AdjustSignals()
+        self.signals.finished.connect(self._onFinished)
+
+    def request(self, loaded_image, adjustments):
+        """
+        请求按参数调整图片，换了图片（包括代理图换成原图）时重新建立流水线
+
+        Args:
+            loaded_image(LoadedImage): 需要调整的图片
+            adjustments(dict): 各步骤的参数
+
+        """
+        if loaded_image is not self.loaded_image:
+            self.loaded_image = loaded_image
+            self._pipeline = None
+        if self._running:
+            self._pending = (loaded_image, dict(adjustments))
+            return
+        self._start(loaded_image, dict(adjustments))
+
+    def clear(self):
+        """
+        切换图片时释放流水线缓存的中间结果，放弃排队的请求
+
+        """
+        self.loaded_image = None
+        self._pipeline = None
+        self._pending = None
+
+    def _start(self, loaded_image, adjustments):
+        if self._pipeline is None:
+            self._pipeline = utils.AdjustmentPipeline(loaded_image.array, loaded_image.histograms)
+        self._running = True
+        self.pool.start(_AdjustTask(self, loaded_image, self._pipeline, adjustments))
+
+    def _onFinished(self, loaded_image, adjustments, array):
+        self._running = False
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            self._start(*pending)
+            return  # 已经有更新的请求，这次的结果不再显示
+        if array is not None and loaded_image is self.loaded_image:
+            self.adjusted.emit(loaded_image, array)
@@ -0,0 +1,124 @@
+import logging
+
+from PyQt5 import QtCore
+
+from .document import load_document
+
+logger = logging.getLogger("labelall")
+
+
+class _LoadSignals(QtCore.QObject):
+    """
+    工作线程向GUI线程汇报结果用的信号（此对象在GUI线程中创建，信号会排队到GUI线程处理）
+
+    """
+    finished = QtCore.pyqtSignal(int, object)
+    failed = QtCore.pyqtSignal(int, str)
+
+
+class _LoadTask(QtCore.QRunnable):
+    """
+    在工作线程中解码图片、解析json的任务
+
+    """
+    def __init__(self, request_id, filename, tiled, fit_size, signals):
+        super(_LoadTask, self).__init__()
+        self.request_id = request_id
+        self.filename = filename
+        self.tiled = tiled
+        self.fit_size = fit_size
+        self.signals = signals
+
+    def run(self):
+        try:
+            result = load_document(self.filename, self.tiled, self.fit_size)
+        except Exception as e:
+            logger.exception("Failed loading: {}".format(self.filename))
+            self.signals.failed.emit(self.request_id, str(e))
+            return
+        self.signals.finished.emit(self.request_id, result)
+
+
+class AsyncLoader(QtCore.QObject):
+    """
+    异步加载图片与json：解码和解析在工作线程中完成，只把最新一次请求的结果交给GUI线程
+
+    同时最多有max_workers个任务在解码，另外最多只保留一个排队的请求（总是最新的那个），
+    因此快速拖动滑动条时不会堆积大量的解码任务
+
+    Attributes:
+        cache(LRUCache): 加载结果会放入此缓存，过期请求的结果也不浪费
+        latest_id(int): 最新一次请求的编号
+        pool(QThreadPool): 执行加载任务的线程池
+
+    """
+    loaded = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str, str)
+
+    def __init__(self, cache, max_workers=2, parent=None):
+        super(AsyncLoader, self).__init__(parent)
+        self.cache = cache
+        self.latest_id = 0
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max_workers)
+        self._max_workers = max_workers
+        self._running = {}  # request_id -> filename
+        self._pending = None  # (request_id, filename, tiled, fit_size)
+        self._signals = _LoadSignals()
+        self._signals.finished.connect(self._onFinished)
+        self._signals.failed.connect(self._onFailed)
+
+    def request(self, filename, tiled=False, fit_size=None):
+        """
+        请求加载一张图片，之前尚未开始的请求会被这次请求替换
+
+        Args:
+            filename(str): 图片或json的绝对路径
+            tiled(bool): 是否以瓦片金字塔的方式打开（超大图片）
+            fit_size(tuple): 需要适应的窗口的(宽, 高)，给出时JPEG先解码成代理图
+
+        Returns:
+            int: 这次请求的编号
+
+        """
+        self.latest_id += 1
+        if len(self._running) < self._max_workers:
+            self._start(self.latest_id, filename, tiled, fit_size)
+        else:
+            self._pending = (self.latest_id, filename, tiled, fit_size)
+        return self.latest_id
+
+    def cancel(self):
+        """
+        作废所有请求：排队的请求不再执行，正在执行的请求的结果只放入缓存
+
+        """
+        self.latest_id += 1
+        self._pending = None
+
+    def isLoading(self):
+        return self._pending is not None or self.latest_id in self._running
+
+    def _start(self, request_id, filename, tiled, fit_size):
+        self._running[request_id] = filename
+        self.pool.start(_LoadTask(request_id, filename, tiled, fit_size, self._signals))
+
+    def _startPending(self):
+        if self._pending is not None and len(self._running) < self._max_workers:
+            request_id, filename, tiled, fit_size = self._pending
+            self._pending = None
+            self._start(request_id, filename, tiled, fit_size)
+
+    def _onFinished(self, request_id, result):
+        filename = self._running.pop(request_id, None)
+        if filename is not None:
+            self.cache.put(filename, result, result.nbytes)
+        if request_id == self.latest_id:
+            self.loaded.emit(result)
+        self._startPending()
+
+    def _onFailed(self, request_id, message):
+        filename = self._running.pop(request_id, None)
+        if request_id == self.latest_id:
+            self.failed.emit(filename, message)
+        self._startPending()
@@ -0,0 +1,87 @@
+import collections
+import threading
+
+
+class LRUCache(object):
+    """
+    按字节预算淘汰的LRU缓存，可以在工作线程与GUI线程之间共享
+
+    Attributes:
+        max_bytes(int): 缓存允许占用的字节数上限
+        total_bytes(int): 当前缓存中所有条目的字节数之和
+
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = collections.OrderedDict()  # key -> (value, nbytes)
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        取出缓存的值，并把它标记为最近使用
+
+        Args:
+            key: 缓存的键
+            default: 不存在时的返回值
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        """
+        放入一个值，超出预算时从最久未使用的条目开始淘汰
+
+        Args:
+            key: 缓存的键
+            value: 缓存的值
+            nbytes(int): 该值占用的字节数
+
+        """
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            if nbytes > self.max_bytes:
+                # 单个条目就超出预算，不缓存
+                return
+            self._entries[key] = (value, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_bytes
+
+    def discard(self, key):
+        """
+        删除某个条目（不存在时什么都不做）
+
+        Args:
+            key: 缓存的键
+
+        """
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+
+    def clear(self):
+        """
+        清空缓存
+
+        """
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
@@ -0,0 +1,93 @@
+import os
+import os.path as osp
+
+from label_file import LabelFile
+from .engine import decode_image_data, load_image
+from .pyramid import open_pyramid
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class LoadResult(object):
+    """
+    一张图片及其同名json的加载结果，不含任何需要在GUI线程创建的对象，可以在工作线程中生成
+
+    Attributes:
+        filename(str): 打开时使用的路径（图片或json）
+        loaded_image(LoadedImage): 图片解码结果，失败时为None
+        label_file(LabelFile): 同名json的解析结果，没有json时为None
+        image_path(str): 图片的绝对路径或者json中记录的图片路径
+        pyramid(Pyramid): 超大图片的瓦片金字塔（此时loaded_image为None），普通图片为None
+        stamp(tuple): 加载时图片与json的修改时间，用于判断缓存是否过期
+
+    """
+    def __init__(self, filename, loaded_image, label_file, image_path, pyramid=None):
+        self.filename = filename
+        self.loaded_image = loaded_image
+        self.label_file = label_file
+        self.image_path = image_path
+        self.pyramid = pyramid
+        self.stamp = self.currentStamp()
+
+    @property
+    def nbytes(self):
+        return self.loaded_image.nbytes if self.loaded_image else 0
+
+    def jsonFile(self):
+        """
+        标注文件的路径：读入了标注文件时为它的路径（可能是二进制格式），否则为同名的json
+
+        """
+        if self.label_file is not None and self.label_file.filename:
+            return self.label_file.filename
+        return osp.splitext(self.filename)[0] + LabelFile.suffix
+
+    def currentStamp(self):
+        """
+        读取磁盘上图片与json当前的修改时间
+
+        Returns:
+            tuple: (图片修改时间, json修改时间)
+
+        """
+        return _mtime(self.filename), _mtime(self.jsonFile())
+
+    def isFresh(self):
+        """
+        判断磁盘上的文件在加载之后是否被改动过
+
+        Returns:
+            bool: 没有改动时为True
+
+        """
+        return self.stamp == self.currentStamp()
+
+
+def load_document(filename, tiled=False, fit_size=None):
+    """加载一张图片及其同名json（如果存在），只做解码和解析，不接触任何界面对象
+
+    Args:
+        filename(str): 图片或json的绝对路径
+        tiled(bool): 为True时不解码整张图片，而是打开（必要时生成）它的瓦片金字塔
+        fit_size(tuple): 需要适应的窗口的(宽, 高)，给出时JPEG先解码成代理图
+
+    Returns:
+        LoadResult: 加载结果
+
+    """
+    json_file = LabelFile.find(filename)
+    pyramid = open_pyramid(filename) if tiled else None
+    if json_file is not None:
+        label_file = LabelFile(json_file)
+        image_path = label_file.resolve_image_path() or osp.join(osp.dirname(json_file), label_file.imagePath)
+        loaded_image = None if tiled else decode_image_data(label_file.imageData, fit_size)
+    else:
+        label_file = None
+        loaded_image = None if tiled else load_image(filename, fit_size)
+        image_path = filename if (loaded_image or tiled) else None
+    return LoadResult(filename, loaded_image, label_file, image_path, pyramid)
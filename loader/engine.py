@@ -0,0 +1,191 @@
+import io
+import logging
+
+import numpy as np
+import PIL.Image
+from PyQt5 import QtGui
+
+import utils
+
+logger = logging.getLogger("labelall")
+PIL.Image.MAX_IMAGE_PIXELS = None
+
+# PIL的模式 -> 可以直接引用其像素内存的QImage格式
+_QIMAGE_FORMATS = {
+    "L": QtGui.QImage.Format_Grayscale8,
+    "RGB": QtGui.QImage.Format_RGB888,
+    "RGBA": QtGui.QImage.Format_RGBA8888,
+}
+
+
+class LoadedImage(object):
+    """
+    一次解码得到的图片，QImage与numpy数组共享同一块像素内存
+
+    Attributes:
+        data(bytes): 图片文件的原始字节（未重新编码），供保存json等需要原始数据的地方使用
+        array(np.ndarray): 解码后的像素（按文件中的方向，未按exif摆正），QImage直接引用这块内存，
+            必须与QImage一同保留
+        qimage(QImage): 引用array内存的QImage，不发生拷贝
+        full_width(int): 原图按exif摆正后的宽度，即标注坐标系的宽度
+        full_height(int): 原图按exif摆正后的高度
+        orientation(int): exif方向（1~8），显示时用图元的变换摆正，见orientation_transform
+
+    """
+    def __init__(self, data, array, qimage, full_width=None, full_height=None, orientation=1):
+        self.data = data
+        self.array = array
+        self.qimage = qimage
+        self.orientation = orientation
+        self._histograms = None
+        width, height = qimage.width(), qimage.height()
+        if orientation in utils.TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+        self.full_width = width if full_width is None else full_width
+        self.full_height = height if full_height is None else full_height
+
+    @property
+    def width(self):
+        return self.qimage.width()
+
+    @property
+    def height(self):
+        return self.qimage.height()
+
+    def rawSize(self):
+        """
+        原图在文件中（未摆正）的宽高，与qimage的方向一致
+
+        Returns:
+            tuple: (宽, 高)
+
+        """
+        if self.orientation in utils.TRANSPOSED_ORIENTATIONS:
+            return self.full_height, self.full_width
+        return self.full_width, self.full_height
+
+    def isProxy(self):
+        """
+        是否是按显示需要降低分辨率解码得到的代理图
+
+        """
+        raw_width, raw_height = self.rawSize()
+        return self.width < raw_width or self.height < raw_height
+
+    def histograms(self):
+        """
+        各颜色通道的直方图，第一次使用时统计，之后复用
+
+        Returns:
+            np.ndarray: 形状为(通道数, 256)的直方图
+
+        """
+        if self._histograms is None:
+            self._histograms = utils.channel_histograms(self.array)
+        return self._histograms
+
+    @property
+    def nbytes(self):
+        """
+        像素与原始字节一共占用的内存大小
+
+        """
+        return self.array.nbytes + (len(self.data) if self.data else 0)
+
+
+def pil_to_qimage(image_pil):
+    """把pil图片的像素直接交给QImage，不经过编码
+
+    Args:
+        image_pil(PIL.Image): pil图片
+
+    Returns:
+        np.ndarray: 像素数组（QImage引用的内存，需要由调用方保留）
+        QImage: 与数组共享内存的QImage
+
+    """
+    if image_pil.mode not in _QIMAGE_FORMATS:
+        if "A" in image_pil.mode or "transparency" in image_pil.info:
+            image_pil = image_pil.convert("RGBA")
+        elif image_pil.mode == "1":
+            image_pil = image_pil.convert("L")
+        else:
+            image_pil = image_pil.convert("RGB")
+    array = np.asarray(image_pil)
+    if not array.flags["C_CONTIGUOUS"]:
+        array = np.ascontiguousarray(array)
+    height, width = array.shape[:2]
+    qimage = QtGui.QImage(array.data, width, height, array.strides[0],
+                          _QIMAGE_FORMATS[image_pil.mode])
+    return array, qimage
+
+
+def fit_scale(width, height, fit_size):
+    """图片自适应到fit_size大小的窗口时的缩放比例（与Window.viewScale一致）
+
+    Args:
+        width(float): 图片宽度
+        height(float): 图片高度
+        fit_size(tuple): 窗口的(宽, 高)
+
+    Returns:
+        float: 缩放比例
+
+    """
+    return min(fit_size[0] / width, fit_size[1] / height)
+
+
+def decode_image_data(data, fit_size=None):
+    """对图片的原始字节只解码一次
+
+    像素保持文件中的方向，不按exif转置（大图转置需要拷贝整块像素），只读取exif方向记录在结果中，
+    由显示的图元用变换摆正。给出fit_size时，JPEG图片借助draft只按自适应窗口所需的分辨率解码（1/2、1/4或1/8），
+    得到的是代理图，full_width/full_height仍然记录原图大小
+
+    Args:
+        data(bytes): 图片文件的原始字节
+        fit_size(tuple): 需要适应的窗口的(宽, 高)，为None时按原始分辨率解码
+
+    Returns:
+        LoadedImage: 解码结果，解码失败时返回None
+
+    """
+    if not data:
+        return None
+    try:
+        orientation = utils.read_exif_orientation(io.BytesIO(data))
+        image_pil = PIL.Image.open(io.BytesIO(data))
+        # exif方向为5~8时图片需要转置，摆正后的宽高与文件中的相反
+        transposed = orientation in utils.TRANSPOSED_ORIENTATIONS
+        raw_width, raw_height = image_pil.size
+        if fit_size is not None and image_pil.format == "JPEG":
+            scale = fit_scale(raw_width, raw_height, fit_size[::-1] if transposed else fit_size)
+            if scale < 1:
+                image_pil.draft(image_pil.mode, (int(raw_width * scale + 1), int(raw_height * scale + 1)))
+        array, qimage = pil_to_qimage(image_pil)
+    except (IOError, SyntaxError, ValueError):
+        logger.error("Failed decoding image data")
+        return None
+    if transposed:
+        raw_width, raw_height = raw_height, raw_width
+    return LoadedImage(data, array, qimage, raw_width, raw_height, orientation)
+
+
+def load_image(filename, fit_size=None):
+    """读取图片文件并解码（只读一次文件，只解码一次）
+
+    Args:
+        filename(str): 图片的绝对路径
+        fit_size(tuple): 需要适应的窗口的(宽, 高)，见decode_image_data
+
+    Returns:
+        LoadedImage: 解码结果，失败时返回None
+
+    """
+    try:
+        with open(filename, "rb") as f:
+            data = f.read()
+    except IOError:
+        logger.error("Failed opening image file: {}".format(filename))
+        return None
+    return decode_image_data(data, fit_size)
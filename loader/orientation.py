@@ -0,0 +1,39 @@
+from PyQt5 import QtGui
+
+import utils
+
+# exif方向 -> (m11, m12, m21, m22, dx系数, dy系数)，平移量为文件中图片的宽或高（见orientation_transform）
+_ORIENTATION_MATRICES = {
+    1: (1, 0, 0, 1, None, None),
+    2: (-1, 0, 0, 1, "w", None),
+    3: (-1, 0, 0, -1, "w", "h"),
+    4: (1, 0, 0, -1, None, "h"),
+    5: (0, 1, 1, 0, None, None),
+    6: (0, 1, -1, 0, "h", None),
+    7: (0, -1, -1, 0, "h", "w"),
+    8: (0, -1, 1, 0, None, "w"),
+}
+
+
+def is_transposed(orientation):
+    """摆正后宽高是否互换（exif方向5~8）"""
+    return orientation in utils.TRANSPOSED_ORIENTATIONS
+
+
+def orientation_transform(orientation, width, height):
+    """把文件中（未摆正）的像素坐标映射到按exif摆正后的坐标的变换
+
+    与PIL的apply_exif_orientation效果相同，但不移动任何像素，只作为图元的变换使用
+
+    Args:
+        orientation(int): exif方向（1~8）
+        width(float): 文件中图片的宽度（未摆正）
+        height(float): 文件中图片的高度（未摆正）
+
+    Returns:
+        QTransform: 坐标变换
+
+    """
+    m11, m12, m21, m22, dx, dy = _ORIENTATION_MATRICES.get(orientation, _ORIENTATION_MATRICES[1])
+    size = {"w": width, "h": height, None: 0}
+    return QtGui.QTransform(m11, m12, m21, m22, size[dx], size[dy])
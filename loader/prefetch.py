@@ -0,0 +1,122 @@
+import logging
+
+from PyQt5 import QtCore
+
+import utils
+from .document import load_document
+from .pyramid import TILED_IMAGE_PIXELS
+
+logger = logging.getLogger("labelall")
+
+
+class _PrefetchTask(QtCore.QRunnable):
+    """
+    在线程池中预先解码一张图片的任务
+
+    """
+    def __init__(self, prefetcher, path, generation, fit_size):
+        super(_PrefetchTask, self).__init__()
+        self.prefetcher = prefetcher
+        self.path = path
+        self.generation = generation
+        self.fit_size = fit_size
+
+    def run(self):
+        prefetcher = self.prefetcher
+        try:
+            # 用户已经跳到别处，这个预取已经过期，不再解码
+            if self.generation != prefetcher.generation or self.path in prefetcher.cache:
+                return
+            # 超大图片打开时走瓦片金字塔，预取整张解码会耗尽内存，直接跳过
+            size = utils.read_image_size(self.path)
+            if size is not None and size[0] * size[1] >= TILED_IMAGE_PIXELS:
+                return
+            result = load_document(self.path, fit_size=self.fit_size)
+            prefetcher.cache.put(self.path, result, result.nbytes)
+        except Exception:
+            logger.exception("Failed prefetching: {}".format(self.path))
+        finally:
+            prefetcher.finishTask(self.path)
+
+
+class Prefetcher(QtCore.QObject):
+    """
+    在工作线程中预先解码当前图片前后的若干张图片，结果放入LRU缓存；
+    达到TILED_IMAGE_PIXELS的超大图片不预取，打开时由AsyncLoader生成瓦片金字塔
+
+    Attributes:
+        cache(LRUCache): 存放LoadResult的缓存，键为图片路径
+        radius(int): 当前图片前后各预取的张数
+        generation(int): 预取的批次号，每次跳转加一，旧批次中尚未开始的任务直接放弃
+        pool(QThreadPool): 执行预取的线程池
+
+    """
+    def __init__(self, cache, radius=2, max_workers=2, parent=None):
+        super(Prefetcher, self).__init__(parent)
+        self.cache = cache
+        self.radius = radius
+        self.generation = 0
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max_workers)
+        self._pending = set()
+        self._mutex = QtCore.QMutex()
+
+    def prefetch(self, paths, row, fit_size=None):
+        """
+        以第row张为中心预取前后radius张图片，并取消之前尚未开始的预取
+
+        Args:
+            paths(list): 文件夹中所有图片的路径
+            row(int): 当前图片在paths中的序号
+            fit_size(tuple): 需要适应的窗口的(宽, 高)，给出时JPEG预取为代理图
+
+        """
+        self.cancel()
+        for offset in range(1, self.radius + 1):
+            for index in (row + offset, row - offset):  # 先取下一张，再取上一张
+                if 0 <= index < len(paths):
+                    self._submit(paths[index], fit_size)
+
+    def take(self, path):
+        """
+        从缓存中取出某张图片的加载结果，若磁盘上的文件已经改动、或者是超大图片的整张解码则作废
+
+        Args:
+            path(str): 图片路径
+
+        Returns:
+            LoadResult: 命中时返回加载结果，否则返回None
+
+        """
+        result = self.cache.get(path)
+        if result is None:
+            return None
+        image = result.loaded_image
+        if image is not None and image.full_width * image.full_height >= TILED_IMAGE_PIXELS:
+            self.cache.discard(path)
+            return None
+        if not result.isFresh():
+            self.cache.discard(path)
+            return None
+        return result
+
+    def cancel(self):
+        """
+        放弃所有尚未开始的预取任务，正在解码的任务完成后仍会写入缓存
+
+        """
+        self.generation += 1
+        self.pool.clear()
+        with QtCore.QMutexLocker(self._mutex):
+            self._pending.clear()
+
+    def finishTask(self, path):
+        with QtCore.QMutexLocker(self._mutex):
+            self._pending.discard(path)
+
+    def _submit(self, path, fit_size):
+        with QtCore.QMutexLocker(self._mutex):
+            if path in self._pending or path in self.cache:
+                return
+            self._pending.add(path)
+        self.pool.start(_PrefetchTask(self, path, self.generation, fit_size))
@@ -0,0 +1,73 @@
+import logging
+
+from PyQt5 import QtCore
+
+from .engine import decode_image_data
+
+logger = logging.getLogger("labelall")
+
+
+class _FullResolutionTask(QtCore.QRunnable):
+    """
+    在工作线程中按原始分辨率解码图片的任务
+
+    """
+    def __init__(self, full_loader, filename, data):
+        super(_FullResolutionTask, self).__init__()
+        self.full_loader = full_loader
+        self.filename = filename
+        self.data = data
+
+    def run(self):
+        loaded_image = decode_image_data(self.data)
+        if loaded_image is None:
+            logger.error("Failed decoding full resolution: {}".format(self.filename))
+            return
+        self.full_loader.signals.loaded.emit(self.filename, loaded_image)
+
+
+class _FullResolutionSignals(QtCore.QObject):
+    loaded = QtCore.pyqtSignal(str, object)
+
+
+class FullResolutionLoader(QtCore.QObject):
+    """
+    当前显示的是代理图、而用户放大超过代理图的1:1时，在后台按原始分辨率解码同一份字节
+
+    Attributes:
+        pool(QThreadPool): 解码用的线程池
+        requested(str): 已经提交解码请求的文件，避免重复解码
+
+    """
+    loaded = QtCore.pyqtSignal(str, object)
+
+    def __init__(self, parent=None):
+        super(FullResolutionLoader, self).__init__(parent)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.requested = None
+        self.signals = _FullResolutionSignals()
+        self.signals.loaded.connect(self.loaded)
+
+    def request(self, filename, data):
+        """
+        请求按原始分辨率解码
+
+        Args:
+            filename(str): 当前图片的路径，结果返回时用于核对是否仍是当前图片
+            data(bytes): 图片文件的原始字节
+
+        """
+        if self.requested == filename:
+            return
+        self.requested = filename
+        self.pool.clear()
+        self.pool.start(_FullResolutionTask(self, filename, data))
+
+    def reset(self):
+        """
+        切换图片时调用，放弃尚未开始的解码
+
+        """
+        self.requested = None
+        self.pool.clear()
@@ -0,0 +1,310 @@
+import json
+import logging
+import math
+import mmap
+import os
+import os.path as osp
+import shutil
+import tempfile
+
+import numpy as np
+import PIL.Image
+from PyQt5 import QtCore, QtGui
+
+import utils
+from utils.paths import cache_dir, file_key
+from .engine import pil_to_qimage
+
+logger = logging.getLogger("labelall")
+PIL.Image.MAX_IMAGE_PIXELS = None
+
+TILE_SIZE = 512  # 瓦片边长（像素）
+TILED_IMAGE_PIXELS = 100 * 1000 * 1000  # 达到这个像素数的图片以瓦片金字塔的方式显示，不整张解码
+_META_NAME = "meta.json"
+_CHANNELS = {"L": (), "RGB": (3,), "RGBA": (4,)}  # 瓦片的模式 -> numpy数组除宽高以外的维度
+# 可以直接解码到映射文件中的模式 -> PIL内部每个像素占的字节数（其余模式如"1"的内部布局与map_buffer不一致）
+_MAPPED_MODES = {"L": 1, "P": 1, "I;16": 2, "I;16B": 2, "LA": 4, "RGB": 4, "RGBA": 4, "CMYK": 4, "I": 4, "F": 4}
+
+
+class Pyramid(object):
+    """
+    保存在磁盘上的多分辨率瓦片金字塔，第0层为原始分辨率，每往上一层宽高减半
+
+    瓦片保持文件中的方向（未按exif摆正），显示时用图元的变换摆正，见orientation_transform
+
+    Attributes:
+        directory(str): 金字塔所在文件夹
+        width(int): 原图按exif摆正后的宽度，即标注坐标系的宽度
+        height(int): 原图按exif摆正后的高度
+        raw_width(int): 原图在文件中（未摆正）的宽度，瓦片按这个方向切分
+        raw_height(int): 原图在文件中（未摆正）的高度
+        orientation(int): exif方向（1~8）
+        tile_size(int): 瓦片边长
+        levels(int): 层数
+        ext(str): 瓦片文件的扩展名
+
+    """
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.raw_width = meta["width"]
+        self.raw_height = meta["height"]
+        # 旧版本生成的金字塔已经把像素摆正，没有记录方向
+        self.orientation = meta.get("orientation", 1)
+        self.tile_size = meta["tile_size"]
+        self.levels = meta["levels"]
+        self.ext = meta["ext"]
+        if self.orientation in utils.TRANSPOSED_ORIENTATIONS:
+            self.width, self.height = self.raw_height, self.raw_width
+        else:
+            self.width, self.height = self.raw_width, self.raw_height
+
+    def level_size(self, level):
+        """
+        第level层（未摆正）的宽和高
+
+        """
+        scale = 2 ** level
+        return int(math.ceil(self.raw_width / scale)), int(math.ceil(self.raw_height / scale))
+
+    def tile_count(self, level):
+        """
+        第level层的瓦片列数和行数
+
+        """
+        width, height = self.level_size(level)
+        return int(math.ceil(width / self.tile_size)), int(math.ceil(height / self.tile_size))
+
+    def tile_path(self, level, col, row):
+        return osp.join(self.directory, str(level), "{}_{}{}".format(col, row, self.ext))
+
+    def read_tile(self, level, col, row):
+        """
+        从磁盘读取并解码一个瓦片
+
+        Returns:
+            PIL.Image: 瓦片图片
+
+        """
+        image = PIL.Image.open(self.tile_path(level, col, row))
+        image.load()
+        return image
+
+
+def _decode_to_disk(image, filename):
+    """把图片解码到磁盘上的映射文件中，而不是一整块内存（超大图片解码后可能比内存还大）
+
+    Args:
+        image(PIL.Image): 刚打开、尚未解码的图片
+        filename(str): 映射文件的路径
+
+    不在_MAPPED_MODES中的模式、或当前的PIL不支持这样映射时，照常解码到内存中
+
+    Returns:
+        mmap: 像素所在的映射，必须与image一同保留；照常解码时为None
+
+    """
+    if image.mode not in _MAPPED_MODES:
+        image.load()
+        return None
+    width, height = image.size
+    stride = width * _MAPPED_MODES[image.mode]
+    with open(filename, "w+b") as f:
+        f.truncate(stride * height)
+        buffer = mmap.mmap(f.fileno(), stride * height)
+    # 预先给出存放像素的位置，load时PIL直接解码到映射中，内存不足时操作系统可以把写好的部分换出到文件
+    try:
+        image.im = PIL.Image.core.map_buffer(buffer, image.size, "raw", 0, (image.mode, stride, 1))
+    except (AttributeError, TypeError, ValueError):
+        logger.warning("Cannot map {} pixels of mode {}, decoding in memory".format(image.size, image.mode))
+        buffer.close()
+        image.load()
+        return None
+    image.load()
+    return buffer
+
+
+def _write_levels(filename, directory, work_dir, tile_size):
+    """逐层切分瓦片，返回金字塔的meta；各层的像素都放在work_dir中的映射文件里，内存中每次只有一条瓦片高的像素"""
+    orientation = utils.read_exif_orientation(filename)
+    image = PIL.Image.open(filename)
+    mode = image.mode if image.mode in _CHANNELS else ("RGBA" if "A" in image.mode else "RGB")
+    # 有透明通道时用PNG，否则用JPEG，瓦片只用于显示
+    ext, format = (".png", "PNG") if mode == "RGBA" else (".jpg", "JPEG")
+    width, height = image.size
+    buffer = _decode_to_disk(image, osp.join(work_dir, "0"))
+
+    def read_strip(top, bottom):
+        return image.crop((0, top, width, bottom)).convert(mode)
+
+    level = 0
+    level_width, level_height = width, height
+    while True:
+        level_dir = osp.join(directory, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        last = max(level_width, level_height) <= tile_size
+        if not last:
+            # 下一层的像素：每一条切完瓦片后缩小一半写入（条的高度为偶数，与整张缩小的结果相同）
+            reduced = np.memmap(osp.join(work_dir, str(level + 1)), dtype=np.uint8, mode="w+",
+                                shape=(int(math.ceil(level_height / 2)), int(math.ceil(level_width / 2)))
+                                + _CHANNELS[mode])
+        for row in range(int(math.ceil(level_height / tile_size))):
+            top = row * tile_size
+            strip = read_strip(top, min(top + tile_size, level_height))
+            for col in range(int(math.ceil(level_width / tile_size))):
+                tile = strip.crop((col * tile_size, 0, min((col + 1) * tile_size, level_width), strip.height))
+                tile.save(osp.join(level_dir, "{}_{}{}".format(col, row, ext)), format=format, quality=90)
+            if not last:
+                reduced[top // 2:top // 2 + int(math.ceil(strip.height / 2))] = np.asarray(strip.reduce(2))
+        if last:
+            break
+        reduced.flush()
+        read_strip = lambda top, bottom, pixels=reduced: PIL.Image.fromarray(np.asarray(pixels[top:bottom]))
+        level_height, level_width = reduced.shape[:2]
+        level += 1
+    image.close()
+    if buffer is not None:
+        buffer.close()
+    return {"width": width, "height": height, "orientation": orientation, "tile_size": tile_size,
+            "levels": level + 1, "ext": ext}
+
+
+def build_pyramid(filename, directory, tile_size=TILE_SIZE):
+    """把一张超大图片切成多分辨率瓦片写入磁盘，只在第一次打开时执行
+
+    像素先解码到磁盘上的映射文件，再逐条切成瓦片并缩小成上一层，内存占用与图片大小无关；
+    临时文件约为原图解码后的大小，生成完后删除
+
+    Args:
+        filename(str): 图片的绝对路径
+        directory(str): 金字塔写入的文件夹
+        tile_size(int): 瓦片边长
+
+    Returns:
+        Pyramid: 生成的金字塔
+
+    """
+    work_dir = tempfile.mkdtemp(prefix="build-", dir=directory)
+    try:
+        meta = _write_levels(filename, directory, work_dir, tile_size)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    # meta.json最后写入，存在即表示金字塔完整
+    with open(osp.join(directory, _META_NAME), "w") as f:
+        json.dump(meta, f)
+    return Pyramid(directory, meta)
+
+
+def open_pyramid(filename, tile_size=TILE_SIZE):
+    """打开一张图片对应的瓦片金字塔，磁盘缓存中没有时先生成
+
+    Args:
+        filename(str): 图片的绝对路径
+        tile_size(int): 瓦片边长
+
+    Returns:
+        Pyramid: 瓦片金字塔
+
+    """
+    directory = cache_dir("pyramids", file_key(filename))
+    meta_path = osp.join(directory, _META_NAME)
+    if osp.exists(meta_path):
+        with open(meta_path) as f:
+            return Pyramid(directory, json.load(f))
+    logger.info("Building tile pyramid for {}".format(filename))
+    return build_pyramid(filename, directory, tile_size)
+
+
+class _TileTask(QtCore.QRunnable):
+    """
+    在线程池中读取并解码一个瓦片的任务
+
+    """
+    def __init__(self, tile_loader, pyramid, key):
+        super(_TileTask, self).__init__()
+        self.tile_loader = tile_loader
+        self.pyramid = pyramid
+        self.key = key
+
+    def run(self):
+        _, level, col, row = self.key
+        try:
+            array, qimage = pil_to_qimage(self.pyramid.read_tile(level, col, row))
+        except (IOError, SyntaxError, ValueError):
+            logger.error("Failed reading tile: {}".format(self.key))
+            qimage = None
+        else:
+            qimage = qimage.copy()  # 与numpy数组脱离，跨线程传递
+        self.tile_loader.signals.loaded.emit(self.key, qimage)
+
+
+class _TileSignals(QtCore.QObject):
+    loaded = QtCore.pyqtSignal(object, object)
+
+
+class TileLoader(QtCore.QObject):
+    """
+    按需在工作线程中解码瓦片，解码后的QPixmap保存在LRU缓存中
+
+    新请求的瓦片优先解码；排队的请求过多时（视图已经移走）直接丢弃旧的请求，
+    仍然可见的瓦片会在下一次重绘时重新请求
+
+    Attributes:
+        cache(LRUCache): 瓦片QPixmap的缓存，键为(金字塔目录, 层, 列, 行)
+        pool(QThreadPool): 解码瓦片的线程池
+
+    """
+    tileReady = QtCore.pyqtSignal(object)
+    max_pending = 64
+
+    def __init__(self, cache, max_workers=4, parent=None):
+        super(TileLoader, self).__init__(parent)
+        self.cache = cache
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max_workers)
+        self.signals = _TileSignals()
+        self.signals.loaded.connect(self._onLoaded)
+        self._pending = set()
+        self._priority = 0
+
+    def tileKey(self, pyramid, level, col, row):
+        return pyramid.directory, level, col, row
+
+    def pixmap(self, pyramid, level, col, row, request=True):
+        """
+        取出一个已经解码的瓦片，没有时（可选地）提交解码请求
+
+        Returns:
+            QPixmap: 瓦片，尚未解码时返回None
+
+        """
+        key = self.tileKey(pyramid, level, col, row)
+        pixmap = self.cache.get(key)
+        if pixmap is None and request and key not in self._pending:
+            if len(self._pending) >= self.max_pending:
+                self.pool.clear()
+                self._pending.clear()
+            self._pending.add(key)
+            self._priority += 1
+            self.pool.start(_TileTask(self, pyramid, key), self._priority)
+        return pixmap
+
+    def loadNow(self, pyramid, level, col, row):
+        """
+        在当前线程中立即解码一个瓦片（用于最顶层的小图，保证随时有内容可画）
+
+        """
+        key = self.tileKey(pyramid, level, col, row)
+        if key not in self.cache:
+            array, qimage = pil_to_qimage(pyramid.read_tile(level, col, row))
+            self._store(key, QtGui.QPixmap.fromImage(qimage))
+
+    def _store(self, key, pixmap):
+        self.cache.put(key, pixmap, pixmap.width() * pixmap.height() * 4)
+
+    def _onLoaded(self, key, qimage):
+        if qimage is None:
+            # 读取失败的瓦片留在_pending中，不再反复请求
+            return
+        self._pending.discard(key)
+        self._store(key, QtGui.QPixmap.fromImage(qimage))
+        self.tileReady.emit(key)
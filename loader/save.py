@@ -0,0 +1,117 @@
+import logging
+
+from PyQt5 import QtCore
+
+from label_file import LabelFile
+
+logger = logging.getLogger("labelall")
+
+
+class _SaveSignals(QtCore.QObject):
+    finished = QtCore.pyqtSignal(str, str, object)  # 文件路径, 错误信息（成功时为空字符串）, context
+
+
+class _SaveTask(QtCore.QRunnable):
+    """
+    在工作线程中生成imagePath、imageData，编码并原子地写入标注文件（json或二进制格式）的任务
+
+    """
+    def __init__(self, service, filename, data, encoder, context):
+        super(_SaveTask, self).__init__()
+        self.service = service
+        self.filename = filename
+        self.data = data
+        self.encoder = encoder
+        self.context = context
+
+    def run(self):
+        message = ""
+        try:
+            if self.encoder is not None:
+                self.data.update(self.encoder.fields(self.filename))
+            LabelFile.write(self.filename, self.data)
+        except Exception as e:
+            logger.exception("Failed saving: {}".format(self.filename))
+            message = str(e) or type(e).__name__
+        self.service.signals.finished.emit(self.filename, message, self.context)
+
+
+class SaveService(QtCore.QObject):
+    """
+    在后台保存json：GUI线程只负责把标注复制成普通的字典（见serializer.to_dict），
+    编码、base64和写盘都在工作线程中完成，保存期间可以继续标注
+
+    同一时间只有一个保存在进行；期间对同一个文件的多次保存只保留最新的一份，
+    当前保存结束后再写入，因此连续按Ctrl+S不会排起长队，也不会让旧内容覆盖新内容
+
+    Attributes:
+        pool(QThreadPool): 执行保存的线程池（单线程，保证同一文件的写入按顺序进行）
+
+    """
+    saved = QtCore.pyqtSignal(str, object)  # 文件路径, context
+    failed = QtCore.pyqtSignal(str, str)
+
+    def __init__(self, parent=None):
+        super(SaveService, self).__init__(parent)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._running = None
+        self._pending = {}  # 文件路径 -> (data, encoder, context)，dict保持提交顺序
+        self.signals = _SaveSignals()
+        self.signals.finished.connect(self._onFinished)
+
+    def save(self, filename, data, encoder=None, context=None):
+        """
+        请求保存，尚未开始写入的同一文件的旧请求会被替换
+
+        Args:
+            filename(str): 标注文件的路径，后缀决定写入的格式（见LabelFile.write）
+            data(dict): serializer.to_dict的结果，之后不能再被修改
+            encoder(ImageDataEncoder): 给出时在工作线程中用它填写imagePath与imageData
+            context(object): 任意对象，这份快照写入成功时随saved信号返回
+
+        """
+        self._pending.pop(filename, None)
+        self._pending[filename] = (data, encoder, context)
+        if self._running is None:
+            self._startNext()
+
+    def isSaving(self, filename=None):
+        """
+        是否还有没有写完的保存
+
+        Args:
+            filename(str): 只检查这个文件，为None时检查所有文件
+
+        Returns:
+            bool: 正在写入或等待写入时为True
+
+        """
+        if filename is None:
+            return self._running is not None or bool(self._pending)
+        return self._running == filename or filename in self._pending
+
+    def waitForDone(self):
+        """
+        阻塞直到所有保存都写入磁盘，退出程序前调用
+
+        """
+        while self.isSaving():
+            self.pool.waitForDone()
+            # 排队的结果信号需要在这里处理，才会开始下一个保存
+            QtCore.QCoreApplication.sendPostedEvents()
+
+    def _startNext(self):
+        filename = next(iter(self._pending))
+        data, encoder, context = self._pending.pop(filename)
+        self._running = filename
+        self.pool.start(_SaveTask(self, filename, data, encoder, context))
+
+    def _onFinished(self, filename, message, context):
+        self._running = None
+        if message:
+            self.failed.emit(filename, message)
+        else:
+            self.saved.emit(filename, context)
+        if self._pending:
+            self._startNext()
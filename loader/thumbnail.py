@@ -0,0 +1,155 @@
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import logging
+import multiprocessing
+import os
+
+from PyQt5 import QtCore, QtGui
+
+from utils.thumbnail import make_thumbnail, thumbnail_path
+from .cache import LRUCache
+
+logger = logging.getLogger("labelall")
+
+
+class _ThumbnailSignals(QtCore.QObject):
+    """
+    进程池的回调线程向GUI线程汇报结果用的信号
+
+    """
+    finished = QtCore.pyqtSignal(str, str)  # 图片路径, 缩略图路径
+    failed = QtCore.pyqtSignal(str, bool)  # 图片路径, 是否是进程池崩溃（此时之后可以重试）
+
+
+class ThumbnailService(QtCore.QObject):
+    """
+    缩略图服务：缩略图保存在以文件内容为键的磁盘缓存中（见utils.thumbnail），缺少时在进程池中生成，
+    读入后的QPixmap再放在内存的LRU缓存中。文件对话框的预览、文件列表和滑动条共用同一个服务
+
+    Attributes:
+        cache(LRUCache): QPixmap的内存缓存，键为缩略图路径
+        max_workers(int): 生成缩略图的进程数
+
+    """
+    thumbnailReady = QtCore.pyqtSignal(str)
+    max_pending = 256
+
+    def __init__(self, cache_bytes=64 * 1024 * 1024, max_workers=None, parent=None):
+        super(ThumbnailService, self).__init__(parent)
+        self.cache = LRUCache(cache_bytes)
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self._executor = None
+        self._pending = collections.OrderedDict()  # 图片路径 -> Future，按提交顺序
+        self._failed = set()
+        self.signals = _ThumbnailSignals()
+        self.signals.finished.connect(self._onFinished)
+        self.signals.failed.connect(self._onFailed)
+
+    def cached(self, filename):
+        """
+        只从内存或磁盘缓存中取缩略图，不会提交生成任务
+
+        Args:
+            filename(str): 图片的绝对路径
+
+        Returns:
+            QPixmap: 缩略图，没有缓存时返回None
+
+        """
+        try:
+            path = thumbnail_path(filename)
+        except OSError:
+            return None
+        pixmap = self.cache.get(path)
+        if pixmap is None and os.path.exists(path):
+            pixmap = self._store(path)
+        return pixmap
+
+    def pixmap(self, filename, request=True):
+        """
+        取出缩略图，没有缓存时（可选地）在后台生成，生成后发出thumbnailReady信号
+
+        Args:
+            filename(str): 图片的绝对路径
+            request(bool): 没有缓存时是否提交生成任务
+
+        Returns:
+            QPixmap: 缩略图，尚未生成时返回None
+
+        """
+        pixmap = self.cached(filename)
+        if pixmap is None and request:
+            self.request(filename)
+        return pixmap
+
+    def request(self, filename):
+        """
+        提交生成缩略图的任务；排队的任务过多时放弃最早的、尚未开始的任务（对应的行多半已经滚出视图）
+
+        Args:
+            filename(str): 图片的绝对路径
+
+        """
+        if filename in self._pending or filename in self._failed:
+            return
+        if len(self._pending) >= self.max_pending:
+            _, future = self._pending.popitem(last=False)
+            future.cancel()
+        try:
+            future = self._getExecutor().submit(make_thumbnail, filename)
+        except concurrent.futures.process.BrokenProcessPool:
+            self._executor = None
+            future = self._getExecutor().submit(make_thumbnail, filename)
+        self._pending[filename] = future
+        future.add_done_callback(lambda f, filename=filename: self._done(filename, f))
+
+    def shutdown(self):
+        """
+        退出程序时结束进程池，放弃尚未开始的任务
+
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._pending.clear()
+
+    def _getExecutor(self):
+        if self._executor is None:
+            # 不用fork：GUI进程中已有多个线程，fork出的子进程可能卡在被复制的锁上
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _done(self, filename, future):
+        # 在进程池的回调线程中执行，只通过信号把结果交给GUI线程
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error("Failed making thumbnail: {} ({})".format(filename, error))
+            self.signals.failed.emit(filename, isinstance(error, concurrent.futures.process.BrokenProcessPool))
+        else:
+            self.signals.finished.emit(filename, future.result())
+
+    def _store(self, path):
+        pixmap = QtGui.QPixmap(path)
+        if pixmap.isNull():
+            return None
+        self.cache.put(path, pixmap, pixmap.width() * pixmap.height() * 4)
+        return pixmap
+
+    def _onFinished(self, filename, path):
+        self._pending.pop(filename, None)
+        if self._store(path) is not None:
+            self.thumbnailReady.emit(filename)
+
+    def _onFailed(self, filename, broken):
+        self._pending.pop(filename, None)
+        if broken:
+            # 子进程异常退出，丢弃进程池，之后的请求会新建一个
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        else:
+            self._failed.add(filename)  # 不是图片或已损坏，不再反复生成
@@ -1,4 +1,3 @@
-from app import Window
 from PyQt5.QtWidgets import QApplication
 import sys
 
@@ -8,6 +7,8 @@ def main():
     运行程序的函数
 
     """
+    # 生成缩略图的子进程（spawn）会重新导入本模块，所以界面模块在这里才导入
+    from app import Window
     app = QApplication(sys.argv)
     window = Window()
     window.show()
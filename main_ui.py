@@ -44,6 +44,11 @@ class UiMain(object):
         actionDelete(QAction): 删除动作按钮
         actionOpenDir(QAction): 打开目录动作按钮
         action_edit_label(QAction): 编辑动作按钮
+        menu_image_data(QMenu): 菜单栏“文件”中选择保存json时图片数据处理方式的子菜单
+        action_image_external(QAction): 图片数据不内嵌，只记录图片的相对路径
+        action_image_embedded(QAction): 内嵌图片数据，每个文档只编码一次
+        action_image_deduplicated(QAction): 内嵌图片数据，相同的图片在文档之间共用编码结果
+        image_data_group(QActionGroup): 上面三个互斥的动作
         actionVideo(QAction): 打开视频动作按钮
 
     """
@@ -223,6 +228,17 @@ class UiMain(object):
         self.menu_F.addAction(self.actionOpenDir)
         self.menu_F.addAction(self.actionSave)
         self.menu_F.addAction(self.actionSaveAs)
+        self.menu_image_data = QtWidgets.QMenu(self.menu_F)
+        self.image_data_group = QtWidgets.QActionGroup(MainWindow)
+        self.action_image_external = QtWidgets.QAction(MainWindow)
+        self.action_image_embedded = QtWidgets.QAction(MainWindow)
+        self.action_image_deduplicated = QtWidgets.QAction(MainWindow)
+        for action in (self.action_image_external, self.action_image_embedded, self.action_image_deduplicated):
+            action.setCheckable(True)
+            self.image_data_group.addAction(action)
+            self.menu_image_data.addAction(action)
+        self.action_image_embedded.setChecked(True)
+        self.menu_F.addAction(self.menu_image_data.menuAction())
         self.menu_F.addAction(self.actionExit)
         self.menu_E.addAction(self.actionZoom_In)
         self.menu_E.addAction(self.actionZoom_Out)
@@ -269,6 +285,10 @@ class UiMain(object):
         self.actionOpenDir.setText(_translate("MainWindow", "打开目录"))
         self.actionVideo.setText(_translate("MainWindow", "视频"))
         self.actionVideo.setToolTip(_translate("MainWindow", "视频"))
+        self.menu_image_data.setTitle(_translate("MainWindow", "保存图片数据"))
+        self.action_image_external.setText(_translate("MainWindow", "不内嵌（只记录相对路径）"))
+        self.action_image_embedded.setText(_translate("MainWindow", "内嵌（每个文档只编码一次）"))
+        self.action_image_deduplicated.setText(_translate("MainWindow", "内嵌（相同图片共用编码）"))
 
 
 if __name__ == "__main__":
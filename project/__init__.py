@@ -0,0 +1,13 @@
+from .folder_cache import FolderCache
+from .folder_cache import cache_path
+from .index import ProjectIndex
+from .index import index_path
+from .index import parse_query
+from .index import read_file
+from .index import shape_geometry
+from .indexer import ProjectIndexer
+from .scanner import FolderScanner
+from .scanner import image_suffixes
+from .scanner import scan_folder
+from .watcher import FolderWatcher
+from .watcher import is_network_path
@@ -0,0 +1,449 @@
+import array
+import hashlib
+import io
+import logging
+import os
+import os.path as osp
+import struct
+
+import numpy as np
+
+import serializer
+from label_file import LabelFile
+from utils import read_image_size
+from utils.paths import cache_dir
+
+logger = logging.getLogger("labelall")
+
+MAGIC = b"LAFC"
+VERSION = 1
+HEADER = struct.Struct("<4sHIIQQ")  # MAGIC、版本、文件夹数、图片数、文件夹名长度、图片名长度
+
+# 每张图片一行：所在文件夹的序号、图片的修改时间与大小、图片尺寸、标注文件的修改时间、形状数
+FILE_DTYPE = np.dtype([
+    ("dir", "<i4"),
+    ("mtime", "<i8"),
+    ("size", "<i8"),
+    ("width", "<i4"),
+    ("height", "<i4"),
+    ("label_mtime", "<i8"),
+    ("shapes", "<i4"),
+])
+SIZE_UNREAD = 0  # width：还没有读取图片的文件头
+SIZE_UNKNOWN = -1  # width：文件头无法识别，不再重试
+LABEL_NONE = -1  # label_mtime：没有标注文件
+LABEL_UNREAD = -2  # label_mtime：还没有检查标注文件
+
+ROOT = ""  # 打开的文件夹本身的相对路径
+
+
+def cache_path(folder):
+    """文件夹的文件列表缓存的路径：放在用户缓存目录下，写入缓存不会改变文件夹本身的修改时间
+
+    Args:
+        folder(str): 打开的文件夹
+
+    Returns:
+        str: 缓存文件的路径
+
+    """
+    key = hashlib.sha1(osp.abspath(folder).encode("utf-8")).hexdigest()
+    return osp.join(cache_dir("folders"), key + ".cache")
+
+
+def _join(names):
+    return "\0".join(names).encode("utf-8", "surrogateescape")
+
+
+def _split(raw, count):
+    if not count:
+        return []
+    return raw.decode("utf-8", "surrogateescape").split("\0")
+
+
+class FolderCache(object):
+    """一个文件夹的文件列表缓存：遍历到的每个文件夹的修改时间，以及每张图片的修改时间、尺寸和标注概况
+
+    文件夹中增加、删除或重命名文件后文件夹的修改时间会改变，所以重新打开时只需要stat每个文件夹，
+    修改时间没变的文件夹直接沿用缓存的内容，只重新列出修改时间变了的文件夹（见scan）。
+    原地改写（而不是先写临时文件再替换）的标注文件不会改变文件夹的修改时间，这样的修改要等文件夹中
+    有其它变化时才会被发现；本程序保存时总是替换文件（见serializer.write_atomic）
+
+    Attributes:
+        folder(str): 文件夹的绝对路径
+        dirs(list): 遍历顺序的文件夹相对路径，ROOT为文件夹本身
+        dir_mtimes(list): 每个文件夹的修改时间（纳秒）
+        names(list): 每张图片的文件名
+        files(np.ndarray): 每张图片一行，见FILE_DTYPE，按遍历顺序排列（同一个文件夹的图片相邻）
+
+    """
+    def __init__(self, folder, dirs=None, dir_mtimes=None, names=None, files=None):
+        self.folder = osp.abspath(folder)
+        self.dirs = dirs or []
+        self.dir_mtimes = dir_mtimes or []
+        self.names = names or []
+        self.files = files if files is not None else np.zeros(0, dtype=FILE_DTYPE)
+
+    def __len__(self):
+        return len(self.names)
+
+    def path(self, row):
+        """第row张图片的绝对路径"""
+        directory = self.dirs[self.files["dir"][row]]
+        return osp.join(self.folder, directory, self.names[row]) if directory else osp.join(self.folder, self.names[row])
+
+    def paths(self):
+        """所有图片的绝对路径，按遍历顺序"""
+        prefixes = [osp.join(self.folder, directory, "") if directory else osp.join(self.folder, "")
+                    for directory in self.dirs]
+        return [prefixes[index] + name for index, name in zip(self.files["dir"].tolist(), self.names)]
+
+    def info(self, rows):
+        """一些图片的标注概况，格式与ProjectIndex.summaries相同（全部图片的概况用columns）
+
+        Args:
+            rows(iterable): 图片的序号
+
+        Returns:
+            dict: 图片的绝对路径 -> (是否有标注文件, 形状数, 宽, 高)，宽高未知时为None；未读取的图片不包括在内
+
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        files = self.files[rows]
+        label_mtimes = files["label_mtime"]
+        labeled = label_mtimes >= 0
+        shapes = np.where(labeled, files["shapes"], 0).tolist()
+        known = (files["width"] > 0) & (files["height"] > 0)
+        widths = np.where(known, files["width"], 0).tolist()
+        heights = np.where(known, files["height"], 0).tolist()
+        return {self.path(row): (is_labeled, count, width or None, height or None)
+                for row, is_read, is_labeled, count, width, height
+                in zip(rows.tolist(), (label_mtimes != LABEL_UNREAD).tolist(), labeled.tolist(), shapes, widths, heights)
+                if is_read}
+
+    def columns(self):
+        """按paths的顺序给出每张图片的标注状态、形状数与尺寸，可以直接交给FileListModel.setFiles
+
+        Returns:
+            tuple: (状态, 形状数, 宽, 高)四个array.array；状态与FileListModel的STATUS_*相同
+                （-1未读取、0没有标注文件、1有标注文件），形状数未读取时为-1，尺寸未知时为0
+
+        """
+        files = self.files
+        label_mtimes = files["label_mtime"]
+        status = np.where(label_mtimes == LABEL_UNREAD, -1, label_mtimes != LABEL_NONE).astype("b")
+        shapes = np.where(label_mtimes == LABEL_UNREAD, -1, np.where(label_mtimes >= 0, files["shapes"], 0))
+        known = (files["width"] > 0) & (files["height"] > 0)
+        columns = (status, shapes.astype("i"), np.where(known, files["width"], 0).astype("i"),
+                   np.where(known, files["height"], 0).astype("i"))
+        return tuple(array.array(column.dtype.char, column.tobytes()) for column in columns)
+
+    def dir_ranges(self):
+        """每个文件夹的图片在files中的范围
+
+        Returns:
+            dict: 文件夹相对路径 -> (起, 止)
+
+        """
+        dir_column = self.files["dir"]
+        ranges = {}
+        if len(dir_column):
+            # 同一个文件夹的图片相邻，找出序号变化的位置
+            starts = np.flatnonzero(np.r_[True, dir_column[1:] != dir_column[:-1]])
+            ends = np.r_[starts[1:], len(dir_column)]
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                ranges[self.dirs[dir_column[start]]] = (start, end)
+        return ranges
+
+    def dumps(self):
+        dir_blob = _join(self.dirs)
+        name_blob = _join(self.names)
+        return b"".join([
+            HEADER.pack(MAGIC, VERSION, len(self.dirs), len(self.names), len(dir_blob), len(name_blob)),
+            np.asarray(self.dir_mtimes, dtype="<i8").tobytes(),
+            np.ascontiguousarray(self.files, dtype=FILE_DTYPE).tobytes(),
+            dir_blob,
+            name_blob,
+        ])
+
+    @classmethod
+    def loads(cls, folder, raw):
+        magic, version, dir_count, file_count, dir_length, name_length = HEADER.unpack_from(raw)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a folder cache of version {}".format(VERSION))
+        offset = HEADER.size
+        dir_mtimes = np.frombuffer(raw, dtype="<i8", count=dir_count, offset=offset).tolist()
+        offset += dir_count * 8
+        files = np.frombuffer(raw, dtype=FILE_DTYPE, count=file_count, offset=offset).copy()
+        offset += file_count * FILE_DTYPE.itemsize
+        dirs = _split(raw[offset:offset + dir_length], dir_count)
+        offset += dir_length
+        names = _split(raw[offset:offset + name_length], file_count)
+        if len(dirs) != dir_count or len(names) != file_count:
+            raise ValueError("Corrupted folder cache")
+        return cls(folder, dirs, dir_mtimes, names, files)
+
+    def save(self, filename=None):
+        """原子地写入缓存文件（不需要fsync，缓存丢失时重新遍历即可）
+
+        Args:
+            filename(str): 缓存文件的路径，默认为cache_path(folder)
+
+        """
+        serializer.write_atomic(filename or cache_path(self.folder), self.dumps(), fsync=False)
+
+    @classmethod
+    def load(cls, folder, filename=None):
+        """读取缓存文件
+
+        Args:
+            folder(str): 文件夹路径
+            filename(str): 缓存文件的路径，默认为cache_path(folder)
+
+        Returns:
+            FolderCache: 缓存，没有缓存或缓存无法读取时返回None
+
+        """
+        filename = filename or cache_path(folder)
+        try:
+            with io.open(filename, "rb") as f:
+                return cls.loads(folder, f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error):
+            logger.warning("Ignoring unreadable folder cache: {}".format(filename))
+            return None
+
+
+def _label_file(names, name):
+    """同一个文件夹中图片的标注文件名（先json后二进制格式，与LabelFile.find相同），没有时返回None"""
+    stem = osp.splitext(name)[0]
+    for suffix in (LabelFile.suffix, LabelFile.binary_suffix):
+        if stem + suffix in names:
+            return stem + suffix
+    return None
+
+
+def scan(folder, suffixes, previous=None, cancelled=None, on_files=None):
+    """遍历文件夹（顺序与scanner.scan_folder相同），修改时间没变的文件夹沿用previous中的内容
+
+    列出的文件夹中，修改时间与大小都没变的图片保留已读取的尺寸；标注文件的修改时间变了的图片需要重新读取标注，
+    新的图片尺寸与标注都标记为未读取，由fill_info补全
+
+    Args:
+        folder(str): 文件夹路径
+        suffixes(frozenset): 小写的图片后缀
+        previous(FolderCache): 上次的缓存，为None时全部重新列出
+        cancelled(callable): 返回True时停止遍历，此时返回None
+        on_files(callable): 每列出一个文件夹的图片后以[绝对路径]调用
+
+    Returns:
+        tuple: (FolderCache, 与previous相比是否有变化)
+
+    """
+    folder = osp.abspath(folder)
+    previous = previous or FolderCache(folder)
+    previous_dirs = dict(zip(previous.dirs, previous.dir_mtimes))
+    previous_ranges = previous.dir_ranges()
+    previous_rows = None  # 相对路径 -> 行号，第一次需要时才建立
+    children = {}
+    for directory in previous.dirs:
+        if directory != ROOT:
+            children.setdefault(osp.dirname(directory), []).append(directory)
+
+    dirs, dir_mtimes, names, chunks = [], [], [], []
+    changed = False
+    stack = [ROOT]
+    while stack:
+        if cancelled is not None and cancelled():
+            return None
+        directory = stack.pop()
+        absolute = osp.join(folder, directory) if directory else folder
+        try:
+            # 先取修改时间再列出，列出期间的修改下次会被发现
+            mtime = os.stat(absolute).st_mtime_ns
+        except OSError:
+            changed = True
+            continue
+        index = len(dirs)
+        dirs.append(directory)
+        dir_mtimes.append(mtime)
+        if previous_dirs.get(directory) == mtime:
+            start, end = previous_ranges.get(directory, (0, 0))
+            chunk = previous.files[start:end].copy()
+            chunk["dir"] = index
+            dir_names = previous.names[start:end]
+            subdirs = children.get(directory, [])
+        else:
+            changed = True
+            if previous_rows is None:
+                previous_rows = {osp.join(previous.dirs[d], name): row for row, (d, name) in
+                                 enumerate(zip(previous.files["dir"].tolist(), previous.names))}
+            chunk, dir_names, subdirs = _list_directory(absolute, directory, index, suffixes,
+                                                        previous, previous_rows)
+        names.extend(dir_names)
+        chunks.append(chunk)
+        if on_files is not None and dir_names:
+            prefix = osp.join(absolute, "")
+            on_files([prefix + name for name in dir_names])
+        stack.extend(sorted(subdirs, reverse=True))
+
+    files = np.concatenate(chunks) if chunks else np.zeros(0, dtype=FILE_DTYPE)
+    cache = FolderCache(folder, dirs, dir_mtimes, names, files)
+    if changed:
+        # 文件夹的修改时间变了但内容没变（例如其中的临时文件已被删除）时不算变化
+        changed = dirs != previous.dirs or names != previous.names or files.tobytes() != previous.files.tobytes()
+    return cache, changed
+
+
+def diff(previous, cache):
+    """比较同一个文件夹先后两次的缓存（cache由scan(previous=previous)得到）
+
+    修改时间没变的文件夹内容相同，只比较重新列出的文件夹
+
+    Args:
+        previous(FolderCache): 之前的缓存
+        cache(FolderCache): 新的缓存
+
+    Returns:
+        tuple: (removed, inserted, updated)
+            removed(list): 已经不存在的图片的绝对路径
+            inserted(list): 新的图片[(绝对路径, 新列表中它前面一张图片的绝对路径，是第一张时为None)]，按新列表的顺序
+            updated(list): 仍然存在、但图片或标注文件被修改过的图片的绝对路径
+
+    """
+    old_ranges, new_ranges = previous.dir_ranges(), cache.dir_ranges()
+    old_mtimes = dict(zip(previous.dirs, previous.dir_mtimes))
+    new_dirs = set(cache.dirs)
+    removed, inserted, updated = [], [], []
+    for directory in previous.dirs:
+        if directory not in new_dirs:
+            start, end = old_ranges.get(directory, (0, 0))
+            removed.extend(previous.path(row) for row in range(start, end))
+    before = None
+    for index, directory in enumerate(cache.dirs):
+        start, end = new_ranges.get(directory, (0, 0))
+        if old_mtimes.get(directory) == cache.dir_mtimes[index]:
+            if end > start:
+                before = cache.path(end - 1)
+            continue
+        old_start, old_end = old_ranges.get(directory, (0, 0))
+        old_rows = {previous.names[row]: row for row in range(old_start, old_end)}
+        for row in range(start, end):
+            path = cache.path(row)
+            old = old_rows.pop(cache.names[row], None)
+            if old is None:
+                inserted.append((path, before))
+            else:
+                old_record, record = previous.files[old], cache.files[row]
+                if (old_record["mtime"] != record["mtime"] or old_record["size"] != record["size"]
+                        or old_record["label_mtime"] != record["label_mtime"]):
+                    updated.append(path)
+            before = path
+        removed.extend(previous.path(row) for row in old_rows.values())
+    return removed, inserted, updated
+
+
+def _list_directory(absolute, directory, index, suffixes, previous, previous_rows):
+    """列出一个修改过（或新的）文件夹，返回(图片行, 图片名, 子文件夹相对路径)"""
+    images, subdirs, entries = [], [], set()
+    try:
+        with os.scandir(absolute) as iterator:
+            for entry in iterator:
+                entries.add(entry.name)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            subdirs.append(osp.join(directory, entry.name) if directory else entry.name)
+                    elif osp.splitext(entry.name)[1].lower() in suffixes:
+                        images.append(entry)
+                except OSError:
+                    continue
+    except OSError as e:
+        logger.warning("Failed scanning folder {}: {}".format(absolute, e))
+    images.sort(key=lambda entry: entry.name)
+    chunk = np.zeros(len(images), dtype=FILE_DTYPE)
+    chunk["dir"] = index
+    chunk["label_mtime"] = LABEL_UNREAD
+    for row, entry in enumerate(images):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        record = chunk[row]
+        record["mtime"] = stat.st_mtime_ns
+        record["size"] = stat.st_size
+        old = previous_rows.get(osp.join(directory, entry.name))
+        if old is not None:
+            old_record = previous.files[old]
+            if old_record["mtime"] == stat.st_mtime_ns and old_record["size"] == stat.st_size:
+                record["width"] = old_record["width"]
+                record["height"] = old_record["height"]
+            label_name = _label_file(entries, entry.name)
+            if label_name is None:
+                label_mtime = LABEL_NONE
+            else:
+                try:
+                    label_mtime = os.stat(osp.join(absolute, label_name)).st_mtime_ns
+                except OSError:
+                    label_mtime = LABEL_UNREAD
+            if label_mtime == old_record["label_mtime"]:
+                record["label_mtime"] = label_mtime
+                record["shapes"] = old_record["shapes"]
+    return chunk, [entry.name for entry in images], subdirs
+
+
+def read_label_info(image_path):
+    """读取图片同名标注文件（见LabelFile.find）的修改时间与形状数
+
+    Args:
+        image_path(str): 图片的绝对路径
+
+    Returns:
+        tuple: (标注文件的修改时间, 形状数)，没有标注文件时为(LABEL_NONE, 0)
+
+    """
+    label_path = LabelFile.find(image_path)
+    try:
+        label_mtime = os.stat(label_path).st_mtime_ns
+    except (OSError, TypeError):
+        return LABEL_NONE, 0
+    try:
+        shapes = len(LabelFile(label_path).shapes)
+    except Exception:
+        # 损坏的标注文件按没有形状记录，修改时间不变就不再重试
+        logger.warning("Failed reading label file: {}".format(label_path))
+        shapes = 0
+    return label_mtime, shapes
+
+
+def fill_info(cache, batch_size=256, cancelled=None):
+    """补全缓存中尚未读取的图片尺寸（只读文件头）与标注概况，原地修改cache.files
+
+    Args:
+        cache(FolderCache): 缓存
+        batch_size(int): 每批的图片数
+        cancelled(callable): 返回True时停止
+
+    Yields:
+        list: 每读完一批后产生这一批的图片序号
+
+    """
+    files = cache.files
+    pending = np.flatnonzero((files["width"] == SIZE_UNREAD) | (files["label_mtime"] == LABEL_UNREAD))
+    for start in range(0, len(pending), batch_size):
+        if cancelled is not None and cancelled():
+            return
+        rows = pending[start:start + batch_size]
+        records = files[rows]
+        sizes = records[["width", "height"]].tolist()
+        labels = records[["label_mtime", "shapes"]].tolist()
+        for position, row in enumerate(rows.tolist()):
+            path = cache.path(row)
+            if sizes[position][0] == SIZE_UNREAD:
+                sizes[position] = read_image_size(path) or (SIZE_UNKNOWN, SIZE_UNKNOWN)
+            if labels[position][0] == LABEL_UNREAD:
+                labels[position] = read_label_info(path)
+        files["width"][rows], files["height"][rows] = np.array(sizes, dtype=np.int64).reshape(-1, 2).T
+        files["label_mtime"][rows], files["shapes"][rows] = np.array(labels, dtype=np.int64).reshape(-1, 2).T
+        yield rows.tolist()
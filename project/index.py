@@ -0,0 +1,328 @@
+import collections
+import hashlib
+import logging
+import os
+import os.path as osp
+import shlex
+import sqlite3
+
+from formats.dataset import shape_geometry
+from label_file import LabelFile
+from utils.paths import cache_dir
+
+logger = logging.getLogger("labelall")
+
+SCHEMA_VERSION = "1"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS files("
+    " id INTEGER PRIMARY KEY,"
+    " image_path TEXT NOT NULL UNIQUE,"  # 相对于文件夹的路径
+    " json_mtime INTEGER, json_size INTEGER,"  # 没有json时为NULL
+    " image_width INTEGER, image_height INTEGER,"
+    " shape_count INTEGER NOT NULL DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS shapes("
+    " file_id INTEGER NOT NULL, label TEXT, group_id INTEGER, shape_type TEXT,"
+    " xmin REAL, ymin REAL, xmax REAL, ymax REAL, area REAL)",
+    "CREATE INDEX IF NOT EXISTS shapes_file ON shapes(file_id)",
+    # 每张图片中每种(标签, 类型, 组号)的形状数，搜索只查这张表，行数与形状实例的个数无关
+    "CREATE TABLE IF NOT EXISTS file_labels("
+    " file_id INTEGER NOT NULL, label TEXT, shape_type TEXT, group_id INTEGER, count INTEGER NOT NULL)",
+    # 覆盖索引：按标签或类型查询时不需要回表
+    "CREATE INDEX IF NOT EXISTS file_labels_label ON file_labels(label, shape_type, group_id, file_id, count)",
+    "CREATE INDEX IF NOT EXISTS file_labels_type ON file_labels(shape_type, label, group_id, file_id, count)",
+    "CREATE INDEX IF NOT EXISTS file_labels_file ON file_labels(file_id)",
+)
+
+
+def index_path(folder):
+    """文件夹的索引数据库的路径：与文件列表缓存（见folder_cache.cache_path）一样放在用户缓存目录下
+
+    不写入数据集文件夹：数据库与WAL的-wal、-shm文件会改变文件夹的修改时间（使文件列表缓存失效、
+    触发FolderWatcher），而网络文件系统不支持WAL模式
+
+    Args:
+        folder(str): 打开的文件夹
+
+    Returns:
+        str: 数据库文件的路径
+
+    """
+    key = hashlib.sha1(osp.abspath(folder).encode("utf-8")).hexdigest()
+    return osp.join(cache_dir("projects"), key + ".sqlite")
+
+
+def json_stamp(image_path):
+    """图片同名标注文件（json或二进制格式，见LabelFile.find）的(修改时间, 大小)，没有标注文件时为(None, None)"""
+    json_path = LabelFile.find(image_path)
+    try:
+        stat = os.stat(json_path)
+    except (OSError, TypeError):
+        return None, None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_file(image_path):
+    """读取一张图片同名json中的形状，得到写入索引的内容（不依赖Qt，可以在子进程中执行）
+
+    Args:
+        image_path(str): 图片的绝对路径
+
+    Returns:
+        tuple: (image_path, (json修改时间, json大小), 图片宽, 图片高, [(label, group_id, shape_type, xmin, ymin, xmax, ymax, area)])
+
+    """
+    stamp = json_stamp(image_path)
+    if stamp[0] is None:
+        return image_path, stamp, None, None, []
+    json_path = LabelFile.find(image_path)
+    try:
+        label_file = LabelFile(json_path)
+    except Exception:
+        # 损坏的json按没有形状记录，修改时间不变就不再重试
+        logger.warning("Failed indexing: {}".format(json_path))
+        return image_path, stamp, None, None, []
+    rows = []
+    for shape in label_file.shapes:
+        group_id = shape["group_id"]
+        rows.append((shape["label"], group_id if isinstance(group_id, int) else None, shape["shape_type"])
+                    + shape_geometry(shape["shape_type"], shape["points"]))
+    return image_path, stamp, label_file.imageWidth, label_file.imageHeight, rows
+
+
+def parse_query(text):
+    """解析搜索框中的文字
+
+    空格分隔的每一项是一个标签（可以用*、?通配，带空格的标签用引号括起来），图片需要包含所有这些标签；
+    type:polygon、group:3这样的项限定形状的类型和组号，作用于每个标签
+
+    Args:
+        text(str): 搜索框中的文字
+
+    Returns:
+        tuple: (标签列表, {"shape_type": ..., "group_id": ...})
+
+    """
+    try:
+        terms = shlex.split(text)
+    except ValueError:
+        terms = text.split()
+    labels = []
+    qualifiers = {}
+    for term in terms:
+        key, sep, value = term.partition(":")
+        if sep and key in ("type", "group") and value:
+            if key == "type":
+                qualifiers["shape_type"] = value
+            elif value.lstrip("-").isdigit():
+                qualifiers["group_id"] = int(value)
+        else:
+            labels.append(term)
+    return labels, qualifiers
+
+
+def _shape_condition(label, qualifiers):
+    """一个标签加上限定条件对应的WHERE子句及参数"""
+    clauses, params = [], []
+    if label is not None:
+        clauses.append("label GLOB ?" if any(c in label for c in "*?[") else "label = ?")
+        params.append(label)
+    for column in ("shape_type", "group_id"):
+        if column in qualifiers:
+            clauses.append("{} = ?".format(column))
+            params.append(qualifiers[column])
+    return " AND ".join(clauses) or "1", params
+
+
+class ProjectIndex(object):
+    """一个文件夹的SQLite索引：每张图片一行文件信息，每个形状一行（标签、组号、类型、外接框、面积）
+
+    数据库使用WAL模式，后台线程写入时GUI线程可以同时查询；一个连接只能在创建它的线程中使用
+
+    Attributes:
+        folder(str): 文件夹的绝对路径
+        path(str): 数据库文件的路径
+        connection(sqlite3.Connection): 数据库连接
+
+    """
+    def __init__(self, folder, path=None):
+        self.folder = osp.abspath(folder)
+        self.path = path or index_path(self.folder)
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.connection:
+            version = None
+            if self.connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name='meta'").fetchone():
+                row = self.connection.execute("SELECT value FROM meta WHERE key='schema'").fetchone()
+                version = row[0] if row else None
+            if version not in (None, SCHEMA_VERSION):
+                # 旧版本的索引直接重建
+                for table in ("meta", "files", "shapes", "file_labels"):
+                    self.connection.execute("DROP TABLE IF EXISTS {}".format(table))
+            for statement in _SCHEMA:
+                self.connection.execute(statement)
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (SCHEMA_VERSION,))
+
+    def relative(self, image_path):
+        return osp.relpath(osp.abspath(image_path), self.folder)
+
+    def absolute(self, relative_path):
+        return osp.join(self.folder, relative_path)
+
+    def images_for_json(self, json_path):
+        """索引中与某个json同名的图片
+
+        Args:
+            json_path(str): json文件的路径
+
+        Returns:
+            list: 图片的绝对路径
+
+        """
+        stem = osp.splitext(self.relative(json_path))[0]
+        # 同名图片的相对路径都以"stem."开头，"/"是"."之后的下一个字符
+        rows = self.connection.execute(
+            "SELECT image_path FROM files WHERE image_path >= ? AND image_path < ?", (stem + ".", stem + "/"))
+        return [self.absolute(path) for path, in rows if osp.splitext(path)[0] == stem]
+
+    def stale(self, image_paths):
+        """找出同名json在上次建立索引之后新增、被修改或被删除的图片
+
+        Args:
+            image_paths(list): 文件夹中所有图片的绝对路径
+
+        Returns:
+            list: 需要重新读取的图片路径
+
+        """
+        stored = {path: (mtime, size) for path, mtime, size in
+                  self.connection.execute("SELECT image_path, json_mtime, json_size FROM files")}
+        return [path for path in image_paths if stored.get(self.relative(path), ()) != json_stamp(path)]
+
+    def update(self, results):
+        """在一个事务中写入若干张图片的读取结果，旧的形状先删除
+
+        Args:
+            results(list): read_file的返回值
+
+        """
+        with self.connection:
+            for image_path, (mtime, size), width, height, rows in results:
+                relative = self.relative(image_path)
+                self.connection.execute(
+                    "INSERT INTO files(image_path, json_mtime, json_size, image_width, image_height, shape_count) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(image_path) DO UPDATE SET "
+                    "json_mtime=excluded.json_mtime, json_size=excluded.json_size, image_width=excluded.image_width, "
+                    "image_height=excluded.image_height, shape_count=excluded.shape_count",
+                    (relative, mtime, size, width, height, len(rows)))
+                file_id = self.connection.execute(
+                    "SELECT id FROM files WHERE image_path = ?", (relative,)).fetchone()[0]
+                self.connection.execute("DELETE FROM shapes WHERE file_id = ?", (file_id,))
+                self.connection.execute("DELETE FROM file_labels WHERE file_id = ?", (file_id,))
+                self.connection.executemany(
+                    "INSERT INTO shapes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(file_id,) + row for row in rows])
+                counts = collections.Counter((label, shape_type, group_id) for label, group_id, shape_type, *_ in rows)
+                self.connection.executemany(
+                    "INSERT INTO file_labels VALUES (?, ?, ?, ?, ?)",
+                    [(file_id,) + key + (count,) for key, count in counts.items()])
+
+    def remove_missing(self, image_paths):
+        """删除已经不在文件夹中的图片及其形状
+
+        Args:
+            image_paths(list): 文件夹中所有图片的绝对路径
+
+        """
+        present = {self.relative(path) for path in image_paths}
+        missing = [(file_id,) for file_id, path in
+                   self.connection.execute("SELECT id, image_path FROM files") if path not in present]
+        self._delete(missing)
+
+    def remove(self, image_paths):
+        """删除一些图片及其形状
+
+        Args:
+            image_paths(list): 图片的绝对路径，不在索引中的被忽略
+
+        """
+        ids = [row for row in (self.connection.execute(
+            "SELECT id FROM files WHERE image_path = ?", (self.relative(path),)).fetchone()
+            for path in image_paths) if row is not None]
+        self._delete(ids)
+
+    def _delete(self, ids):
+        if ids:
+            with self.connection:
+                self.connection.executemany("DELETE FROM shapes WHERE file_id = ?", ids)
+                self.connection.executemany("DELETE FROM file_labels WHERE file_id = ?", ids)
+                self.connection.executemany("DELETE FROM files WHERE id = ?", ids)
+
+    def search(self, text):
+        """按搜索框中的文字查询（语法见parse_query）
+
+        Args:
+            text(str): 搜索框中的文字
+
+        Returns:
+            tuple: (包含所有标签的图片的绝对路径集合, 这些图片中符合条件的形状总数)
+
+        """
+        labels, qualifiers = parse_query(text)
+        conditions = [_shape_condition(label, qualifiers) for label in labels or [None]]
+        params = [param for clause, params in conditions for param in params]
+        matched = " INTERSECT ".join("SELECT file_id FROM file_labels WHERE {}".format(clause)
+                                     for clause, params in conditions)
+        rows = self.connection.execute(
+            "SELECT image_path FROM files WHERE id IN ({})".format(matched), params).fetchall()
+        if not rows:
+            return set(), 0
+        if len(conditions) == 1:
+            count_sql = "SELECT TOTAL(count) FROM file_labels WHERE {}".format(conditions[0][0])
+            count_params = params
+        else:
+            count_sql = "SELECT TOTAL(count) FROM file_labels WHERE ({}) AND file_id IN ({})".format(
+                " OR ".join("({})".format(clause) for clause, params in conditions), matched)
+            count_params = params + params
+        count = int(self.connection.execute(count_sql, count_params).fetchone()[0])
+        return {self.absolute(path) for path, in rows}, count
+
+    def summaries(self):
+        """每张图片的标注概况，文件列表显示
+
+        Returns:
+            dict: 图片的绝对路径 -> (是否有标注文件, 形状数, 宽, 高)，宽高未知时为None
+
+        """
+        cursor = self.connection.execute(
+            "SELECT image_path, json_mtime, shape_count, image_width, image_height FROM files")
+        return {self.absolute(path): (mtime is not None, count, width, height)
+                for path, mtime, count, width, height in cursor}
+
+    def label_counts(self, shape_type=None):
+        """各标签的形状数
+
+        Args:
+            shape_type(str): 只统计这种类型的形状，为None时统计全部
+
+        Returns:
+            list: [(标签, 形状数)]，按形状数从多到少排列
+
+        """
+        if shape_type is None:
+            cursor = self.connection.execute(
+                "SELECT label, SUM(count) FROM file_labels GROUP BY label ORDER BY 2 DESC")
+        else:
+            cursor = self.connection.execute(
+                "SELECT label, SUM(count) FROM file_labels WHERE shape_type = ? GROUP BY label ORDER BY 2 DESC",
+                (shape_type,))
+        return cursor.fetchall()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,195 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+
+from PyQt5 import QtCore
+
+from .index import ProjectIndex, read_file
+
+logger = logging.getLogger("labelall")
+
+BATCH_SIZE = 256  # 每个事务写入的图片数
+PROCESS_THRESHOLD = 64  # 需要重新读取的json超过这个数时才启动进程池
+
+
+class _IndexSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int, int, int)  # 批次号, 已完成数, 总数
+    finished = QtCore.pyqtSignal(int)  # 批次号
+
+
+class _IndexTask(QtCore.QRunnable):
+    """
+    在工作线程中把新增或修改过的json写入索引的任务
+
+    """
+    def __init__(self, indexer, generation, folder, image_paths, full, removed=()):
+        super(_IndexTask, self).__init__()
+        self.indexer = indexer
+        self.generation = generation
+        self.folder = folder
+        self.image_paths = image_paths
+        self.full = full
+        self.removed = removed  # 不是full时要从索引中删除的图片
+
+    def cancelled(self):
+        return self.generation != self.indexer.generation
+
+    def run(self):
+        executor = None
+        index = None
+        try:
+            index = ProjectIndex(self.folder)
+            if self.full:
+                index.remove_missing(self.image_paths)
+            elif self.removed:
+                index.remove(self.removed)
+            stale = index.stale(self.image_paths)
+            if len(stale) > PROCESS_THRESHOLD:
+                # json的解析受GIL限制，大量文件在子进程中解析
+                executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.indexer.max_workers, mp_context=multiprocessing.get_context("spawn"))
+                results = executor.map(read_file, stale, chunksize=16)
+            else:
+                results = map(read_file, stale)
+            batch = []
+            done = 0
+            for result in results:
+                if self.cancelled():
+                    break
+                batch.append(result)
+                if len(batch) >= BATCH_SIZE:
+                    index.update(batch)
+                    done += len(batch)
+                    batch = []
+                    self.indexer.signals.progress.emit(self.generation, done, len(stale))
+            if batch and not self.cancelled():
+                index.update(batch)
+                done += len(batch)
+            if stale:
+                self.indexer.signals.progress.emit(self.generation, done, len(stale))
+        except Exception:
+            logger.exception("Failed indexing folder: {}".format(self.folder))
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            if index is not None:
+                index.close()
+            self.indexer.signals.finished.emit(self.generation)
+
+
+class ProjectIndexer(QtCore.QObject):
+    """
+    打开文件夹后在后台按json的修改时间增量地建立、更新文件夹的SQLite索引（见ProjectIndex），
+    查询在GUI线程中用另一个连接直接执行
+
+    Attributes:
+        index(ProjectIndex): GUI线程中用于查询的索引，没有打开文件夹时为None
+        generation(int): 当前文件夹的批次号，打开其它文件夹后旧的任务不再写入
+        max_workers(int): 解析json的进程数
+        pool(QThreadPool): 写入索引的线程池（单线程，写入按提交顺序进行）
+
+    """
+    indexUpdated = QtCore.pyqtSignal()
+    progress = QtCore.pyqtSignal(int, int)  # 已完成数, 总数
+
+    def __init__(self, max_workers=None, parent=None):
+        super(ProjectIndexer, self).__init__(parent)
+        self.index = None
+        self.generation = 0
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.signals = _IndexSignals()
+        self.signals.progress.connect(self._onProgress)
+        self.signals.finished.connect(self._onFinished)
+
+    def openFolder(self, folder, image_paths):
+        """
+        打开文件夹的索引，并在后台更新其中新增或修改过的json
+
+        Args:
+            folder(str): 文件夹路径
+            image_paths(list): 文件夹中所有图片的绝对路径
+
+        """
+        self.close()
+        try:
+            self.index = ProjectIndex(folder)
+        except Exception:
+            logger.exception("Failed opening project index: {}".format(folder))
+            return
+        self.pool.start(_IndexTask(self, self.generation, self.index.folder, list(image_paths), True))
+
+    def updateFile(self, json_path):
+        """
+        保存json后更新同名图片在索引中的形状
+
+        Args:
+            json_path(str): 刚写入的json，不在当前文件夹的索引中时忽略
+
+        """
+        if self.index is None:
+            return
+        image_paths = self.index.images_for_json(json_path)
+        if image_paths:
+            self.pool.start(_IndexTask(self, self.generation, self.index.folder, image_paths, False))
+
+    def updateImages(self, image_paths, removed=()):
+        """
+        文件夹在打开期间变化后增量地更新索引
+
+        Args:
+            image_paths(list): 新增或修改过的图片，只重新读取json有变化的
+            removed(list): 已经删除的图片
+
+        """
+        if self.index is None or not (image_paths or removed):
+            return
+        self.pool.start(_IndexTask(self, self.generation, self.index.folder, list(image_paths), False, list(removed)))
+
+    def search(self, text):
+        """
+        在GUI线程中查询，语法见project.parse_query
+
+        Args:
+            text(str): 搜索框中的文字
+
+        Returns:
+            tuple: (图片的绝对路径集合, 符合条件的形状数)，没有打开文件夹时为(None, 0)
+
+        """
+        if self.index is None:
+            return None, 0
+        return self.index.search(text)
+
+    def summaries(self):
+        """
+        在GUI线程中读取每张图片的标注概况，见ProjectIndex.summaries
+
+        Returns:
+            dict: 图片的绝对路径 -> (是否有标注文件, 形状数, 宽, 高)，没有打开文件夹时为空
+
+        """
+        if self.index is None:
+            return {}
+        return self.index.summaries()
+
+    def close(self):
+        """
+        关闭当前文件夹的索引，放弃尚未开始的更新
+
+        """
+        self.generation += 1
+        self.pool.clear()
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+    def _onProgress(self, generation, done, total):
+        if generation == self.generation:
+            self.progress.emit(done, total)
+
+    def _onFinished(self, generation):
+        if generation == self.generation:
+            self.indexUpdated.emit()
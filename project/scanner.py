@@ -0,0 +1,333 @@
+import logging
+import os
+import os.path as osp
+import threading
+import time
+
+from PyQt5 import QtCore, QtGui
+
+from .folder_cache import FolderCache, diff, fill_info, scan
+
+logger = logging.getLogger("labelall")
+
+BATCH_SIZE = 2048  # 一批最多的图片数
+BATCH_INTERVAL = 0.2  # 一批最长的等待时间（秒），慢速的网络盘上也能及时显示已找到的图片
+
+
+def image_suffixes():
+    """
+    QImageReader支持的图片后缀
+
+    Returns:
+        frozenset: 小写、带"."的后缀，如".jpg"
+
+    """
+    return frozenset("." + bytes(fmt).decode().lower() for fmt in QtGui.QImageReader.supportedImageFormats())
+
+
+def scan_folder(folder, suffixes, cancelled=None):
+    """
+    用os.scandir遍历文件夹（包括子文件夹），依次产生图片路径；每个文件夹中先是按名字排序的图片，
+    再是按名字排序的子文件夹，以"."开头的文件夹和指向文件夹的符号链接被跳过
+
+    Args:
+        folder(str): 文件夹路径
+        suffixes(frozenset): 小写的图片后缀，见image_suffixes
+        cancelled(callable): 返回True时停止遍历
+
+    Yields:
+        str: 图片的绝对路径
+
+    """
+    stack = [os.path.abspath(folder)]
+    while stack:
+        if cancelled is not None and cancelled():
+            return
+        directory = stack.pop()
+        files = []
+        dirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not entry.name.startswith("."):
+                                dirs.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in suffixes:
+                            files.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.warning("Failed scanning folder {}: {}".format(directory, e))
+            continue
+        files.sort()
+        for path in files:
+            yield path
+        # 栈后进先出，倒序压入后按名字顺序遍历子文件夹
+        stack.extend(sorted(dirs, reverse=True))
+
+
+class _ScanSignals(QtCore.QObject):
+    # 路径列表与字典用object传递：声明为list、dict时PyQt会逐项转换为QVariant，几万张图片时要几百毫秒
+    batch = QtCore.pyqtSignal(int, object)  # 批次号, 图片路径
+    replaced = QtCore.pyqtSignal(int, object, object)  # 批次号, 全部图片路径, FolderCache.columns()
+    changed = QtCore.pyqtSignal(int, object, object, object)  # 批次号, 见folder_cache.diff
+    directories = QtCore.pyqtSignal(int, object)  # 批次号, 遍历到的文件夹的绝对路径
+    info = QtCore.pyqtSignal(int, object)  # 批次号, {图片路径: (是否有标注文件, 形状数, 宽, 高)}
+    finished = QtCore.pyqtSignal(int, str, int)  # 批次号, 文件夹, 图片数
+
+
+class _ScanTask(QtCore.QRunnable):
+    """
+    在工作线程中遍历文件夹：有缓存时先发出缓存的列表，再按文件夹的修改时间校验，有变化时发出新的列表；
+    没有缓存时按BATCH_SIZE或BATCH_INTERVAL分批发出找到的图片。列表确定后在后台补全图片尺寸与标注概况
+
+    之后（或补全期间）收到refresh请求时再校验一次，变化以增量（见folder_cache.diff）发出。
+    缓存只在这个任务中读写，同一个文件夹同时最多只有一个任务
+
+    """
+    def __init__(self, scanner, generation, folder, suffixes, refreshing=False):
+        super(_ScanTask, self).__init__()
+        self.scanner = scanner
+        self.generation = generation
+        self.folder = folder
+        self.suffixes = suffixes
+        self.refreshing = refreshing  # 为True时跳过首次遍历，从scanner.cache开始处理refresh请求
+        self.batch = []
+        self.last = time.monotonic()
+
+    def cancelled(self):
+        return self.generation != self.scanner.generation
+
+    def addFiles(self, paths):
+        self.batch.extend(paths)
+        now = time.monotonic()
+        if len(self.batch) >= BATCH_SIZE or now - self.last >= BATCH_INTERVAL:
+            self.flush()
+            self.last = now
+
+    def flush(self):
+        if self.batch:
+            self.scanner.signals.batch.emit(self.generation, self.batch)
+            self.batch = []
+
+    def emitDirectories(self, cache):
+        self.scanner.signals.directories.emit(
+            self.generation, [osp.join(cache.folder, directory) if directory else cache.folder
+                              for directory in cache.dirs])
+
+    def list(self):
+        """首次遍历，返回缓存，被取消时返回None"""
+        signals = self.scanner.signals
+        count = 0
+        listed = False
+        try:
+            previous = FolderCache.load(self.folder)
+            if previous is not None:
+                count = len(previous)
+                signals.replaced.emit(self.generation, previous.paths(), previous.columns())
+            result = scan(self.folder, self.suffixes, previous, self.cancelled,
+                          on_files=self.addFiles if previous is None else None)
+            if result is None:
+                return None
+            cache, changed = result
+            self.flush()
+            if previous is not None and changed:
+                signals.replaced.emit(self.generation, cache.paths(), cache.columns())
+            count = len(cache)
+            listed = True
+            signals.finished.emit(self.generation, self.folder, count)
+            self.emitDirectories(cache)
+            cache.save()
+            return cache
+        finally:
+            if not listed:
+                self.flush()
+                signals.finished.emit(self.generation, self.folder, count)
+
+    def refresh(self, previous):
+        """按文件夹的修改时间重新校验，有变化时发出增量，返回新的缓存，被取消时返回None"""
+        result = scan(self.folder, self.suffixes, previous, self.cancelled)
+        if result is None:
+            return None
+        cache, changed = result
+        if not changed:
+            # 内容相同，但沿用新的修改时间，下次不再重新列出这些文件夹
+            return cache
+        removed, inserted, updated = diff(previous, cache)
+        if removed or inserted or updated:
+            self.scanner.signals.changed.emit(self.generation, removed, inserted, updated)
+        if cache.dirs != previous.dirs:
+            self.emitDirectories(cache)
+        cache.save()
+        return cache
+
+    def fill(self, cache):
+        filled = False
+        for rows in fill_info(cache, cancelled=self.cancelled):
+            self.scanner.signals.info.emit(self.generation, cache.info(rows))
+            filled = True
+            if self.scanner.refreshPending(self.generation):
+                # 先处理refresh，剩下的图片在新的缓存中继续补全
+                break
+        if filled:
+            cache.save()
+
+    def run(self):
+        released = False
+        try:
+            cache = self.scanner.currentCache(self.generation) if self.refreshing else self.list()
+            while cache is not None:
+                self.scanner.setCache(self.generation, cache)
+                self.fill(cache)
+                if not self.scanner.takeRefresh(self.generation):
+                    released = True
+                    return
+                cache = self.refresh(cache)
+        except Exception:
+            logger.exception("Failed scanning folder: {}".format(self.folder))
+        finally:
+            if not released:
+                self.scanner.taskDone(self.generation)
+
+
+class FolderScanner(QtCore.QObject):
+    """
+    在工作线程中遍历打开的文件夹，找到的图片分批发给GUI线程，遍历完成之前文件列表就可以使用；
+    打开另一个文件夹（或cancel）后旧的遍历停止，它之后的结果不再发出
+
+    每个文件夹的文件列表、图片尺寸与标注概况保存在缓存中（见FolderCache），再次打开时立即显示缓存的列表，
+    之后在后台只重新列出修改时间变了的文件夹，列表有变化时以filesReplaced发出新的列表。
+    文件夹在打开期间被修改时（见FolderWatcher）调用refresh，增加、删除、修改的图片以filesChanged发出
+
+    Attributes:
+        generation(int): 当前遍历的批次号
+        suffixes(frozenset): 小写的图片后缀，创建时从QImageReader取一次
+        pool(QThreadPool): 遍历用的线程池（单线程）
+        lock(threading.Lock): 保护cache、active与pending，它们在GUI线程与工作线程中都会被访问
+        cache(FolderCache): 当前文件夹最新的缓存，只在工作线程中读写
+        active(int): 正在运行的任务的批次号，没有任务时为None
+        pending(bool): 是否有尚未处理的refresh请求
+
+    """
+    batchReady = QtCore.pyqtSignal(object)  # 新找到的图片路径
+    filesReplaced = QtCore.pyqtSignal(object, object)  # 全部图片路径, (状态, 形状数, 宽, 高)，见FolderCache.columns
+    filesChanged = QtCore.pyqtSignal(object, object, object)  # 删除、增加、修改的图片，见folder_cache.diff
+    directoriesListed = QtCore.pyqtSignal(object)  # 遍历到的所有文件夹的绝对路径
+    infoReady = QtCore.pyqtSignal(object)  # {图片路径: (是否有标注文件, 形状数, 宽, 高)}
+    finished = QtCore.pyqtSignal(str, int)  # 文件夹, 图片总数
+
+    def __init__(self, parent=None):
+        super(FolderScanner, self).__init__(parent)
+        self.generation = 0
+        self.folder = None
+        self.suffixes = image_suffixes()
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.lock = threading.Lock()
+        self.cache = None
+        self.active = None
+        self.pending = False
+        self.signals = _ScanSignals()
+        self.signals.batch.connect(self._onBatch)
+        self.signals.replaced.connect(self._onReplaced)
+        self.signals.changed.connect(self._onChanged)
+        self.signals.directories.connect(self._onDirectories)
+        self.signals.info.connect(self._onInfo)
+        self.signals.finished.connect(self._onFinished)
+
+    def scan(self, folder):
+        """
+        停止之前的遍历，开始遍历folder
+
+        Args:
+            folder(str): 文件夹路径
+
+        """
+        self.cancel()
+        self.folder = folder
+        with self.lock:
+            self.active = self.generation
+        self.pool.start(_ScanTask(self, self.generation, folder, self.suffixes))
+
+    def refresh(self):
+        """
+        重新校验当前文件夹：正在遍历或补全时在当前任务中稍后处理，否则启动一个新任务
+
+        """
+        if self.folder is None:
+            return
+        with self.lock:
+            self.pending = True
+            if self.active == self.generation or self.cache is None:
+                # 首次遍历还没有完成时，遍历完成后的补全会处理这个请求
+                return
+            self.active = self.generation
+        self.pool.start(_ScanTask(self, self.generation, self.folder, self.suffixes, refreshing=True))
+
+    def cancel(self):
+        """
+        停止当前的遍历，已经排队的结果也会被丢弃
+
+        """
+        self.generation += 1
+        self.folder = None
+        self.pool.clear()
+        with self.lock:
+            self.cache = None
+            self.pending = False
+
+    def currentCache(self, generation):
+        with self.lock:
+            return self.cache if generation == self.generation else None
+
+    def setCache(self, generation, cache):
+        with self.lock:
+            if generation == self.generation:
+                self.cache = cache
+
+    def refreshPending(self, generation):
+        return self.pending and generation == self.generation
+
+    def takeRefresh(self, generation):
+        """
+        任务补全完成后调用：有refresh请求时返回True（任务继续处理），否则任务结束，
+        检查与结束在同一次加锁中完成，之后的refresh会启动新的任务
+
+        """
+        with self.lock:
+            if generation == self.generation and self.pending:
+                self.pending = False
+                return True
+            if self.active == generation:
+                self.active = None
+            return False
+
+    def taskDone(self, generation):
+        with self.lock:
+            if self.active == generation:
+                self.active = None
+
+    def _onBatch(self, generation, paths):
+        if generation == self.generation:
+            self.batchReady.emit(paths)
+
+    def _onReplaced(self, generation, paths, columns):
+        if generation == self.generation:
+            self.filesReplaced.emit(paths, columns)
+
+    def _onChanged(self, generation, removed, inserted, updated):
+        if generation == self.generation:
+            self.filesChanged.emit(removed, inserted, updated)
+
+    def _onDirectories(self, generation, directories):
+        if generation == self.generation:
+            self.directoriesListed.emit(directories)
+
+    def _onInfo(self, generation, info):
+        if generation == self.generation:
+            self.infoReady.emit(info)
+
+    def _onFinished(self, generation, folder, count):
+        if generation == self.generation:
+            self.finished.emit(folder, count)
@@ -0,0 +1,169 @@
+import logging
+import os
+
+from PyQt5 import QtCore
+
+logger = logging.getLogger("labelall")
+
+COALESCE_DELAY = 300  # 收到变化后等待多久再通知（毫秒），期间的变化合并为一次
+POLL_INTERVAL = 3000  # 轮询的间隔（毫秒）
+# 这些文件系统上其它机器的修改不会产生inotify等通知，改为轮询
+NETWORK_FILESYSTEMS = frozenset([
+    "nfs", "nfs4", "cifs", "smb", "smb2", "smbfs", "smb3", "afs", "9p", "ncpfs", "fuse.sshfs", "fuse.rclone",
+    "davfs", "fuse.davfs2", "glusterfs", "fuse.glusterfs", "ceph", "fuse.ceph",
+])
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def is_network_path(path):
+    """
+    path是否在网络文件系统上
+
+    Args:
+        path(str): 文件夹路径
+
+    Returns:
+        bool: 文件系统类型在NETWORK_FILESYSTEMS中时为True
+
+    """
+    storage = QtCore.QStorageInfo(path)
+    return bytes(storage.fileSystemType()).decode("ascii", "ignore").lower() in NETWORK_FILESYSTEMS
+
+
+class FolderWatcher(QtCore.QObject):
+    """
+    监视打开的文件夹：文件夹中增加、删除、替换文件后（合并COALESCE_DELAY之内的所有变化）发出changed，
+    由FolderScanner.refresh只重新列出修改时间变了的文件夹
+
+    优先用QFileSystemWatcher（Linux上为inotify）监视每个文件夹；网络文件系统上、或监视数超过系统限制时，
+    改为每POLL_INTERVAL发出一次changed（校验只stat每个文件夹，没有变化时开销很小）
+
+    另外单独监视当前图片的标注文件，它在磁盘上被其它程序修改时发出labelChanged；本程序保存后应再次调用
+    watchLabel记下新的修改时间，保存还没有完成时（saves.isSaving）不检查这个文件
+
+    Attributes:
+        watcher(QFileSystemWatcher): 文件夹与当前标注文件的监视器
+        directories(set): 正在监视的文件夹
+        polling(bool): 是否在轮询
+        label_path(str): 当前图片的标注文件（可能还不存在），没有时为None
+        label_stamp(tuple): 标注文件的(修改时间, 大小)，不存在时为None
+        saves(SaveService): 本程序的保存服务，为None时不区分修改来自哪里
+
+    """
+    changed = QtCore.pyqtSignal()
+    labelChanged = QtCore.pyqtSignal(str)  # 标注文件的路径
+
+    def __init__(self, saves=None, parent=None):
+        super(FolderWatcher, self).__init__(parent)
+        self.saves = saves
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self._onDirectoryChanged)
+        self.watcher.fileChanged.connect(self._onFileChanged)
+        self.directories = set()
+        self.polling = False
+        self.label_path = None
+        self.label_stamp = None
+        self.delay_timer = QtCore.QTimer(self)
+        self.delay_timer.setSingleShot(True)
+        self.delay_timer.setInterval(COALESCE_DELAY)
+        self.delay_timer.timeout.connect(self._emitChanged)
+        self.poll_timer = QtCore.QTimer(self)
+        self.poll_timer.setInterval(POLL_INTERVAL)
+        self.poll_timer.timeout.connect(self._poll)
+
+    def setDirectories(self, directories):
+        """
+        监视这些文件夹（替换之前监视的文件夹）
+
+        Args:
+            directories(list): 文件夹的绝对路径，第一个为打开的文件夹
+
+        """
+        directories = set(directories)
+        removed = list(self.directories - directories)
+        if removed:
+            self.watcher.removePaths(removed)
+        added = list(directories - self.directories)
+        failed = self.watcher.addPaths(added) if added else []
+        self.directories = directories - set(failed)
+        if failed:
+            logger.warning("Cannot watch {} folders, polling instead".format(len(failed)))
+        network = bool(directories) and is_network_path(next(iter(directories)))
+        self.polling = bool(failed) or network
+        if self.polling:
+            self.poll_timer.start()
+        else:
+            self.poll_timer.stop()
+
+    def watchLabel(self, path):
+        """
+        监视当前图片的标注文件，并记下它现在的修改时间
+
+        Args:
+            path(str): 标注文件的路径（可能还不存在），为None时不再监视
+
+        """
+        if self.label_path is not None and self.label_path in self.watcher.files():
+            self.watcher.removePath(self.label_path)
+        self.label_path = path
+        self.label_stamp = _stamp(path) if path else None
+        if self.label_stamp is not None:
+            self.watcher.addPath(path)
+
+    def clear(self):
+        """
+        停止监视
+
+        """
+        self.delay_timer.stop()
+        self.poll_timer.stop()
+        paths = self.watcher.directories() + self.watcher.files()
+        if paths:
+            self.watcher.removePaths(paths)
+        self.directories = set()
+        self.polling = False
+        self.label_path = None
+        self.label_stamp = None
+
+    def _onDirectoryChanged(self, path):
+        self.delay_timer.start()
+
+    def _onFileChanged(self, path):
+        # 替换文件（先写临时文件再重命名）后原来的监视会失效，合并之后检查时重新添加
+        self.delay_timer.start()
+
+    def _emitChanged(self):
+        self.checkLabel()
+        self.changed.emit()
+
+    def _poll(self):
+        self.checkLabel()
+        if self.polling:
+            self.changed.emit()
+
+    def checkLabel(self):
+        """
+        标注文件的修改时间与记下的不同时发出labelChanged（标注文件被删除时不发出）
+
+        """
+        if self.label_path is None:
+            return
+        if self.saves is not None and self.saves.isSaving(self.label_path):
+            # 本程序正在写入，保存完成后由watchLabel记下新的修改时间
+            return
+        stamp = _stamp(self.label_path)
+        if stamp == self.label_stamp:
+            return
+        self.label_stamp = stamp
+        if stamp is None:
+            return
+        if self.label_path not in self.watcher.files():
+            self.watcher.addPath(self.label_path)
+        self.labelChanged.emit(self.label_path)
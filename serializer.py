@@ -0,0 +1,252 @@
+"""把内存中的标注（scene.nodes_info中的形状）一次性转换为labelme 5.0.1格式的json
+
+不依赖Qt：形状的顶点既可以是[x, y]列表，也可以是具有x()、y()方法的顶点图元（GraphicItem）。
+与json.dumps(indent=2)一致及原样写回由tests/test_serializer.py检查，吞吐量见benchmarks/bench_labels.py
+
+"""
+import io
+import itertools
+import json
+import os
+import os.path as osp
+
+VERSION = "5.0.1"
+SHAPE_KEYS = ("label", "points", "group_id", "shape_type", "flags")
+TOP_KEYS = ("version", "flags", "shapes", "imagePath", "imageData", "imageHeight", "imageWidth")
+_NUMBER_TYPES = {float, int}
+
+
+def shape_points(points, offset_x=0.0, offset_y=0.0):
+    """取出一个形状所有顶点的坐标
+
+    顶点图元的位置是其左上角，加上(offset_x, offset_y)（图元宽高的一半）才是顶点坐标；
+    从json读入后没有移动过的顶点直接写回读入时的坐标，保证原样保存
+
+    Args:
+        points(list): [x, y]列表或者顶点图元
+        offset_x(float): 图元左上角到顶点的横向偏移
+        offset_y(float): 图元左上角到顶点的纵向偏移
+
+    Returns:
+        list: [[x, y], ...]
+
+    """
+    coordinates = []
+    append = coordinates.append
+    for point in points:
+        if isinstance(point, list):
+            append(point)
+            continue
+        x, y = point.x(), point.y()
+        origin = getattr(point, "origin", None)
+        if origin is not None and origin[0] == x and origin[1] == y:
+            append(origin[2])
+        else:
+            append([x + offset_x, y + offset_y])
+    return coordinates
+
+
+def serialize_shape(shape, offset_x=0.0, offset_y=0.0):
+    """把一个形状转换为json中的字典，other_data中的键追加在标准键之后
+
+    Args:
+        shape(dict): nodes_info['shapes']中的一项或者LabelFile.shapes中的一项
+        offset_x(float): 见shape_points
+        offset_y(float): 见shape_points
+
+    Returns:
+        dict: labelme格式的形状
+
+    """
+    data = {
+        "label": shape["label"],
+        "points": shape_points(shape["points"], offset_x, offset_y),
+        "group_id": shape.get("group_id"),
+        "shape_type": shape.get("shape_type", "polygon"),
+        "flags": shape.get("flags") or {},
+    }
+    for key, value in (shape.get("other_data") or {}).items():
+        if key not in data:
+            data[key] = value
+    return data
+
+
+def to_dict(shapes, image_path, image_data, image_height, image_width,
+            flags=None, other_data=None, node_offset=(0.0, 0.0)):
+    """把整份标注转换为labelme 5.0.1格式的字典（键的顺序与labelme相同）
+
+    Args:
+        shapes(list): 形状列表
+        image_path(str): json中记录的imagePath
+        image_data(str): 内嵌图片的base64字符串，不内嵌时为None
+        image_height(int): 图片高度
+        image_width(int): 图片宽度
+        flags(dict): 图片级别的flags
+        other_data(dict): 读入json时其中的非标准键，原样写回
+        node_offset(tuple): 顶点图元左上角到顶点的偏移，见shape_points
+
+    Returns:
+        dict: 可以直接json.dump的字典
+
+    """
+    offset_x, offset_y = node_offset
+    data = {
+        "version": VERSION,
+        "flags": flags or {},
+        "shapes": [serialize_shape(shape, offset_x, offset_y) for shape in shapes],
+        "imagePath": image_path,
+        "imageData": image_data,
+        "imageHeight": image_height,
+        "imageWidth": image_width,
+    }
+    for key, value in (other_data or {}).items():
+        if key not in data:
+            data[key] = value
+    return data
+
+
+def _dumps_nested(value, prefix):
+    """按缩进2编码一个值，嵌套的行再加上所在层级的缩进（与json.dumps(indent=2)的结果相同）"""
+    value_type = type(value)
+    if value_type is str:
+        return json.encoder.encode_basestring_ascii(value)
+    if value is None:
+        return "null"
+    if value_type is int:
+        return repr(value)
+    if (value_type is dict or value_type is list) and not value:
+        return "{}" if value_type is dict else "[]"
+    return json.dumps(value, indent=2).replace("\n", "\n" + prefix)
+
+
+def _points_texts(shapes):
+    """把所有形状的points编码为缩进格式的文本，结果与逐层递归的缩进编码器相同
+
+    坐标都是数时，先用C实现的编码器把所有形状的坐标一次编码成一个扁平的列表，再按缩进拼接
+
+    Returns:
+        list: 与shapes一一对应的文本
+
+    """
+    simple = []
+    flat = []
+    for shape in shapes:
+        points = shape.get("points")
+        start = len(flat)
+        ok = isinstance(points, list)
+        if ok:
+            try:
+                flat.extend(itertools.chain.from_iterable(points))
+                ok = len(flat) - start == 2 * len(points) and set(map(len, points)) <= {2}
+            except TypeError:
+                ok = False
+            if not ok:
+                del flat[start:]
+        simple.append(ok)
+    if not set(map(type, flat)) <= _NUMBER_TYPES:
+        return [_dumps_nested(shape.get("points"), "      ") for shape in shapes]
+    numbers = json.dumps(flat)[1:-1].split(", ") if flat else []
+    pairs = list(map(",\n          ".join, zip(numbers[::2], numbers[1::2])))
+    texts = []
+    position = 0
+    for shape, ok in zip(shapes, simple):
+        points = shape.get("points")
+        if not ok:
+            texts.append(_dumps_nested(points, "      "))
+        elif not points:
+            texts.append("[]")
+        else:
+            texts.append("[\n        [\n          " +
+                         "\n        ],\n        [\n          ".join(pairs[position:position + len(points)]) +
+                         "\n        ]\n      ]")
+            position += len(points)
+    return texts
+
+
+def dumps(data):
+    """编码为json文本，格式与json.dumps(data, indent=2)完全相同（原先保存json的格式）
+
+    缩进模式下json使用纯Python的编码器，顶点很多时很慢，所以shapes中的points单独快速拼接
+
+    Args:
+        data(dict): to_dict的结果
+
+    Returns:
+        str: json文本
+
+    """
+    items = []
+    for key, value in data.items():
+        if key == "shapes" and isinstance(value, list) and value:
+            shapes = []
+            for shape, points_text in zip(value, _points_texts(value)):
+                fields = []
+                for shape_key, shape_value in shape.items():
+                    if shape_key == "points":
+                        text = points_text
+                    else:
+                        text = _dumps_nested(shape_value, "      ")
+                    fields.append("      {}: {}".format(json.dumps(shape_key), text))
+                shapes.append("    {\n" + ",\n".join(fields) + "\n    }")
+            text = "[\n" + ",\n".join(shapes) + "\n  ]"
+        else:
+            text = _dumps_nested(value, "  ")
+        items.append("  {}: {}".format(json.dumps(key), text))
+    return "{\n" + ",\n".join(items) + "\n}" if items else "{}"
+
+
+def save(filename, data, fsync=True):
+    """把to_dict的结果原子地写入json文件（见write_atomic）
+
+    Args:
+        filename(str): json文件的路径
+        data(dict): to_dict的结果
+        fsync(bool): 见write_atomic
+
+    """
+    write_atomic(filename, dumps(data), fsync)
+
+
+def write_atomic(filename, content, fsync=True):
+    """原子地写入文件
+
+    先写到同一目录下的临时文件并fsync，再重命名为目标文件，
+    中途崩溃或断电时磁盘上要么是旧文件，要么是完整的新文件，不会留下写了一半的文件
+
+    Args:
+        filename(str): 文件的路径
+        content(str|bytes): 文件内容，str按UTF-8文本写入
+        fsync(bool): 为False时不等待落盘（批量生成大量文件时使用），仍然不会留下写了一半的文件
+
+    """
+    temp_path = "{}.{}.tmp".format(filename, os.getpid())
+    try:
+        if isinstance(content, bytes):
+            f = io.open(temp_path, "wb")
+        else:
+            f = io.open(temp_path, "w", encoding="utf-8")
+        with f:
+            f.write(content)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, filename)
+    except BaseException:
+        if osp.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    if fsync:
+        _fsync_directory(osp.dirname(osp.abspath(filename)))
+
+
+def _fsync_directory(directory):
+    """让重命名本身也落盘，不支持对目录fsync的系统（Windows）直接跳过"""
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
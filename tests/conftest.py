@@ -0,0 +1,18 @@
+import glob
+import os.path as osp
+import sys
+
+import pytest
+
+ROOT = osp.dirname(osp.dirname(osp.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# pic_test中随程序一起提供的labelme json，作为格式兼容性测试的样例
+SAMPLE_JSONS = sorted(glob.glob(osp.join(ROOT, "pic_test", "*.json")))
+
+
+@pytest.fixture(params=SAMPLE_JSONS, ids=osp.basename)
+def sample_json(request):
+    """pic_test中的一个json文件的路径"""
+    return request.param
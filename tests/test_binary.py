@@ -0,0 +1,66 @@
+import io
+import json
+
+import pytest
+
+import serializer
+from formats import binary
+
+
+def read_text(path):
+    with io.open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def test_round_trip(sample_json):
+    """json -> .lmb -> json得到与原文件完全相同的内容，二进制文件更小"""
+    text = read_text(sample_json)
+    raw = binary.dumps(json.loads(text))
+    assert binary.is_binary(raw)
+    assert serializer.dumps(binary.loads(raw)) == text
+    assert len(raw) < len(text.encode("utf-8"))
+
+
+def test_parse_skips_image_data(sample_json):
+    data = json.loads(read_text(sample_json))
+    raw = binary.dumps(data)
+    parsed, span, image_raw = binary.parse(raw)
+    assert parsed["shapes"] == data["shapes"]
+    assert parsed["imageData"] is None
+    if data["imageData"] is None:
+        assert span is None
+    else:
+        image = raw[span[0]:span[1]]
+        assert (binary.base64.b64encode(image).decode("ascii") if image_raw else image.decode("utf-8")) \
+            == data["imageData"]
+
+
+def test_file_conversion(sample_json, tmp_path):
+    binary_path = binary.json_to_binary(sample_json, str(tmp_path / "a.lmb"))
+    json_path = binary.binary_to_json(binary_path, str(tmp_path / "a.json"))
+    assert read_text(json_path) == read_text(sample_json)
+
+
+@pytest.mark.parametrize("shape", [
+    {"label": "a", "points": [], "group_id": None, "shape_type": "polygon", "flags": {}},
+    {"label": "int", "points": [[1, 2], [-3, 2 ** 31 - 1]], "group_id": 1, "shape_type": "line", "flags": {}},
+    {"label": "float32", "points": [[0.5, 1.25], [3.0, 4.0]], "group_id": None, "shape_type": "rectangle",
+     "flags": {"x": True}},
+    {"label": "float64", "points": [[0.1, 0.2], [1e300, -2.5]], "group_id": None, "shape_type": "polygon",
+     "flags": {}},
+    {"label": "mixed", "points": [[1, 0.1], [2 ** 40, 3]], "group_id": None, "shape_type": "polygon", "flags": {}},
+    {"label": None, "points": [[1, 2]], "shape_type": 5, "flags": {}, "extra": {"nested": [1, "二"]}},
+    {"shape_type": "point", "label": "reordered", "flags": {}, "group_id": None, "points": [[1, 2]]},
+])
+def test_shapes_are_lossless(shape):
+    data = {"version": "5.0.1", "flags": {}, "shapes": [shape], "imagePath": "a.jpg", "imageData": "not base64!",
+            "imageHeight": 10, "imageWidth": 20, "extra": True}
+    decoded = binary.loads(binary.dumps(data))
+    assert decoded == data
+    assert serializer.dumps(decoded) == json.dumps(data, indent=2)
+    assert list(decoded["shapes"][0]) == list(shape)  # 键的顺序也保持不变
+
+
+def test_rejects_invalid_shapes():
+    with pytest.raises(ValueError):
+        binary.dumps({"shapes": [1]})
@@ -0,0 +1,86 @@
+import os
+import os.path as osp
+
+import PIL.Image
+import pytest
+
+import serializer
+from formats import export, importer
+from label_file import LabelFile
+
+WIDTH, HEIGHT = 200, 100
+SHAPES = [
+    {"label": "cat", "points": [[10.0, 20.0], [60.0, 80.0]], "shape_type": "rectangle"},
+    {"label": "dog", "points": [[100.0, 10.0], [180.0, 30.0], [150.0, 90.0]], "shape_type": "polygon"},
+]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """两张带标注的图片，其中一张在子文件夹中"""
+    folder = tmp_path / "dataset"
+    for name in ("a", "sub/b"):
+        image_path = folder / (name + ".jpg")
+        image_path.parent.mkdir(parents=True, exist_ok=True)
+        PIL.Image.new("RGB", (WIDTH, HEIGHT)).save(str(image_path))
+        shapes = [dict(shape, group_id=None, flags={}) for shape in SHAPES]
+        serializer.save(str(folder / (name + ".json")),
+                        serializer.to_dict(shapes, osp.basename(str(image_path)), None, HEIGHT, WIDTH), fsync=False)
+    return str(folder)
+
+
+def imported_shapes(output):
+    result = {}
+    for root, dirs, files in os.walk(output):
+        for name in files:
+            path = osp.join(root, name)
+            result[osp.relpath(path, output).replace(os.sep, "/")] = LabelFile(path).shapes
+    return result
+
+
+def flat(points):
+    return [value for point in points for value in point]
+
+
+def assert_same_shapes(shapes, task):
+    assert [shape["label"] for shape in shapes] == ["cat", "dog"]
+    rectangle, other = shapes
+    if task == "segment":
+        # YOLO分割只有多边形，矩形导出为四个角
+        assert [shape["shape_type"] for shape in shapes] == ["polygon", "polygon"]
+        assert flat(rectangle["points"]) == pytest.approx([10, 20, 60, 20, 60, 80, 10, 80], abs=0.01)
+        assert flat(other["points"]) == pytest.approx(flat(SHAPES[1]["points"]), abs=0.01)
+    else:
+        # YOLO检测只有外接框
+        assert [shape["shape_type"] for shape in shapes] == ["rectangle", "rectangle"]
+        assert flat(rectangle["points"]) == pytest.approx(flat(SHAPES[0]["points"]), abs=0.01)
+        assert flat(other["points"]) == pytest.approx([100, 10, 180, 90], abs=0.01)
+
+
+@pytest.mark.parametrize("task", export.YOLO_TASKS)
+@pytest.mark.parametrize("labels_folder", [False, True], ids=["export-folder", "labels-folder"])
+def test_yolo_round_trip(dataset, tmp_path, task, labels_folder):
+    """formats.export导出的YOLO可以直接导入：既可以给出导出的文件夹，也可以给出其中的labels"""
+    exported = str(tmp_path / "yolo")
+    summary = export.export(dataset, exported, "yolo", workers=1, yolo_task=task, progress=False)
+    assert not summary["errors"]
+    source = osp.join(exported, "labels") if labels_folder else exported
+    output = str(tmp_path / "imported")
+    summary = importer.import_dataset(source, output, "yolo", images=dataset, workers=1, progress=False)
+    assert not summary["errors"]
+    result = imported_shapes(output)
+    assert sorted(result) == ["a.json", "sub/b.json"]
+    for shapes in result.values():
+        assert_same_shapes(shapes, task)
+
+
+def test_yolo_classes_option(dataset, tmp_path):
+    exported = str(tmp_path / "yolo")
+    export.export(dataset, exported, "yolo", workers=1, progress=False)
+    classes = str(tmp_path / "names.txt")
+    os.rename(osp.join(exported, importer.YOLO_CLASSES), classes)
+    output = str(tmp_path / "imported")
+    importer.import_dataset(exported, output, "yolo", images=dataset, workers=1, progress=False)
+    assert [shape["label"] for shape in imported_shapes(output)["a.json"]] == ["0", "1"]
+    importer.import_dataset(exported, output, "yolo", images=dataset, workers=1, progress=False, classes=classes)
+    assert [shape["label"] for shape in imported_shapes(output)["a.json"]] == ["cat", "dog"]
@@ -0,0 +1,92 @@
+import math
+
+import numpy as np
+import PIL.Image
+import pytest
+
+import loader
+import utils.paths
+from loader import prefetch, pyramid
+
+WIDTH, HEIGHT = 1100, 600
+TILE_SIZE = pyramid.TILE_SIZE
+
+
+def make_image(mode):
+    """平滑的渐变（JPEG瓦片压缩后误差小），再转换为mode"""
+    y, x = np.mgrid[0:HEIGHT, 0:WIDTH]
+    blocks = x * 255 // WIDTH // 2 + y * 255 // HEIGHT // 2
+    rgb = np.stack([blocks, x * 255 // WIDTH, 255 - blocks], axis=-1).astype(np.uint8)
+    image = PIL.Image.fromarray(rgb)
+    if mode == "1":
+        return image.convert("L").point(lambda v: 255 if v >= 128 else 0).convert("1")
+    if mode in ("I;16", "I;16B"):
+        return image.convert("L").convert("I").convert(mode)
+    if mode == "P":
+        return image.convert("P", dither=PIL.Image.Dither.NONE)
+    if mode == "RGBA":
+        image.putalpha(PIL.Image.fromarray((blocks // 2 + 100).astype(np.uint8)))
+        return image
+    return image.convert(mode)
+
+
+@pytest.fixture
+def tiled(monkeypatch, tmp_path):
+    """把TILED_IMAGE_PIXELS调小，并把金字塔写入tmp_path中的缓存"""
+    monkeypatch.setattr(utils.paths, "CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(loader, "TILED_IMAGE_PIXELS", WIDTH * HEIGHT)
+    monkeypatch.setattr(prefetch, "TILED_IMAGE_PIXELS", WIDTH * HEIGHT)
+
+
+def assemble(result, level):
+    """把一层的瓦片拼回整张图片"""
+    width, height = result.level_size(level)
+    cols, rows = result.tile_count(level)
+    image = None
+    for row in range(rows):
+        for col in range(cols):
+            tile = result.read_tile(level, col, row)
+            assert tile.width == min(TILE_SIZE, width - col * TILE_SIZE)
+            assert tile.height == min(TILE_SIZE, height - row * TILE_SIZE)
+            if image is None:
+                image = PIL.Image.new(tile.mode, (width, height))
+            image.paste(tile, (col * TILE_SIZE, row * TILE_SIZE))
+    return image
+
+
+@pytest.mark.parametrize("mode, format", [
+    ("1", "PNG"), ("1", "TIFF"), ("L", "PNG"), ("P", "PNG"), ("RGB", "JPEG"), ("RGB", "TIFF"), ("RGBA", "PNG"),
+    ("LA", "PNG"), ("I;16", "PNG"), ("I;16B", "TIFF"), ("I", "TIFF"), ("F", "TIFF"), ("CMYK", "JPEG"),
+])
+def test_pyramid_modes(tiled, tmp_path, mode, format):
+    """各种模式的超大图片都能生成金字塔，拼回的各层与直接转换、缩小的结果相同（JPEG瓦片有压缩误差）"""
+    path = str(tmp_path / ("image." + format.lower()))
+    make_image(mode).save(path, format)
+    size = PIL.Image.open(path).size
+    assert size[0] * size[1] >= loader.TILED_IMAGE_PIXELS
+    result = loader.load_document(path, tiled=True).pyramid
+    assert (result.width, result.height) == (WIDTH, HEIGHT)
+    assert result.levels == int(math.ceil(math.log2(max(WIDTH, HEIGHT) / TILE_SIZE))) + 1
+
+    expected = PIL.Image.open(path)
+    expected.load()
+    for level in range(result.levels):
+        image = assemble(result, level)
+        if level == 0:
+            expected = expected.convert(image.mode)
+        else:
+            expected = expected.reduce(2)
+        difference = np.abs(np.asarray(image, dtype=np.int16) - np.asarray(expected, dtype=np.int16))
+        assert difference.mean() < (0.01 if result.ext == ".png" else 4)
+
+
+def test_pyramid_without_map_buffer(tiled, tmp_path, monkeypatch):
+    """PIL不支持把像素映射到文件时，照常解码到内存中"""
+
+    def map_buffer(*args):
+        raise ValueError("buffer is not large enough")
+    monkeypatch.setattr(PIL.Image.core, "map_buffer", map_buffer)
+    path = str(tmp_path / "image.png")
+    make_image("RGB").save(path)
+    result = loader.load_document(path, tiled=True).pyramid
+    assert assemble(result, 0).size == (WIDTH, HEIGHT)
@@ -0,0 +1,52 @@
+import io
+import json
+
+import pytest
+
+import serializer
+from label_file import LabelFile
+
+
+def read_text(path):
+    with io.open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def test_dumps_matches_json_dumps(sample_json):
+    data = json.loads(read_text(sample_json))
+    assert serializer.dumps(data) == json.dumps(data, indent=2)
+
+
+def test_label_file_round_trip(sample_json):
+    """读入后不做修改再保存，得到与原文件完全相同的内容"""
+    label_file = LabelFile(sample_json)
+    data = serializer.to_dict(label_file.shapes, label_file.imagePath, label_file.read_embedded_base64(),
+                              label_file.imageHeight, label_file.imageWidth, label_file.flags,
+                              label_file.otherData)
+    assert serializer.dumps(data) == read_text(sample_json)
+
+
+@pytest.mark.parametrize("points", [
+    [],
+    [[0, 0]],
+    [[1, 2], [3.5, -4.25], [1e-7, 1e20], [123456789012, 0.1 + 0.2]],
+])
+def test_dumps_points(points):
+    shape = {"label": "标签", "points": points, "group_id": 3, "shape_type": "polygon",
+             "flags": {"occluded": True}, "other_data": {"description": "a\n\"b\""}}
+    data = serializer.to_dict([shape], "图片.jpg", None, 480, 640, {"checked": False}, {"extra": [1, {"k": None}]})
+    assert serializer.dumps(data) == json.dumps(data, indent=2)
+
+
+def test_dumps_empty():
+    assert serializer.dumps({}) == json.dumps({}, indent=2)
+    data = serializer.to_dict([], "a.jpg", None, 1, 1)
+    assert serializer.dumps(data) == json.dumps(data, indent=2)
+
+
+def test_save_writes_atomically(tmp_path):
+    path = str(tmp_path / "a.json")
+    data = serializer.to_dict([], "a.jpg", None, 1, 1)
+    serializer.save(path, data)
+    assert read_text(path) == serializer.dumps(data)
+    assert [item.name for item in tmp_path.iterdir()] == ["a.json"]
@@ -1,7 +1,20 @@
+from .enhance import AdjustmentPipeline
+from .enhance import DEFAULT_ADJUSTMENTS
+from .enhance import apply_lut
+from .enhance import auto_levels_lut
+from .enhance import brightness_contrast_lut
+from .enhance import channel_histograms
+from .enhance import clahe
+from .enhance import equalize_lut
+from .enhance import gamma_lut
+from .enhance import luma_mean
+from .enhance import lut_histograms
 from .image import apply_exif_orientation
 from .image import img_b64_to_arr
 from .image import img_data_to_arr
 from .image import img_data_to_pil
 from .image import img_data_to_png_data
 from .image import img_pil_to_data
-
+from .image import read_exif_orientation
+from .image import read_image_size
+from .image import TRANSPOSED_ORIENTATIONS
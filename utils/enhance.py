@@ -0,0 +1,309 @@
+import numpy as np
+
+_LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114])  # 与PIL转换为L模式时的权重一致
+_IDENTITY = np.arange(256, dtype=np.float64)
+
+
+def channel_histograms(array):
+    """统计每个颜色通道的直方图（不含alpha通道）
+
+    Args:
+        array(np.ndarray): uint8像素，形状为(h, w)、(h, w, 3)或(h, w, 4)
+
+    Returns:
+        np.ndarray: 形状为(通道数, 256)的直方图
+
+    """
+    if array.ndim == 2:
+        return np.bincount(array.ravel(), minlength=256)[np.newaxis]
+    return np.stack([np.bincount(array[..., c].ravel(), minlength=256) for c in range(min(3, array.shape[2]))])
+
+
+def luma_mean(histograms, lut=None):
+    """由直方图计算图片（经过lut映射后）的平均亮度，不需要再遍历像素
+
+    Args:
+        histograms(np.ndarray): channel_histograms的结果
+        lut(np.ndarray): 形状为(256,)的映射表，为None时不映射
+
+    Returns:
+        float: 平均亮度（0~255）
+
+    """
+    values = _IDENTITY if lut is None else lut.astype(np.float64)
+    means = histograms @ values / histograms.sum(axis=1)
+    if len(means) == 1:
+        return float(means[0])
+    return float(means @ _LUMA_WEIGHTS)
+
+
+def brightness_contrast_lut(brightness, contrast, histograms):
+    """生成调节亮度与对比度的查找表，效果与先后使用PIL的ImageEnhance.Brightness、ImageEnhance.Contrast相同
+
+    Args:
+        brightness(float): 亮度系数，1为不变
+        contrast(float): 对比度系数，1为不变
+        histograms(np.ndarray): 原图的channel_histograms，用于得到调节亮度后的平均亮度
+
+    Returns:
+        np.ndarray: 形状为(256,)的uint8查找表
+
+    """
+    lut = np.clip(np.trunc(_IDENTITY * brightness), 0, 255)
+    mean = int(luma_mean(histograms, lut) + 0.5)
+    lut = np.clip(np.trunc(mean + contrast * (lut - mean)), 0, 255)
+    return lut.astype(np.uint8)
+
+
+def _pair_lut(lut):
+    """把256项的查找表扩展为65536项，一次查表同时映射相邻的两个字节（两个字节用同一张表，与字节序无关）"""
+    index = np.arange(65536, dtype=np.uint32)
+    return lut[index & 0xFF].astype(np.uint16) | (lut[index >> 8].astype(np.uint16) << 8)
+
+
+def apply_lut(array, lut, out=None):
+    """用查找表映射像素，alpha通道保持不变
+
+    Args:
+        array(np.ndarray): uint8像素，形状为(h, w)、(h, w, 3)或(h, w, 4)
+        lut(np.ndarray): 形状为(256,)的uint8查找表，或每个颜色通道一个的(通道数, 256)查找表
+        out(np.ndarray): 与array形状相同的C连续数组，给出时复用它的内存
+
+    Returns:
+        np.ndarray: 映射后的像素
+
+    """
+    if out is None:
+        out = np.empty_like(array, order="C")
+    luts = lut.reshape(-1, 256)
+    channels = 1 if array.ndim == 2 else array.shape[2]
+    if len(luts) == 1 and channels != 4 and array.flags["C_CONTIGUOUS"] and array.size % 2 == 0:
+        # 所有字节用同一张表时，每次查表处理两个字节
+        np.take(_pair_lut(luts[0]), array.reshape(-1).view(np.uint16), out=out.reshape(-1).view(np.uint16))
+        return out
+    src = array.reshape(array.shape[0], array.shape[1], channels)
+    dst = out.reshape(array.shape[0], array.shape[1], channels)
+    for c in range(channels):
+        if c < 3:
+            np.take(luts[min(c, len(luts) - 1)], src[..., c], out=dst[..., c])
+        else:
+            dst[..., c] = src[..., c]
+    return out
+
+
+def lut_histograms(histograms, lut):
+    """由映射前的直方图直接得到经过查找表映射后的直方图，不需要再遍历像素
+
+    Args:
+        histograms(np.ndarray): 映射前的直方图，形状为(通道数, 256)
+        lut(np.ndarray): 形状为(256,)或(通道数, 256)的查找表
+
+    Returns:
+        np.ndarray: 映射后的直方图
+
+    """
+    luts = lut.reshape(-1, 256)
+    return np.stack([np.bincount(luts[min(c, len(luts) - 1)], weights=histograms[c], minlength=256)
+                     for c in range(len(histograms))]).astype(np.int64)
+
+
+def gamma_lut(gamma):
+    """伽马校正的查找表，gamma大于1时暗部变亮
+
+    Args:
+        gamma(float): 伽马值
+
+    Returns:
+        np.ndarray: 形状为(256,)的uint8查找表
+
+    """
+    return np.round(255 * (_IDENTITY / 255) ** (1 / gamma)).astype(np.uint8)
+
+
+def auto_levels_lut(histograms, clip=0.005):
+    """自动色阶的查找表：每个通道两端各舍去clip比例的像素后拉伸到0~255
+
+    Args:
+        histograms(np.ndarray): 形状为(通道数, 256)的直方图
+        clip(float): 每端舍去的像素比例
+
+    Returns:
+        np.ndarray: 形状为(通道数, 256)的uint8查找表
+
+    """
+    cdf = np.cumsum(histograms, axis=1)
+    total = cdf[:, -1:]
+    low = np.argmax(cdf > clip * total, axis=1)[:, np.newaxis]
+    high = 255 - np.argmax(cdf[:, ::-1] <= (1 - clip) * total, axis=1)[:, np.newaxis]
+    high = np.maximum(high, low + 1)
+    return np.clip(np.round((_IDENTITY - low) * 255 / (high - low)), 0, 255).astype(np.uint8)
+
+
+def equalize_lut(histograms):
+    """直方图均衡化的查找表，每个通道分别均衡，与PIL的ImageOps.equalize相同
+
+    Args:
+        histograms(np.ndarray): 形状为(通道数, 256)的直方图
+
+    Returns:
+        np.ndarray: 形状为(通道数, 256)的uint8查找表
+
+    """
+    luts = []
+    for histogram in histograms:
+        nonzero = np.flatnonzero(histogram)
+        step = (histogram.sum() - histogram[nonzero[-1]]) // 255 if len(nonzero) else 0
+        if not step:
+            luts.append(np.arange(256, dtype=np.uint8))
+            continue
+        start = np.concatenate([[0], np.cumsum(histogram)[:-1]])
+        luts.append(np.minimum((start + step // 2) // step, 255).astype(np.uint8))
+    return np.stack(luts)
+
+
+def clahe(array, clip_limit=2.0, grid=8, out=None):
+    """限制对比度的自适应直方图均衡化（CLAHE），每个颜色通道分别处理，alpha通道不变
+
+    把图片分成grid×grid块，每块的直方图按clip_limit截断后均衡得到一张查找表，
+    每个像素取相邻四块查找表结果的双线性插值
+
+    Args:
+        array(np.ndarray): uint8像素，形状为(h, w)、(h, w, 3)或(h, w, 4)
+        clip_limit(float): 截断阈值（相对于块内像素平均分布在256个灰度上的倍数）
+        grid(int): 每个方向上的分块数
+        out(np.ndarray): 与array形状相同的输出数组
+
+    Returns:
+        np.ndarray: 处理后的像素
+
+    """
+    if out is None:
+        out = np.empty_like(array, order="C")
+    height, width = array.shape[:2]
+    channels = 1 if array.ndim == 2 else array.shape[2]
+    src = array.reshape(height, width, channels)
+    dst = out.reshape(height, width, channels)
+    grid_y, grid_x = min(grid, height), min(grid, width)
+    tile_h, tile_w = -(-height // grid_y), -(-width // grid_x)
+    # 每个像素所在块的编号
+    tile_index = (np.minimum(np.arange(height) // tile_h, grid_y - 1)[:, np.newaxis] * grid_x +
+                  np.minimum(np.arange(width) // tile_w, grid_x - 1)[np.newaxis, :])
+    # 每个像素两侧块中心的编号与权重
+    y0, y1, wy = _interpolation_axis(height, tile_h, grid_y)
+    x0, x1, wx = _interpolation_axis(width, tile_w, grid_x)
+    for c in range(channels):
+        if c >= 3:
+            dst[..., c] = src[..., c]
+            continue
+        values = src[..., c]
+        histograms = np.bincount((tile_index * 256 + values).ravel(),
+                                 minlength=grid_y * grid_x * 256).reshape(-1, 256).astype(np.float64)
+        # 截断直方图，超出的部分平均分给所有灰度
+        limit = np.maximum(clip_limit * histograms.sum(axis=1, keepdims=True) / 256, 1)
+        excess = np.maximum(histograms - limit, 0).sum(axis=1, keepdims=True)
+        histograms = np.minimum(histograms, limit) + excess / 256
+        cdf = np.cumsum(histograms, axis=1)
+        luts = (cdf * 255 / cdf[:, -1:]).reshape(grid_y, grid_x, 256).astype(np.float32)
+        top = luts[y0[:, np.newaxis], x0, values] * (1 - wx) + luts[y0[:, np.newaxis], x1, values] * wx
+        bottom = luts[y1[:, np.newaxis], x0, values] * (1 - wx) + luts[y1[:, np.newaxis], x1, values] * wx
+        dst[..., c] = np.clip(np.round(top * (1 - wy[:, np.newaxis]) + bottom * wy[:, np.newaxis]), 0, 255)
+    return out
+
+
+def _interpolation_axis(size, tile, count):
+    """沿一个方向求每个像素两侧块中心的块号与第二块的权重"""
+    position = (np.arange(size) + 0.5) / tile - 0.5
+    first = np.clip(np.floor(position), 0, count - 1).astype(np.intp)
+    second = np.minimum(first + 1, count - 1)
+    weight = np.clip(position - first, 0, 1).astype(np.float32)
+    return first, second, weight
+
+
+DEFAULT_ADJUSTMENTS = {
+    "levels": False,
+    "equalize": False,
+    "clahe": 0.0,
+    "gamma": 1.0,
+    "brightness_contrast": (1.0, 1.0),
+}
+
+
+class _StageOutput(object):
+    """一个调整步骤的输出及其直方图（直方图需要时才统计，也可以是返回直方图的函数）"""
+    def __init__(self, key, array, histograms=None):
+        self.key = key
+        self.array = array
+        self._histograms = histograms
+
+    def histograms(self):
+        if self._histograms is None:
+            self._histograms = channel_histograms(self.array)
+        elif callable(self._histograms):
+            self._histograms = self._histograms()
+        return self._histograms
+
+
+class AdjustmentPipeline(object):
+    """
+    由多个调整步骤组成的流水线，依次为自动色阶、直方图均衡化、CLAHE、伽马校正、亮度与对比度
+
+    每个步骤的输出按参数缓存，修改某个步骤的参数时只重新计算它及其后面的步骤；
+    参数为默认值的步骤直接沿用上一步的输出，查找表类步骤的输出直方图由输入直方图推出
+
+    Attributes:
+        source(np.ndarray): 原始像素
+        stages(tuple): 步骤名称，按执行顺序排列
+
+    """
+    stages = ("levels", "equalize", "clahe", "gamma", "brightness_contrast")
+
+    def __init__(self, source, histograms=None):
+        """
+        Args:
+            source(np.ndarray): 原始像素
+            histograms(np.ndarray|callable): 原始像素的直方图或者返回它的函数（复用已统计的直方图），
+                为None时需要时再统计
+
+        """
+        self.source = source
+        self._source_output = _StageOutput(None, source, histograms)
+        self._outputs = []  # 与stages一一对应的已计算输出
+
+    def run(self, adjustments):
+        """
+        按给定参数执行流水线
+
+        Args:
+            adjustments(dict): 各步骤的参数，缺少的步骤取DEFAULT_ADJUSTMENTS中的默认值
+
+        Returns:
+            np.ndarray: 最后一步的输出，所有步骤都为默认值时就是source本身
+
+        """
+        current = self._source_output
+        for i, name in enumerate(self.stages):
+            key = adjustments.get(name, DEFAULT_ADJUSTMENTS[name])
+            if i < len(self._outputs) and self._outputs[i].key == key:
+                current = self._outputs[i]
+                continue
+            del self._outputs[i:]  # 参数变了，后面步骤的缓存全部失效
+            current = self._apply(name, key, current)
+            self._outputs.append(current)
+        return current.array
+
+    def _apply(self, name, key, previous):
+        if key == DEFAULT_ADJUSTMENTS[name]:
+            return _StageOutput(key, previous.array, previous._histograms)
+        if name == "clahe":
+            return _StageOutput(key, clahe(previous.array, key))
+        if name == "levels":
+            lut = auto_levels_lut(previous.histograms())
+        elif name == "equalize":
+            lut = equalize_lut(previous.histograms())
+        elif name == "gamma":
+            lut = gamma_lut(key)
+        else:
+            lut = brightness_contrast_lut(key[0], key[1], previous.histograms())
+        # 输入的直方图已知时，输出的直方图由查找表直接推出
+        histograms = lut_histograms(previous.histograms(), lut) if previous._histograms is not None else None
+        return _StageOutput(key, apply_lut(previous.array, lut), histograms)
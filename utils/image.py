@@ -1,11 +1,14 @@
 import base64
 import io
+import struct
 
 import numpy as np
-import PIL.ExifTags
 import PIL.Image
 import PIL.ImageOps
 
+EXIF_ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)  # 摆正后宽高互换的exif方向
+
 
 def img_pil_to_data(img_pil):
     """把pil图片编码
@@ -62,22 +65,74 @@ def img_data_to_png_data(img_data):
             return f.read()
 
 
-def apply_exif_orientation(image):
-    try:
-        exif = image._getexif()
-    except AttributeError:
-        exif = None
+def _read_jpeg_orientation(f):
+    """在JPEG的APP1段中查找Orientation标签，不读取图像数据
 
-    if exif is None:
-        return image
+    Returns:
+        int: exif方向，不是JPEG时返回None，没有该标签时返回1
+
+    """
+    if f.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF or marker[1] in (0xD9, 0xDA):
+            return 1  # 到达图像数据仍没有exif
+        length = struct.unpack(">H", f.read(2))[0]
+        if marker[1] != 0xE1:
+            f.seek(length - 2, io.SEEK_CUR)
+            continue
+        payload = f.read(length - 2)
+        if payload[:6] != b"Exif\x00\x00":
+            continue
+        tiff = payload[6:]
+        endian = "<" if tiff[:2] == b"II" else ">"
+        ifd = struct.unpack(endian + "I", tiff[4:8])[0]
+        count = struct.unpack(endian + "H", tiff[ifd:ifd + 2])[0]
+        for i in range(count):
+            entry = ifd + 2 + i * 12
+            tag = struct.unpack(endian + "H", tiff[entry:entry + 2])[0]
+            if tag == EXIF_ORIENTATION_TAG:
+                return struct.unpack(endian + "H", tiff[entry + 8:entry + 10])[0]
+        return 1
+
+
+def read_exif_orientation(fp):
+    """只读取文件头中exif的Orientation标签，不解码像素，也不解析其余的exif标签
+
+    Args:
+        fp(str|file): 图片路径或者已打开的二进制文件对象
 
-    exif = {
-        PIL.ExifTags.TAGS[k]: v
-        for k, v in exif.items()
-        if k in PIL.ExifTags.TAGS
-    }
+    Returns:
+        int: exif方向（1~8），没有或读取失败时返回1
+
+    """
+    f = open(fp, "rb") if isinstance(fp, str) else fp
+    try:
+        start = f.tell()
+        try:
+            orientation = _read_jpeg_orientation(f)
+        except (struct.error, IndexError, OSError):
+            orientation = 1
+        if orientation is None:
+            # 其他格式交给PIL读取文件头
+            f.seek(start)
+            with PIL.Image.open(f) as image:
+                orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        f.seek(start)
+    except (IOError, SyntaxError, ValueError):
+        orientation = 1
+    finally:
+        if f is not fp:
+            f.close()
+    return orientation if orientation in range(1, 9) else 1
 
-    orientation = exif.get("Orientation", None)
+
+def apply_exif_orientation(image):
+    try:
+        orientation = image.getexif().get(EXIF_ORIENTATION_TAG, None)
+    except AttributeError:
+        orientation = None
 
     if orientation == 1:
         # do nothing
@@ -105,3 +160,25 @@ def apply_exif_orientation(image):
         return image.transpose(PIL.Image.ROTATE_90)
     else:
         return image
+
+
+def read_image_size(filename):
+    """只读取文件头得到图片（按exif摆正后）的尺寸，不解码像素
+
+    Args:
+        filename(str): 图片的绝对路径
+
+    Returns:
+        tuple: (宽, 高)，无法识别时返回None
+
+    """
+    try:
+        with PIL.Image.open(filename) as image:
+            width, height = image.size
+            orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    except (IOError, SyntaxError, ValueError):
+        return None
+    # 与标注坐标一致，返回按exif摆正后的宽高
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
@@ -0,0 +1,35 @@
+import hashlib
+import os
+import os.path as osp
+
+CACHE_ROOT = osp.join(osp.expanduser("~"), ".cache", "labelall")
+
+
+def cache_dir(*parts):
+    """返回（并创建）程序在用户目录下的缓存文件夹
+
+    Args:
+        *parts(str): 缓存根目录下的子目录
+
+    Returns:
+        str: 缓存文件夹的绝对路径
+
+    """
+    path = osp.join(CACHE_ROOT, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_key(filename):
+    """由路径、修改时间和文件大小得到一个文件的缓存键，文件被改动后键随之改变
+
+    Args:
+        filename(str): 文件路径
+
+    Returns:
+        str: 40位十六进制字符串
+
+    """
+    stat = os.stat(filename)
+    text = "{}|{}|{}".format(osp.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
@@ -0,0 +1,55 @@
+import os
+import os.path as osp
+
+import PIL.Image
+
+from .image import apply_exif_orientation
+from .paths import cache_dir, file_key
+
+THUMBNAIL_SIZE = 256  # 缩略图长边的像素数
+
+
+def thumbnail_path(filename):
+    """缩略图在磁盘缓存中的路径，由图片的路径、修改时间和大小决定，图片改动后自动失效
+
+    Args:
+        filename(str): 图片的绝对路径
+
+    Returns:
+        str: 缩略图（JPEG）的绝对路径
+
+    """
+    key = file_key(filename)
+    return osp.join(cache_dir("thumbnails", key[:2]), key + ".jpg")
+
+
+def make_thumbnail(filename, size=THUMBNAIL_SIZE):
+    """生成一张图片的缩略图并写入磁盘缓存，已经存在时直接返回
+
+    不依赖Qt，可以在子进程中运行；JPEG借助draft只按1/2~1/8的分辨率解码
+
+    Args:
+        filename(str): 图片的绝对路径
+        size(int): 缩略图长边的像素数
+
+    Returns:
+        str: 缩略图的绝对路径
+
+    """
+    path = thumbnail_path(filename)
+    if osp.exists(path):
+        return path
+    with PIL.Image.open(filename) as image:
+        image.draft(image.mode, (size, size))
+        image = apply_exif_orientation(image)
+        image.thumbnail((size, size), PIL.Image.BILINEAR)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = PIL.Image.new("RGBA", image.size, (255, 255, 255, 255))
+            image = PIL.Image.alpha_composite(background, image)
+        image = image.convert("RGB")
+        # 先写临时文件再改名，其他进程不会读到写了一半的缩略图
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        image.save(temp_path, "JPEG", quality=85)
+    os.replace(temp_path, path)
+    return path
@@ -5,3 +5,4 @@ from .label_dock_widget import LabelDockWidget
 from .contrast_brightness_dialog import SliderWindow
 from .file_slider import FileSlider
 
+from .file_list_model import FileListModel
@@ -4,19 +4,26 @@ from PyQt5.Qt import *
 
 class SliderWindow(QWidget):
     """
-    该类用于创建调节亮度和对比度的窗口
+    该类用于创建调节亮度、对比度等图像调整参数的窗口
 
     Attributes:
         label_brightness(QLabel): 标明“亮度”的标签
         label_contrast(QLabel): 标明“对比度”的标签
         slider_brightness(QSlider): 调节亮度水平滑动条
         slider_contrast(QSlider): 调节对比度水平滑动条
+        slider_gamma(QSlider): 调节伽马值的水平滑动条（数值/10为伽马值）
+        slider_clahe(QSlider): 调节CLAHE截断阈值的水平滑动条（数值/10为阈值，0为不使用）
+        check_levels(QCheckBox): 是否自动色阶
+        check_equalize(QCheckBox): 是否直方图均衡化
+        update_timer(QTimer): 拖动时限制刷新频率的定时器，拖动过程中每隔一段时间刷新一次
 
     """
+    update_interval = 30  # 拖动滑动条时两次刷新之间的最短间隔（毫秒）
+
     def __init__(self, parent=None):
         super(SliderWindow, self).__init__(parent)
-        self.setWindowTitle("亮度与对比度调整")
-        self.resize(600, 50)
+        self.setWindowTitle("图像调整")
+        self.resize(600, 150)
         self.setWindowFlags(QtCore.Qt.WindowStaysOnTopHint)
         self.label_brightness = QLabel("亮度")
         self.label_brightness.setAlignment(Qt.AlignLeft)
@@ -30,6 +37,23 @@ class SliderWindow(QWidget):
         hbox.addRow(self.label_brightness, self.slider_brightness)
         hbox2 = QHBoxLayout()
         hbox.addRow(self.label_contrast, self.slider_contrast)
+        self.slider_gamma = QSlider(Qt.Horizontal)
+        self.slider_gamma.setRange(2, 30)
+        self.slider_gamma.setValue(10)
+        self.slider_gamma.setTickPosition(QSlider.TicksBelow)
+        self.slider_gamma.setTickInterval(2)
+        hbox.addRow(QLabel("伽马"), self.slider_gamma)
+        self.slider_clahe = QSlider(Qt.Horizontal)
+        self.slider_clahe.setRange(0, 40)
+        self.slider_clahe.setValue(0)
+        self.slider_clahe.setTickPosition(QSlider.TicksBelow)
+        self.slider_clahe.setTickInterval(5)
+        hbox.addRow(QLabel("CLAHE"), self.slider_clahe)
+        self.check_levels = QCheckBox("自动色阶")
+        self.check_equalize = QCheckBox("直方图均衡化")
+        hbox2.addWidget(self.check_levels)
+        hbox2.addWidget(self.check_equalize)
+        hbox2.addStretch()
         vbox = QVBoxLayout()
         vbox.addLayout(hbox)
         vbox.addLayout(hbox2)
@@ -54,28 +78,66 @@ class SliderWindow(QWidget):
         self.slider_brightness.setTickInterval(1)
         self.slider_contrast.setTickInterval(1)
 
+        # 拖动过程中值一改变就刷新，但两次刷新之间至少间隔update_interval
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(self.update_interval)
+        self.update_timer.timeout.connect(self.sendEditBrightness)
+
         # 连接信号槽
-        self.slider_brightness.sliderReleased.connect(self.brightnessChanged)
-        self.slider_contrast.sliderReleased.connect(self.contrastChanged)
+        self.slider_brightness.valueChanged.connect(self.brightnessChanged)
+        self.slider_contrast.valueChanged.connect(self.contrastChanged)
+        self.slider_gamma.valueChanged.connect(self.contrastChanged)
+        self.slider_clahe.valueChanged.connect(self.contrastChanged)
+        self.check_levels.toggled.connect(self.contrastChanged)
+        self.check_equalize.toggled.connect(self.contrastChanged)
 
     def brightnessChanged(self):
         """
-        亮度滑动条被拖动释放后传递新的亮度值
+        亮度滑动条的值改变后（节流）传递新的亮度值
 
         """
-        print("current slider value=%s" % self.slider_brightness.value())
-        self.sendEditBrightness()
+        if not self.update_timer.isActive():
+            self.update_timer.start()
 
     def contrastChanged(self):
         """
-        对比度滑动条被拖动释放后传递新的对比度值
+        对比度滑动条的值改变后（节流）传递新的对比度值
 
         """
-        print("current slider value2=%s" % self.slider_contrast.value())
-        self.sendEditContrast()
+        if not self.update_timer.isActive():
+            self.update_timer.start()
 
     bright_contrast_signal = QtCore.pyqtSignal()
 
+    def adjustments(self):
+        """
+        当前各调整步骤的参数
+
+        Returns:
+            dict: 与utils.DEFAULT_ADJUSTMENTS的键相同
+
+        """
+        return {
+            "levels": self.check_levels.isChecked(),
+            "equalize": self.check_equalize.isChecked(),
+            "clahe": self.slider_clahe.value() / 10,
+            "gamma": self.slider_gamma.value() / 10,
+            "brightness_contrast": (self.slider_brightness.value() / 10, self.slider_contrast.value() / 10),
+        }
+
+    def reset(self):
+        """
+        打开新图片时恢复所有参数的默认值
+
+        """
+        self.slider_brightness.setValue(10)
+        self.slider_contrast.setValue(10)
+        self.slider_gamma.setValue(10)
+        self.slider_clahe.setValue(0)
+        self.check_levels.setChecked(False)
+        self.check_equalize.setChecked(False)
+
     def sendEditBrightness(self):
         """
         发射调整亮度的信号
@@ -1,5 +1,8 @@
 from PyQt5 import QtCore, QtGui, QtWidgets
 import json
+import os.path as osp
+
+from formats import binary
 
 
 class ScrollAreaPreview(QtWidgets.QScrollArea):
@@ -32,9 +35,21 @@ class ScrollAreaPreview(QtWidgets.QScrollArea):
 
 
 class FileDialogPreview(QtWidgets.QFileDialog):
-    def __init__(self, *args, **kwargs):
+    """
+    带预览的文件对话框，图片的预览来自缩略图服务，不解码整张图片
+
+    Attributes:
+        thumbnails(ThumbnailService): 缩略图服务，为None时不预览图片
+        preview_path(str): 当前预览的文件
+
+    """
+    def __init__(self, *args, thumbnails=None, **kwargs):
         super(FileDialogPreview, self).__init__(*args, **kwargs)
         self.setOption(self.DontUseNativeDialog, True)
+        self.thumbnails = thumbnails
+        self.preview_path = None
+        if self.thumbnails is not None:
+            self.thumbnails.thumbnailReady.connect(self.thumbnailReady)
 
         self.labelPreview = ScrollAreaPreview(self)
         self.labelPreview.setFixedSize(300, 300)
@@ -49,29 +64,67 @@ class FileDialogPreview(QtWidgets.QFileDialog):
         self.currentChanged.connect(self.onChange)
 
     def onChange(self, path):
-        if path.lower().endswith(".json"):
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                self.labelPreview.setText(
-                    json.dumps(data, indent=4, sort_keys=False)
-                )
+        self.preview_path = path
+        if path.lower().endswith(".json") or path.lower().endswith(binary.SUFFIX):
+            if path.lower().endswith(binary.SUFFIX):
+                data = binary.load(path)
+            else:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            self.labelPreview.setText(
+                json.dumps(data, indent=4, sort_keys=False)
+            )
             self.labelPreview.label.setAlignment(
                 QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop
             )
             self.labelPreview.setHidden(False)
         else:
-            pixmap = QtGui.QPixmap(path)
-            if pixmap.isNull():
-                self.labelPreview.clear()
-                self.labelPreview.setHidden(True)
-            else:
-                self.labelPreview.setPixmap(
-                    pixmap.scaled(
-                        self.labelPreview.width() - 30,
-                        self.labelPreview.height() - 30,
-                        QtCore.Qt.KeepAspectRatio,
-                        QtCore.Qt.SmoothTransformation,
-                    )
+            # 缩略图尚未生成时先隐藏，生成后由thumbnailReady显示
+            pixmap = None
+            if self.thumbnails is not None and osp.isfile(path):
+                pixmap = self.thumbnails.pixmap(path)
+            self.showPreviewPixmap(pixmap)
+
+    def showPreviewPixmap(self, pixmap):
+        """
+        显示图片的预览
+
+        Args:
+            pixmap(QPixmap): 缩略图，为None时清空并隐藏预览
+
+        """
+        if pixmap is None or pixmap.isNull():
+            self.labelPreview.clear()
+            self.labelPreview.setHidden(True)
+        else:
+            self.labelPreview.setPixmap(
+                pixmap.scaled(
+                    self.labelPreview.width() - 30,
+                    self.labelPreview.height() - 30,
+                    QtCore.Qt.KeepAspectRatio,
+                    QtCore.Qt.SmoothTransformation,
                 )
-                self.labelPreview.label.setAlignment(QtCore.Qt.AlignCenter)
-                self.labelPreview.setHidden(False)
+            )
+            self.labelPreview.label.setAlignment(QtCore.Qt.AlignCenter)
+            self.labelPreview.setHidden(False)
+
+    def done(self, result):
+        """
+        关闭时断开缩略图服务的信号（对话框由调用者在取出结果后deleteLater）
+
+        """
+        if self.thumbnails is not None:
+            self.thumbnails.thumbnailReady.disconnect(self.thumbnailReady)
+            self.thumbnails = None
+        super(FileDialogPreview, self).done(result)
+
+    def thumbnailReady(self, filename):
+        """
+        缩略图生成后，如果仍是当前选中的文件则显示
+
+        Args:
+            filename(str): 图片路径
+
+        """
+        if filename == self.preview_path:
+            self.showPreviewPixmap(self.thumbnails.cached(filename))
@@ -2,32 +2,66 @@ from PyQt5 import QtGui, QtWidgets, QtCore, Qt
 from PyQt5.Qt import *
 import os
 
+from .file_list_model import FileListModel
+
+THUMBNAIL_ROW_HEIGHT = 64  # 显示缩略图时的行高
+SEARCH_DELAY = 150  # 搜索框停止输入多久之后执行查询（毫秒）
+
 
 class FileDockWidget(QDockWidget):
     """
     可移动的窗口类，用于创建文件夹图片列表窗口
 
     Attributes:
-        header_field(list): 用于设置行表头字段和设置列数
-        table(QTableWidget): 用于创建文件列表
-        filepath_list(list): 用于储存文件夹内所有文件路径
+        table(QTableView): 文件列表的视图，只为可见的单元格向model取数据
+        model(FileListModel): 文件列表的数据（路径、标注状态、形状数、尺寸）
+        filepath_list(list): 文件夹内所有文件路径（即model.paths）
         click_num(int): 表示被点击的图片序号
+        change_num(int): 表示即将切换到的图片序号
         savewindow(QWidget): SaveWindow 类的实例化对象，切换图片时的确认保存窗口
+        thumbnails(ThumbnailService): 缩略图服务，只为可见的行请求缩略图
+        search_edit(QLineEdit): 按标签搜索的输入框，只显示包含这些标签的图片
+        search_label(QLabel): 显示搜索结果的数量
+        project_indexer(ProjectIndexer): 文件夹的标注索引，搜索时查询
+        folder_scanner(FolderScanner): 遍历打开的文件夹，提供文件列表及其标注概况
 
     """
 
     def __init__(self, *__args):
         super().__init__(*__args)
-        self.header_field = ['filepath']
-        self.table = QTableWidget()
+        self.model = FileListModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("按标签搜索，如 dog cat type:polygon")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_label = QLabel()
+        self.search_label.hide()
+        self.project_indexer = None
+        self.folder_scanner = None
         self.table.setContextMenuPolicy(Qt.CustomContextMenu)  ######允许右键产生子菜单
-        self.table.itemClicked.connect(self.doubleclick)
+        self.table.clicked.connect(self.doubleclick)
 
         self.table.customContextMenuRequested.connect(self.generateMenu)
         self.initUI()
-        self.filepath_list = []
         self.savewindow = SaveWindow()
         self.click_num = None
+        self.change_num = None
+        self.change_file = None
+        self.thumbnails = None
+        self.thumbnail_rows = {}  # 等待缩略图的图片路径 -> 图片序号
+        # 滚动、添加行时合并为一次可见行的缩略图请求
+        self.thumbnail_timer = QTimer(self)
+        self.thumbnail_timer.setSingleShot(True)
+        self.thumbnail_timer.setInterval(50)
+        self.thumbnail_timer.timeout.connect(self.requestVisibleThumbnails)
+        self.table.verticalScrollBar().valueChanged.connect(self.thumbnail_timer.start)
+        # 输入时合并为一次查询
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.applySearch)
+        self.search_edit.textChanged.connect(self.search_timer.start)
 
     def initUI(self):
         """
@@ -37,6 +71,10 @@ class FileDockWidget(QDockWidget):
         self.setTableWidget()  # 设置表格
         self.show()
 
+    @property
+    def filepath_list(self):
+        return self.model.paths
+
     # 设置表格
     def setTableWidget(self):
         """
@@ -47,7 +85,13 @@ class FileDockWidget(QDockWidget):
         # self.table.setFixedWidth(200)  # 表格宽度
         self.setInitTableHead()  # 设置表格行表头字段
         self.table.setAlternatingRowColors(True)  # 交替行颜色
-        self.setWidget(self.table)
+        container = QWidget()
+        layout = QVBoxLayout(container)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.search_edit)
+        layout.addWidget(self.search_label)
+        layout.addWidget(self.table)
+        self.setWidget(container)
 
         # print(f"行数为:{self.table.rowCount()}")
         # print(f"列数为:{self.table.columnCount()}")
@@ -59,10 +103,18 @@ class FileDockWidget(QDockWidget):
         设置行表头字段
 
         """
-        self.table.setColumnCount(len(self.header_field))  # 设置列数
-        self.table.setHorizontalHeaderLabels(self.header_field)  # 设置行表头字段
-        self.table.setRowHeight(0, 30)  # 行高
-        self.table.setColumnWidth(0, 230)
+        # 固定行高，视图不需要逐行计算高度
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(THUMBNAIL_ROW_HEIGHT)  # 行高
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setWordWrap(False)
+        self.table.setIconSize(QSize(THUMBNAIL_ROW_HEIGHT, THUMBNAIL_ROW_HEIGHT))
+        self.table.setColumnWidth(FileListModel.THUMBNAIL_COLUMN, THUMBNAIL_ROW_HEIGHT + 8)
+        self.table.setColumnWidth(FileListModel.NAME_COLUMN, 230)
+        self.table.setColumnWidth(FileListModel.STATUS_COLUMN, 60)
+        self.table.setColumnWidth(FileListModel.SHAPES_COLUMN, 50)
+        self.table.setColumnWidth(FileListModel.SIZE_COLUMN, 90)
 
     def addRow(self, filepath):
         """
@@ -72,22 +124,179 @@ class FileDockWidget(QDockWidget):
             filepath: 需要添加行对应的文件路径
 
         """
-        self.table.insertRow(self.table.rowCount())
-        self.filepath_list.append(filepath)
-        filename = os.path.basename(filepath)
-        newItem = QTableWidgetItem(filename)
-        self.table.setItem(self.table.rowCount() - 1, 0, newItem)
+        self.addRows([filepath])
+
+    def addRows(self, filepaths):
+        """
+        向文件列表中一次添加多行
+
+        Args:
+            filepaths(list): 需要添加行对应的文件路径
+
+        """
+        self.model.addPaths(filepaths)
+        self.thumbnail_timer.start()
+
+    def setFiles(self, filepaths, columns=None):
+        """
+        用新的文件列表替换全部行，当前打开的图片仍在列表中时保持选中
+
+        Args:
+            filepaths(list): 文件路径
+            columns(tuple): 标注信息，见FileListModel.setFiles
+
+        """
+        self.model.setFiles(filepaths, columns)
+        self.thumbnail_rows = {}
+        if self.change_file is not None:
+            num = self.model.indexOf(self.change_file)
+            self.change_num = num if num >= 0 else None
+            self.selectFile(self.change_num)
+        self.thumbnail_timer.start()
+
+    def applyChanges(self, removed, inserted, updated=()):
+        """
+        文件夹在打开期间变化后增量地更新文件列表，当前打开的图片仍在列表中时保持选中
+
+        Args:
+            removed(list): 已经删除的图片路径
+            inserted(list): 新的图片，见FileListModel.applyChanges
+            updated(list): 图片或标注文件被修改过的图片路径，标注概况随后由infoReady更新
+
+        """
+        self.model.applyChanges(removed, inserted)
+        self.thumbnail_rows = {}
+        for path in updated:
+            self.model.thumbnails.pop(path, None)
+        if self.change_file is not None:
+            num = self.model.indexOf(self.change_file)
+            self.change_num = num if num >= 0 else None
+        if self.click_num is not None and self.change_num is not None:
+            self.click_num = self.change_num
+        self.thumbnail_timer.start()
 
     def deleteAllRow(self):
         """
-        从table widget中删除所有行
+        从文件列表中删除所有行
+
+        """
+        self.model.clear()
+        self.thumbnail_rows = {}
+
+    def setThumbnailService(self, thumbnails):
+        """
+        设置缩略图服务，之后可见的行会显示缩略图
+
+        Args:
+            thumbnails(ThumbnailService): 缩略图服务
+
+        """
+        self.thumbnails = thumbnails
+        self.thumbnails.thumbnailReady.connect(self.thumbnailReady)
+        self.thumbnail_timer.start()
+
+    def setFolderScanner(self, folder_scanner):
+        """
+        设置文件夹的遍历器，之后它找到的图片与读到的标注概况显示在文件列表中
+
+        Args:
+            folder_scanner(FolderScanner): 遍历器
+
+        """
+        self.folder_scanner = folder_scanner
+        self.folder_scanner.batchReady.connect(self.addRows)
+        self.folder_scanner.filesReplaced.connect(self.setFiles)
+        self.folder_scanner.filesChanged.connect(self.applyChanges)
+        self.folder_scanner.infoReady.connect(self.model.updateInfo)
+
+    def setProjectIndexer(self, project_indexer):
+        """
+        设置文件夹的标注索引，索引更新后重新执行当前的搜索
+
+        Args:
+            project_indexer(ProjectIndexer): 标注索引
+
+        """
+        self.project_indexer = project_indexer
+        self.project_indexer.indexUpdated.connect(self.updateInfo)
+        self.project_indexer.indexUpdated.connect(self.applySearch)
+
+    def updateInfo(self):
+        """
+        从索引中读取每张图片的标注状态、形状数与尺寸
+
+        """
+        if self.project_indexer is not None:
+            self.model.updateInfo(self.project_indexer.summaries())
+
+    def applySearch(self):
+        """
+        按搜索框中的文字查询索引，隐藏不包含这些标签的图片；搜索框为空时显示所有图片
+
+        """
+        text = self.search_edit.text().strip()
+        paths = None
+        if text and self.project_indexer is not None:
+            paths, shape_count = self.project_indexer.search(text)
+        if paths is None:
+            self.search_label.hide()
+        else:
+            self.search_label.setText("%d张图片，%d个图形" % (len(paths), shape_count))
+            self.search_label.show()
+            paths = {os.path.normcase(path) for path in paths}
+        if paths is not None or self.model.rows is not None:
+            self.model.setFilter(paths)
+        self.thumbnail_timer.start()
+
+    def requestVisibleThumbnails(self):
+        """
+        只为当前可见的行取缩略图，已缓存的直接显示，其余的在后台生成
+
+        """
+        if self.thumbnails is None or not self.filepath_list:
+            return
+        row_count = self.model.rowCount()
+        first = max(0, self.table.rowAt(0))
+        last = self.table.rowAt(self.table.viewport().height() - 1)
+        if last < 0:
+            last = row_count - 1
+        for view_row in range(first, min(last, row_count - 1) + 1):
+            row = self.model.sourceRow(view_row)
+            filepath = self.filepath_list[row]
+            if self.model.hasThumbnail(filepath):
+                continue
+            pixmap = self.thumbnails.pixmap(filepath)
+            if pixmap is not None:
+                self.setThumbnail(row, pixmap)
+            else:
+                self.thumbnail_rows[filepath] = row
+
+    def thumbnailReady(self, filepath):
+        """
+        缩略图生成后显示在对应的行（行号失效时等下次滚动再请求）
+
+        Args:
+            filepath(str): 图片路径
+
+        """
+        row = self.thumbnail_rows.pop(filepath, None)
+        if row is None or row >= len(self.filepath_list) or self.filepath_list[row] != filepath:
+            return
+        pixmap = self.thumbnails.cached(filepath)
+        if pixmap is not None:
+            self.setThumbnail(row, pixmap)
+
+    def setThumbnail(self, row, pixmap):
+        """
+        把缩略图缩小到行高后显示在第row张图片的行
 
         """
-        row_num = len(self.filepath_list)
-        while row_num >= 0:
-            self.table.removeRow(row_num)
-            row_num -= 1
-        self.filepath_list = []
+        self.model.setThumbnail(row, pixmap.scaled(
+            THUMBNAIL_ROW_HEIGHT, THUMBNAIL_ROW_HEIGHT, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.thumbnail_timer.start()
 
     def generateMenu(self, pos):
         """
@@ -100,13 +309,12 @@ class FileDockWidget(QDockWidget):
         # rint( pos)
         row_num = -1
         for i in self.table.selectionModel().selection().indexes():
-            self.del_num = i.row()
+            self.del_num = self.model.sourceRow(i.row())
         menu = QMenu()
         item = menu.addAction(u"删除")
         action = menu.exec_(self.table.mapToGlobal(pos))
         if action == item:
-            self.table.removeRow(self.del_num)
-            del self.filepath_list[self.del_num]
+            self.model.removeSourceRow(self.del_num)
 
     signal_file = QtCore.pyqtSignal(str)
     signal_save = QtCore.pyqtSignal(str)
@@ -119,8 +327,7 @@ class FileDockWidget(QDockWidget):
         row_num = -1
         self.num_last_time = self.click_num
         for i in self.table.selectionModel().selection().indexes():
-            self.click_num = i.row()
-        print(self.click_num)
+            self.click_num = self.model.sourceRow(i.row())
         # if self.first_pic:
         self.changeimg_withoutsave()
         # self.first_pic=False
@@ -137,6 +344,7 @@ class FileDockWidget(QDockWidget):
         切换图片且不保存
 
         """
+        self.change_num = self.click_num
         self.change_file = self.filepath_list[self.click_num]
         self.signal_file.emit('1')
         self.savewindow.close()
@@ -156,7 +364,7 @@ class FileDockWidget(QDockWidget):
         直接关闭保存选项窗口则不切换图片
 
         """
-        self.table.selectRow(self.num_last_time)
+        self.selectFile(self.num_last_time)
 
     def sliderchange(self, num):
         """
@@ -166,9 +374,24 @@ class FileDockWidget(QDockWidget):
             num: 滑动条对应值(int)
 
         """
+        self.change_num = num
         self.change_file = self.filepath_list[num]
         self.signal_file.emit('1')
-        self.table.selectRow(num)
+        self.selectFile(num)
+
+    def selectFile(self, num):
+        """
+        在视图中选中第num张图片（被搜索筛选掉时不选中）
+
+        Args:
+            num(int): 图片序号
+
+        """
+        if num is None:
+            return
+        row = self.model.viewRow(num)
+        if row >= 0:
+            self.table.selectRow(row)
 
 
 class SaveWindow(QWidget):
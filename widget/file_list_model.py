@@ -0,0 +1,316 @@
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt
+import array
+import bisect
+import collections
+import os
+
+STATUS_UNKNOWN = -1  # 还没有读到标注信息
+STATUS_UNLABELED = 0
+STATUS_LABELED = 1
+STATUS_TEXT = {STATUS_UNKNOWN: "", STATUS_UNLABELED: "未标注", STATUS_LABELED: "已标注"}
+THUMBNAIL_LIMIT = 1024  # 内存中保留的（缩小到行高的）缩略图数
+
+
+class FileListModel(QtCore.QAbstractTableModel):
+    """
+    文件列表的数据模型：每张图片的信息存放在紧凑的数组中，视图只为可见的单元格取数据
+
+    搜索时不隐藏视图的行，而是用rows记下通过筛选的图片序号，行号与图片序号可以用sourceRow、viewRow互相转换
+
+    Attributes:
+        header_field(list): 列名
+        paths(list): 所有图片的路径（即FileDockWidget.filepath_list）
+        status(array): 每张图片的标注状态（STATUS_*）
+        shape_counts(array): 每张图片的形状数，未知时为-1
+        widths(array): 每张图片的宽度，未知时为0
+        heights(array): 每张图片的高度，未知时为0
+        rows(array): 通过筛选的图片序号，没有筛选时为None
+        thumbnails(OrderedDict): 图片路径 -> 缩小到行高的缩略图，最多THUMBNAIL_LIMIT张
+
+    """
+    header_field = ['thumbnail', 'filepath', 'status', 'shapes', 'size']
+    THUMBNAIL_COLUMN, NAME_COLUMN, STATUS_COLUMN, SHAPES_COLUMN, SIZE_COLUMN = range(5)
+
+    def __init__(self, parent=None):
+        super(FileListModel, self).__init__(parent)
+        self.paths = []
+        self.status = array.array('b')
+        self.shape_counts = array.array('i')
+        self.widths = array.array('i')
+        self.heights = array.array('i')
+        self.rows = None
+        self.thumbnails = collections.OrderedDict()
+        self._row_of = None  # 图片路径 -> 图片序号，第一次需要时才建立
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.paths) if self.rows is None else len(self.rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.header_field)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.header_field[section]
+        return super(FileListModel, self).headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.sourceRow(index.row())
+        column = index.column()
+        if role == Qt.DecorationRole and column == self.THUMBNAIL_COLUMN:
+            return self.thumbnails.get(self.paths[row])
+        if role == Qt.ToolTipRole and column == self.NAME_COLUMN:
+            return self.paths[row]
+        if role != Qt.DisplayRole:
+            return None
+        if column == self.NAME_COLUMN:
+            return os.path.basename(self.paths[row])
+        if column == self.STATUS_COLUMN:
+            return STATUS_TEXT[self.status[row]]
+        if column == self.SHAPES_COLUMN:
+            count = self.shape_counts[row]
+            return str(count) if count >= 0 else ""
+        if column == self.SIZE_COLUMN:
+            if self.widths[row] and self.heights[row]:
+                return "%d×%d" % (self.widths[row], self.heights[row])
+            return ""
+        return None
+
+    def sourceRow(self, view_row):
+        """
+        视图中的行号对应的图片序号（filepath_list中的下标）
+
+        """
+        return view_row if self.rows is None else self.rows[view_row]
+
+    def viewRow(self, source_row):
+        """
+        图片序号在视图中的行号，被筛选掉时返回-1
+
+        """
+        if self.rows is None:
+            return source_row
+        # rows按序号从小到大排列
+        row = bisect.bisect_left(self.rows, source_row)
+        return row if row < len(self.rows) and self.rows[row] == source_row else -1
+
+    def addPaths(self, paths):
+        """
+        在末尾添加图片，标注信息为未知
+
+        Args:
+            paths(list): 图片路径
+
+        """
+        if not paths:
+            return
+        count = len(paths)
+        if self.rows is None:
+            first = len(self.paths)
+            self.beginInsertRows(QtCore.QModelIndex(), first, first + count - 1)
+        if self._row_of is not None:
+            self._row_of.update(zip(paths, range(len(self.paths), len(self.paths) + count)))
+        self.paths.extend(paths)
+        self.status.extend(array.array('b', [STATUS_UNKNOWN]) * count)
+        self.shape_counts.extend(array.array('i', [-1]) * count)
+        self.widths.extend(array.array('i', [0]) * count)
+        self.heights.extend(array.array('i', [0]) * count)
+        if self.rows is None:
+            self.endInsertRows()
+
+    def removeSourceRow(self, source_row):
+        """
+        删除一张图片
+
+        Args:
+            source_row(int): 图片序号
+
+        """
+        self.beginResetModel()
+        for values in (self.paths, self.status, self.shape_counts, self.widths, self.heights):
+            del values[source_row]
+        if self.rows is not None:
+            self.rows = array.array('i', (row - (row > source_row) for row in self.rows if row != source_row))
+        self._row_of = None
+        self.endResetModel()
+
+    def applyChanges(self, removed, inserted):
+        """
+        增量地删除、插入图片（文件夹在打开期间变化时），按路径定位，不在列表中的删除被忽略、已在列表中的插入被跳过
+
+        没有筛选时按连续的区段发出行的删除与插入，视图保持选中与滚动位置；有筛选时重新计算筛选结果
+
+        Args:
+            removed(list): 要删除的图片路径
+            inserted(list): [(图片路径, 它前面一张图片的路径，是第一张时为None)]，按插入后的顺序排列；
+                前面的图片不在列表中时插在末尾
+
+        """
+        if not (removed or inserted):
+            return
+        columns = (self.paths, self.status, self.shape_counts, self.widths, self.heights)
+        for path in removed:
+            self.thumbnails.pop(path, None)
+        filtered = None
+        if self.rows is not None:
+            filtered = {self.paths[row] for row in self.rows}
+            self.beginResetModel()
+        rows = sorted({self.indexOf(path) for path in removed} - {-1}, reverse=True)
+        # 从后往前按连续的区段删除，前面的行号不受影响
+        position = 0
+        while position < len(rows):
+            last = first = rows[position]
+            position += 1
+            while position < len(rows) and rows[position] == first - 1:
+                first = rows[position]
+                position += 1
+            if filtered is None:
+                self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            if self._row_of is not None:
+                for path in self.paths[first:last + 1]:
+                    del self._row_of[path]
+            for values in columns:
+                del values[first:last + 1]
+            if filtered is None:
+                self.endRemoveRows()
+        if rows:
+            self._reindex(rows[-1])
+        # 插入的图片按前面一张图片分段：每段的第一张前面是已有的图片（或None），段内后一张接着前一张
+        groups = []
+        for path, before in inserted:
+            if self.indexOf(path) >= 0:
+                continue
+            if groups and groups[-1][1][-1] == before:
+                groups[-1][1].append(path)
+            else:
+                row = self.indexOf(before) if before is not None else -1
+                if before is not None and row < 0:
+                    row = len(self.paths) - 1
+                groups.append((row + 1, [path]))
+        # 从后往前插入，前面的行号不受影响；位置相同（都插在末尾）的段也从后往前插入，保持原来的顺序
+        order = sorted(range(len(groups)), key=lambda index: (groups[index][0], index), reverse=True)
+        for first, paths in (groups[index] for index in order):
+            count = len(paths)
+            if filtered is None:
+                self.beginInsertRows(QtCore.QModelIndex(), first, first + count - 1)
+            self.paths[first:first] = paths
+            self.status[first:first] = array.array('b', [STATUS_UNKNOWN]) * count
+            self.shape_counts[first:first] = array.array('i', [-1]) * count
+            self.widths[first:first] = array.array('i', [0]) * count
+            self.heights[first:first] = array.array('i', [0]) * count
+            if filtered is None:
+                self.endInsertRows()
+        if groups:
+            self._reindex(min(first for first, paths in groups))
+        if filtered is not None:
+            self.rows = array.array('i', (row for row, path in enumerate(self.paths) if path in filtered))
+            self.endResetModel()
+
+    def _reindex(self, first):
+        """图片序号从first开始变化后更新indexOf用的字典（新文件多在末尾，只需更新后面的一小部分）"""
+        if self._row_of is not None:
+            self._row_of.update(zip(self.paths[first:], range(first, len(self.paths))))
+
+    def clear(self):
+        """
+        删除所有图片
+
+        """
+        self.setFiles([])
+        self.thumbnails.clear()
+
+    def setFiles(self, paths, columns=None):
+        """
+        替换全部图片
+
+        Args:
+            paths(list): 图片路径
+            columns(tuple): 与paths对应的(状态, 形状数, 宽, 高)四个array.array（见FolderCache.columns），
+                为None时标注信息都为未知
+
+        """
+        self.beginResetModel()
+        count = len(paths)
+        self.paths = paths
+        if columns is None:
+            columns = (array.array('b', [STATUS_UNKNOWN]) * count, array.array('i', [-1]) * count,
+                       array.array('i', [0]) * count, array.array('i', [0]) * count)
+        self.status, self.shape_counts, self.widths, self.heights = columns
+        self.rows = None
+        self._row_of = None
+        self.endResetModel()
+
+    def indexOf(self, path):
+        """
+        图片的序号，不在列表中时返回-1
+
+        """
+        if self._row_of is None:
+            self._row_of = {path: row for row, path in enumerate(self.paths)}
+        return self._row_of.get(path, -1)
+
+    def setFilter(self, paths):
+        """
+        只显示paths中的图片
+
+        Args:
+            paths(set): 要显示的图片的规范化路径（os.path.normcase），为None时显示全部
+
+        """
+        self.beginResetModel()
+        if paths is None:
+            self.rows = None
+        else:
+            # 列表中的路径都是文件夹遍历得到的绝对路径，只需要统一大小写
+            normcase = os.path.normcase
+            self.rows = array.array('i', (row for row, path in enumerate(self.paths) if normcase(path) in paths))
+        self.endResetModel()
+
+    def updateInfo(self, summaries):
+        """
+        更新一些图片的标注状态、形状数与尺寸
+
+        Args:
+            summaries(dict): 图片路径 -> (是否有标注文件, 形状数, 宽, 高)，宽高未知时为None（保留原来的尺寸）
+
+        """
+        if not summaries:
+            return
+        for path, (labeled, shape_count, width, height) in summaries.items():
+            row = self.indexOf(path)
+            if row < 0:
+                continue
+            self.status[row] = STATUS_LABELED if labeled else STATUS_UNLABELED
+            self.shape_counts[row] = shape_count
+            if width and height:
+                self.widths[row] = width
+                self.heights[row] = height
+        if self.rowCount():
+            self.dataChanged.emit(self.index(0, self.STATUS_COLUMN),
+                                  self.index(self.rowCount() - 1, self.SIZE_COLUMN))
+
+    def hasThumbnail(self, path):
+        return path in self.thumbnails
+
+    def setThumbnail(self, source_row, pixmap):
+        """
+        记下一张图片缩小后的缩略图，并刷新显示它的单元格
+
+        Args:
+            source_row(int): 图片序号
+            pixmap(QPixmap): 缩小到行高的缩略图
+
+        """
+        path = self.paths[source_row]
+        self.thumbnails[path] = pixmap
+        self.thumbnails.move_to_end(path)
+        while len(self.thumbnails) > THUMBNAIL_LIMIT:
+            self.thumbnails.popitem(last=False)
+        row = self.viewRow(source_row)
+        if row >= 0:
+            index = self.index(row, self.THUMBNAIL_COLUMN)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
@@ -1,35 +1,215 @@
-from PyQt5.QtWidgets import QSlider
+from PyQt5.QtWidgets import QSlider, QFrame, QLabel, QVBoxLayout, QStyle, QStyleOptionSlider
 from PyQt5 import QtCore
+from PyQt5.QtCore import Qt
+import os
+
+from .file_list_model import STATUS_TEXT
+
+SCRUB_IDLE = 250  # 拖动（或按键、滚轮）停下多久之后加载当前图片（毫秒）
+PREVIEW_SIZE = 160  # 预览中缩略图的最大边长
+
+
+class ScrubPreview(QFrame):
+    """
+    拖动滑动条时显示在滑块上方的预览：缩略图、文件名与标注状态
+
+    Attributes:
+        image_label(QLabel): 缩略图，没有缓存时为空白
+        name_label(QLabel): 文件名
+        status_label(QLabel): 序号与标注状态
+        path(str): 正在预览的图片路径
+
+    """
+    def __init__(self, parent=None):
+        super(ScrubPreview, self).__init__(parent)
+        self.setFrameShape(QFrame.StyledPanel)
+        self.setAutoFillBackground(True)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.image_label = QLabel()
+        self.image_label.setFixedSize(PREVIEW_SIZE, PREVIEW_SIZE)
+        self.image_label.setAlignment(Qt.AlignCenter)
+        self.name_label = QLabel()
+        self.name_label.setFixedWidth(PREVIEW_SIZE)
+        self.status_label = QLabel()
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.setSpacing(2)
+        layout.addWidget(self.image_label)
+        layout.addWidget(self.name_label)
+        layout.addWidget(self.status_label)
+        self.path = None
+        self.hide()
+
+    def setFile(self, path, name, status, pixmap):
+        """
+        显示一张图片的信息
+
+        Args:
+            path(str): 图片路径
+            name(str): 文件名
+            status(str): 序号与标注状态
+            pixmap(QPixmap): 缩略图，为None时不显示图片
+
+        """
+        self.path = path
+        self.name_label.setText(self.name_label.fontMetrics().elidedText(name, Qt.ElideMiddle, PREVIEW_SIZE))
+        self.status_label.setText(status)
+        self.setPixmap(pixmap)
+
+    def setPixmap(self, pixmap):
+        if pixmap is None:
+            self.image_label.clear()
+        else:
+            self.image_label.setPixmap(pixmap.scaled(PREVIEW_SIZE, PREVIEW_SIZE, Qt.KeepAspectRatio,
+                                                     Qt.FastTransformation))
 
 
 class FileSlider(QSlider):
     """
-    该类用于创建Graphicsview下方的选择图片滑动条
+    该类用于创建Graphicsview下方的选择图片滑动条：每个刻度对应文件列表中的一张图片
+
+    拖动时只在滑块上方预览缓存的缩略图、文件名和标注状态，松开或停下SCRUB_IDLE之后才发出fileSelected加载图片，
+    快速拖过的图片不会排队解码
+
+    Attributes:
+        model(FileListModel): 文件列表的数据，滑动条的范围随图片数变化
+        thumbnails(ThumbnailService): 缩略图服务，预览只取缓存的缩略图，缺少时在后台生成
+        preview(ScrubPreview): 拖动时的预览
+        idle_timer(QTimer): 停下之后加载当前图片
+        selected(int): 最近一次发出（或由setCurrentFile设置）的图片序号
 
     """
+    fileSelected = QtCore.pyqtSignal(int)  # 图片序号（filepath_list中的下标）
+
     def __init__(self, widget):
         super(FileSlider, self).__init__(parent=widget)
-        ##设置最小值
         self.setMinimum(0)
-        # 设置最大值
-        self.setMaximum(1000)
-        # 步长
+        self.setMaximum(0)
         self.setSingleStep(1)
-        # 设置当前值
         self.setValue(0)
         # 刻度位置，刻度下方
         self.setTickPosition(self.TicksBelow)
-        # 设置刻度间距
-        self.setTickInterval(5)
-        # 设置连接信号槽函数
-        self.valueChanged.connect(self.filechange)
+        self.model = None
+        self.thumbnails = None
+        self.selected = None
+        self.preview = ScrubPreview(widget)
+        self.idle_timer = QtCore.QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(SCRUB_IDLE)
+        self.idle_timer.timeout.connect(self.selectCurrent)
+        self.valueChanged.connect(self.scrub)
+        self.sliderReleased.connect(self.release)
+
+    def setFileList(self, model, thumbnails=None):
+        """
+        设置文件列表，之后滑动条的范围与文件数一致
+
+        Args:
+            model(FileListModel): 文件列表的数据
+            thumbnails(ThumbnailService): 缩略图服务，为None时预览不显示缩略图
+
+        """
+        self.model = model
+        self.thumbnails = thumbnails
+        for signal in (model.rowsInserted, model.rowsRemoved, model.modelReset):
+            signal.connect(self.updateRange)
+        if thumbnails is not None:
+            thumbnails.thumbnailReady.connect(self.thumbnailReady)
+        self.updateRange()
+
+    def updateRange(self):
+        """
+        按文件数设置范围、翻页步长与刻度间隔（刻度最多约100个）
 
-    signal_filechange = QtCore.pyqtSignal(str)
+        """
+        count = len(self.model.paths) if self.model is not None else 0
+        self.blockSignals(True)
+        self.setMaximum(max(count - 1, 0))
+        self.blockSignals(False)
+        self.setPageStep(max(1, count // 100))
+        self.setTickInterval(max(1, count // 100))
+
+    def setCurrentFile(self, num):
+        """
+        文件从其它地方切换后移动滑块，不发出fileSelected
+
+        Args:
+            num(int): 图片序号，为None时不移动
+
+        """
+        if num is None or self.isSliderDown():
+            return
+        self.idle_timer.stop()
+        self.selected = num
+        self.blockSignals(True)
+        self.setValue(num)
+        self.blockSignals(False)
+
+    def scrub(self, value):
+        """
+        滑块移动时更新预览，停下SCRUB_IDLE之后再加载
+
+        """
+        self.showPreview(value)
+        self.idle_timer.start()
+
+    def release(self):
+        self.idle_timer.stop()
+        self.preview.hide()
+        self.selectCurrent()
+
+    def selectCurrent(self):
+        """
+        发出当前刻度的图片（与上次相同时不发出）；仍在拖动时保留预览
+
+        """
+        if not self.isSliderDown():
+            self.preview.hide()
+        value = self.value()
+        if self.model is None or value >= len(self.model.paths) or value == self.selected:
+            return
+        self.selected = value
+        self.fileSelected.emit(value)
+
+    def showPreview(self, row):
+        """
+        在滑块上方显示第row张图片的缩略图（没有缓存时在后台生成）、文件名与标注状态
+
+        """
+        if self.model is None or row >= len(self.model.paths):
+            return
+        path = self.model.paths[row]
+        pixmap = self.thumbnails.pixmap(path) if self.thumbnails is not None else None
+        status = "%d/%d" % (row + 1, len(self.model.paths))
+        text = STATUS_TEXT[self.model.status[row]]
+        if text:
+            status += "  " + text
+        if self.model.shape_counts[row] > 0:
+            status += "  %d个图形" % self.model.shape_counts[row]
+        self.preview.setFile(path, os.path.basename(path), status, pixmap)
+        self.preview.adjustSize()
+        self.movePreview()
+        self.preview.show()
+        self.preview.raise_()
+
+    def movePreview(self):
+        """
+        把预览放在滑块正上方，不超出父窗口
+
+        """
+        option = QStyleOptionSlider()
+        self.initStyleOption(option)
+        handle = self.style().subControlRect(QStyle.CC_Slider, option, QStyle.SC_SliderHandle, self)
+        parent = self.preview.parentWidget()
+        center = self.mapTo(parent, handle.center())
+        x = min(max(center.x() - self.preview.width() // 2, 0), max(parent.width() - self.preview.width(), 0))
+        y = max(self.mapTo(parent, QtCore.QPoint(0, 0)).y() - self.preview.height() - 4, 0)
+        self.preview.move(x, y)
 
-    def filechange(self):
+    def thumbnailReady(self, path):
         """
-        当滑动条的值改变时，发送切换图片信号
+        正在预览的图片的缩略图生成后显示出来
 
         """
-        self.nowratio = self.value()
-        self.signal_filechange.emit('1')
+        if self.preview.isVisible() and path == self.preview.path:
+            self.preview.setPixmap(self.thumbnails.cached(path))